@@ -8,99 +8,1404 @@ This Flask server handles the complete flow:
 4. Avatar Animation (D-ID API)
 """
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_file, send_from_directory
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
+import re
+import contextvars
 import json
+import inspect
+import functools
 import base64
 import requests
 import io
-import time
 import uuid
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import fakes
+from clients import LazyModule, UpstreamClients
+from talk_tracker import TalkTracker
+from tts_cache import TTSCache
+from video_cache import VideoCache
+from streaming_stt import GoogleStreamingBackend, StreamingRecognizer
+from pipeline import pipelined_speech
+from session_store import InMemorySessionStore, RedisSessionStore
+from upstream_limits import (UpstreamLimits, PriorityGate, Overloaded,
+                             PRIORITY_ACTIVE_SESSION, PRIORITY_NORMAL, set_priority)
+from single_flight import FlightTimeout, SingleFlight
+from circuit_breaker import CircuitBreaker
+from deadlines import Deadline, parse_split
+from did_client import DIDClient
+from did_streams import StreamPool, StreamClosed
+from audio_store import AudioStore
+from metrics import Metrics
+from faq_bank import FAQBank
+from response_cache import SemanticCache
+from history_manager import HistoryManager, estimate_tokens
+from audio_preprocess import AudioPreprocessor
+from voices import VoiceRegistry
+from batch_jobs import BatchJobs
+
+# Google SDKs are imported on first use, not when the app is loaded
+speech = LazyModule('google.cloud.speech')
+texttospeech = LazyModule('google.cloud.texttospeech')
+genai = LazyModule('google.generativeai')
+content_types = LazyModule('google.generativeai.types.content_types')
+grpc = LazyModule('grpc')
+
+# Load environment variables
+load_dotenv()
+
+# Initialize Flask app
+app = Flask(__name__, static_folder='static', static_url_path='')
+CORS(app)  # Enable CORS for browser testing
+
+# Configure API keys
+GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+DID_API_KEY = os.getenv('DID_API_KEY')
+GOOGLE_CREDENTIALS = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
+
+# Per-stage latency histograms, exported on /metrics
+metrics = Metrics()
+
+# Upstream clients are built on first use (see clients.py). With
+# CLIENT_WARMUP=true they are built and connected in the background right
+# after boot, and /ready reports 503 until that has finished.
+CLIENT_WARMUP = os.getenv('CLIENT_WARMUP', 'true').lower() == 'true'
+CLIENT_WARMUP_TIMEOUT = float(os.getenv('CLIENT_WARMUP_TIMEOUT', 15))
+clients = UpstreamClients(warmup=CLIENT_WARMUP)
+
+
+def wait_for_grpc_channel(client):
+    """Warm-up: connect a Google client's gRPC channel (no API call)"""
+    grpc.channel_ready_future(client.transport.grpc_channel).result(
+        timeout=CLIENT_WARMUP_TIMEOUT
+    )
+
+
+def warm_tts_client(client):
+    """Warm-up: connect and authenticate with a free voices listing"""
+    client.list_voices(language_code='en-US', timeout=CLIENT_WARMUP_TIMEOUT)
+
+
+# STT_BACKEND=fake / TTS_BACKEND=fake use the offline fakes from fakes.py
+if os.getenv('STT_BACKEND', 'google') == 'fake':
+    clients.register('stt', fakes.FakeSpeechClient)
+else:
+    clients.register('stt', lambda: speech.SpeechClient(), warm=wait_for_grpc_channel)
+if os.getenv('TTS_BACKEND', 'google') == 'fake':
+    clients.register('tts', fakes.FakeTTSClient)
+else:
+    clients.register('tts', lambda: texttospeech.TextToSpeechClient(), warm=warm_tts_client)
+
+speech_client = clients.proxy('stt')
+tts_client = clients.proxy('tts')
+
+# Circuit breakers per upstream API: once BREAKER_FAILURE_THRESHOLD calls (and at
+# least half the calls) failed within BREAKER_WINDOW seconds, calls are refused
+# for BREAKER_RESET_TIMEOUT seconds (0 = no breakers)
+UPSTREAMS = ['stt', 'gemini', 'tts', 'did']
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 5))
+upstream_breakers = {
+    name: CircuitBreaker(name, BREAKER_FAILURE_THRESHOLD,
+                         float(os.getenv('BREAKER_RESET_TIMEOUT', 30)),
+                         window=float(os.getenv('BREAKER_WINDOW', 60)))
+    for name in UPSTREAMS
+} if BREAKER_FAILURE_THRESHOLD > 0 else {}
+
+# Concurrency caps and rate limits per upstream API (UPSTREAM_CONCURRENCY_<NAME>,
+# UPSTREAM_RATE_<NAME>; 0 = unlimited). Calls that cannot start within
+# UPSTREAM_MAX_WAIT seconds are shed with a 503.
+upstream_limits = UpstreamLimits.from_env(UPSTREAMS, os.environ, breakers=upstream_breakers)
+
+# Latency budget of a complete-flow request (seconds, 0 = none), split across
+# the STT, Gemini, TTS and D-ID stages. The avatar video is skipped (audio-only
+# reply with the idle clip) when less than DEADLINE_DID_MIN_SECONDS is left
+# for it or D-ID's breaker is open.
+RESPONSE_DEADLINE = float(os.getenv('RESPONSE_DEADLINE', 15))
+DEADLINE_SPLIT = parse_split(os.getenv('DEADLINE_SPLIT', ''))
+DEADLINE_DID_MIN_SECONDS = float(os.getenv('DEADLINE_DID_MIN_SECONDS', 1.0))
+
+# Looping idle-avatar clip shown with audio-only replies
+IDLE_VIDEO_URL = os.getenv('IDLE_VIDEO_URL', '/video/idle.mp4')
+
+degraded_responses = metrics.counter(
+    'degraded_responses_total', 'Replies sent audio-only instead of with an avatar video',
+    ['reason']
+)
+
+
+def new_deadline():
+    """Deadline for one visitor request (None when RESPONSE_DEADLINE is 0)"""
+    return Deadline(RESPONSE_DEADLINE, DEADLINE_SPLIT) if RESPONSE_DEADLINE > 0 else None
+
+# Front-door admission control: at most ADMISSION_MAX_IN_FLIGHT requests to
+# the conversation endpoints at once (0 = unlimited); up to ADMISSION_MAX_QUEUE
+# more wait (visitors already in a conversation first) for ADMISSION_MAX_WAIT
+# seconds, the rest get a 503 with Retry-After.
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', 0))
+admission_gate = PriorityGate(
+    'requests',
+    ADMISSION_MAX_IN_FLIGHT,
+    max_queue=int(os.getenv('ADMISSION_MAX_QUEUE', 50)),
+    max_wait=float(os.getenv('ADMISSION_MAX_WAIT', 5))
+) if ADMISSION_MAX_IN_FLIGHT > 0 else None
+ADMITTED_ENDPOINTS = {
+    'speech_to_text', 'chat_with_gemini', 'chat_stream', 'text_to_speech',
+    'text_to_speech_audio', 'text_to_speech_batch', 'create_avatar_video',
+    'complete_flow', 'start_stt_stream',
+}
+
+def admission_stats():
+    """Front-door and per-upstream limits, queues and shed counts"""
+    return {
+        "requests": admission_gate.stats() if admission_gate else None,
+        "upstreams": upstream_limits.stats(),
+    }
+
+
+def admission_waiting():
+    stats = admission_stats()
+    waiting = {name: s['gate']['waiting'] for name, s in stats['upstreams'].items() if s['gate']}
+    if stats['requests']:
+        waiting['requests'] = stats['requests']['waiting']
+    return waiting
+
+
+def load_shed():
+    stats = admission_stats()
+    shed = {
+        name: (s['gate']['rejected'] + s['gate']['timed_out'] if s['gate'] else 0) +
+              (s['rate']['rejected'] if s['rate'] else 0)
+        for name, s in stats['upstreams'].items()
+    }
+    if stats['requests']:
+        shed['requests'] = stats['requests']['rejected'] + stats['requests']['timed_out']
+    return shed
+
+
+# Identical concurrent TTS, D-ID create and D-ID status calls share one
+# upstream request
+single_flight = SingleFlight()
+
+# Session storage for conversation history. Sessions hold serialized
+# history (not live chat objects), so with SESSION_STORE_URL pointing at
+# Redis any worker or replica can serve any session.
+SESSION_STORE_OPTIONS = {
+    'ttl': float(os.getenv('SESSION_TTL', 3600)),
+    'max_turns': int(os.getenv('SESSION_MAX_TURNS', 20)),
+}
+
+if os.getenv('SESSION_STORE_URL'):
+    session_store = RedisSessionStore.from_url(
+        os.getenv('SESSION_STORE_URL'), **SESSION_STORE_OPTIONS
+    )
+else:
+    session_store = InMemorySessionStore(
+        max_sessions=int(os.getenv('SESSION_MAX_SESSIONS', 1000)),
+        **SESSION_STORE_OPTIONS
+    )
+
+# Cache of synthesized speech (memory LRU + optional disk tier)
+tts_cache = TTSCache(
+    max_bytes=int(os.getenv('TTS_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+    disk_dir=(
+        os.path.join('static', 'audio', 'tts-cache')
+        if os.getenv('TTS_CACHE_DISK', 'true').lower() == 'true' else None
+    ),
+    disk_max_bytes=int(os.getenv('TTS_CACHE_DISK_MAX_BYTES', 512 * 1024 * 1024)),
+)
+
+
+# Shared D-ID client: one pooled keep-alive session, timeouts and
+# jittered retries on 429/5xx (DID_API_URL can point at a local stub)
+clients.register(
+    'did',
+    lambda: DIDClient(
+        api_key=DID_API_KEY,
+        base_url=os.getenv('DID_API_URL', 'https://api.d-id.com'),
+        pool_size=int(os.getenv('DID_POOL_SIZE', 20)),
+        connect_timeout=float(os.getenv('DID_CONNECT_TIMEOUT', 3.05)),
+        read_timeout=float(os.getenv('DID_READ_TIMEOUT', 20)),
+        max_retries=int(os.getenv('DID_MAX_RETRIES', 3)),
+        max_retry_after=float(os.getenv('DID_MAX_RETRY_AFTER', 30)),
+    ),
+    warm=lambda client: client.warm(),
+    # Replies still work without avatar videos
+    required=False,
+)
+did_client = clients.proxy('did')
+
+
+# Presenter image and rendering options used for every D-ID talk
+DID_SOURCE_URL = os.getenv(
+    'DID_SOURCE_URL',
+    "https://create-images-results.d-id.com/default-presenter-image.png"
+)
+DID_TALK_CONFIG = {
+    "fluent": True,
+    "pad_audio": 0.0
+}
+
+
+# How TTS audio is delivered: 'url' (written once to the audio store and
+# streamed from /api/audio/<id>.mp3) or 'base64' (inline in JSON)
+AUDIO_DELIVERY = os.getenv('AUDIO_DELIVERY', 'url').lower()
+
+# Browser/CDN cache lifetime of GET /api/text-to-speech (seconds); stored
+# clips themselves are immutable and cached for a year
+TTS_HTTP_MAX_AGE = int(os.getenv('TTS_HTTP_MAX_AGE', 86400))
+
+# Content-addressed audio artifacts in static/audio/clips, served by
+# /api/audio/<id>.mp3. PUBLIC_BASE_URL is the origin D-ID can fetch them from.
+audio_store = AudioStore(
+    directory=os.path.join('static', 'audio', 'clips'),
+    url_prefix='/api/audio',
+    public_base_url=os.getenv('PUBLIC_BASE_URL'),
+    max_bytes=int(os.getenv('AUDIO_STORE_MAX_BYTES', 1024 * 1024 * 1024)),
+)
+
+
+def audio_fields(audio_content):
+    """
+    Response fields describing an audio clip for the browser:
+    'audio_url' and 'audio_id' in url mode, 'audio_base64' otherwise
+    """
+    if AUDIO_DELIVERY == 'url':
+        audio_id = audio_store.put(audio_content)
+        return {
+            "audio_id": audio_id,
+            "audio_url": audio_store.url_for(audio_id)
+        }
+    return {"audio_base64": base64.b64encode(audio_content).decode('utf-8')}
+
+
+def audio_response(audio_id, max_age=None):
+    """
+    Binary audio/mpeg response for a clip in the audio store
+    
+    The clip's SHA-256 is its strong ETag, so revalidation (If-None-Match)
+    gets a 304 and Range requests (seeking, Safari's probes) get a 206.
+    Without ``max_age`` the response is cacheable for a year and marked
+    immutable - the bytes behind a clip id never change.
+    """
+    immutable = max_age is None
+    response = send_file(
+        audio_store.path_for(audio_id),
+        mimetype='audio/mpeg',
+        etag=audio_id,
+        conditional=True,
+        max_age=365 * 24 * 3600 if immutable else max_age
+    )
+    if immutable:
+        response.cache_control.immutable = True
+    # Advertise seeking support on full responses too
+    response.headers.setdefault('Accept-Ranges', 'bytes')
+    return response
+
+
+def build_talk_script(audio_content):
+    """
+    Build the D-ID talk script for an MP3 audio clip
+    
+    In url mode with a PUBLIC_BASE_URL the clip is passed by URL;
+    otherwise it is inlined as a base64 data URI.
+    """
+    audio_url = None
+    if AUDIO_DELIVERY == 'url':
+        audio_url = audio_store.public_url_for(audio_store.put(audio_content))
+    if audio_url is None:
+        audio_base64 = base64.b64encode(audio_content).decode('utf-8')
+        audio_url = f"data:audio/mp3;base64,{audio_base64}"
+    
+    return {
+        "type": "audio",
+        "audio_url": audio_url
+    }
+
+
+def build_talk_payload(audio_content):
+    """Build the D-ID /talks request body for an MP3 audio clip"""
+    return {
+        "script": build_talk_script(audio_content),
+        "config": DID_TALK_CONFIG,
+        "source_url": DID_SOURCE_URL
+    }
+
+
+def download_video(url, path):
+    """Stream a finished D-ID video to a local file"""
+    with upstream_limits.slot('did'), metrics.stage('did_download'):
+        did_client.download(url, path)
+
+
+# Rendered avatar videos, keyed by audio digest + presenter + config
+video_cache = VideoCache(
+    index_path=os.path.join('static', 'video', 'cache', 'index.json'),
+    video_dir=os.path.join('static', 'video', 'cache'),
+    url_prefix='/video/cache',
+    ttl=float(os.getenv('VIDEO_CACHE_TTL', 7 * 24 * 3600)),
+    remote_ttl=float(os.getenv('VIDEO_CACHE_REMOTE_TTL', 3600)),
+    max_entries=int(os.getenv('VIDEO_CACHE_MAX_ENTRIES', 500)),
+    max_bytes=int(os.getenv('VIDEO_CACHE_MAX_BYTES', 1024 * 1024 * 1024)),
+    download=(
+        download_video
+        if os.getenv('VIDEO_CACHE_DOWNLOAD', 'true').lower() == 'true' else None
+    ),
+)
+
+
+def video_cache_key(audio_content):
+    """Video cache key for the talk that would be created for this audio"""
+    return VideoCache.make_key(
+        VideoCache.audio_digest(audio_content), DID_SOURCE_URL, DID_TALK_CONFIG
+    )
+
+
+def store_finished_video(job, video_key):
+    """
+    Talk tracker callback: record how long D-ID took to render the talk
+    and remember finished talks in the video cache
+    """
+    if job['status'] == 'done':
+        metrics.observe_stage('did_ready', job['updated_at'] - job['created_at'])
+    else:
+        metrics.upstream_errors.inc('did_ready')
+    
+    if video_key and job['status'] == 'done' and job['result_url']:
+        video_cache.store(video_key, job['result_url'], talk_id=job['talk_id'])
+
+
+def fetch_talk_status(talk_id):
+    """Fetch the current state of a D-ID talk (called by the talk tracker)"""
+    def fetch():
+        with upstream_limits.slot('did'), metrics.stage('did_status'):
+            return did_client.get_talk(talk_id)
+    
+    return single_flight.do('did_status', talk_id, fetch)
+
+
+def create_talk(audio_content, timeout=None):
+    """
+    Create a D-ID talk for an MP3 clip
+    
+    Concurrent requests for the same clip share one talk.
+    Args:
+        timeout: optional limit (seconds) for the call, retries included,
+            or for waiting on an identical call already in flight
+    Returns: the new talk_id (None if D-ID did not return one)
+    """
+    def create():
+        payload = build_talk_payload(audio_content)
+        with upstream_limits.slot('did'), metrics.stage('did_create'):
+            talk_data = did_client.create_talk(payload, timeout=timeout)
+        return talk_data.get('id')
+    
+    return single_flight.do('did_create', video_cache_key(audio_content), create,
+                            timeout=timeout)
+
+
+# Shared background poller for in-flight D-ID talks
+talk_tracker = TalkTracker(
+    fetch_status=fetch_talk_status,
+    min_interval=float(os.getenv('DID_POLL_INTERVAL', 1.0)),
+    max_interval=float(os.getenv('DID_POLL_MAX_INTERVAL', 8.0)),
+    timeout=float(os.getenv('DID_POLL_TIMEOUT', 300)),
+    on_finished=store_finished_video,
+)
+
+
+@contextmanager
+def did_stream_call(stage):
+    """Avatar stream pool guard: D-ID limits, breaker and stage timing"""
+    with upstream_limits.slot('did'), metrics.stage(stage):
+        yield
+
+
+# Persistent avatar streams (D-ID streams API): with DID_STREAMS=true each
+# kiosk keeps a live WebRTC avatar open and replies are spoken into it
+# instead of rendered as /talks clips. Streams whose kiosk stops sending
+# heartbeats are closed after DID_STREAMS_IDLE_TIMEOUT seconds.
+DID_STREAMS_ENABLED = os.getenv('DID_STREAMS', 'false').lower() == 'true'
+avatar_streams = StreamPool(
+    did_client,
+    DID_SOURCE_URL,
+    config=DID_TALK_CONFIG,
+    max_streams=int(os.getenv('DID_STREAMS_MAX', 20)),
+    spares=int(os.getenv('DID_STREAMS_SPARES', 0)),
+    idle_timeout=float(os.getenv('DID_STREAMS_IDLE_TIMEOUT', 90)),
+    connect_timeout=float(os.getenv('DID_STREAMS_CONNECT_TIMEOUT', 30)),
+    upstream_idle_timeout=float(os.getenv('DID_STREAMS_UPSTREAM_IDLE_TIMEOUT', 240)),
+    guard=did_stream_call,
+)
+if DID_STREAMS_ENABLED:
+    avatar_streams.start_reaper(interval=float(os.getenv('DID_STREAMS_REAP_INTERVAL', 15)))
+
+# Kiosk ids come from the browser (one per kiosk, kept in localStorage)
+KIOSK_ID_PATTERN = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+
+def stream_avatar_reply(kiosk_id, audio_content, deadline=None):
+    """
+    Speak a reply through the kiosk's live avatar stream
+    
+    Returns: avatar fields with status 'streaming', or None when the reply
+    should be rendered as a clip instead (no connected stream, D-ID closed
+    it, or the call failed)
+    """
+    if not (DID_STREAMS_ENABLED and kiosk_id and avatar_streams.is_connected(kiosk_id)):
+        return None
+    try:
+        stream = avatar_streams.speak(
+            kiosk_id, build_talk_script(audio_content),
+            timeout=deadline.budget('did') if deadline else None
+        )
+    except (StreamClosed, requests.exceptions.RequestException, Overloaded) as e:
+        print(f"Error speaking into avatar stream, rendering a clip instead: {str(e)}")
+        return None
+    return {
+        "talk_id": None,
+        "status": "streaming",
+        "stream_id": stream['stream_id']
+    }
+
+
+# Receptionist voices per language, built once
+voice_registry = VoiceRegistry()
+
+
+def synthesize_speech(text, voice, timeout=None):
+    """
+    Synthesize speech through the TTS cache
+    
+    Identical requests (same text, voice and audio config) are answered
+    from the cache instead of calling Google Cloud TTS again; identical
+    requests that arrive while one is being synthesized wait for it.
+    
+    Args:
+        voice: a Voice from the voice registry
+        timeout: optional limit (seconds) for the TTS call, or for waiting
+            on an identical one already in flight
+    Returns: MP3 audio bytes
+    """
+    key = TTSCache.make_key(text, voice.language_code, voice.name, voice.config_key)
+    # Only pass a timeout when given; None would disable the client default
+    options = {'timeout': timeout} if timeout else {}
+    
+    def synthesize():
+        with upstream_limits.slot('tts'), metrics.stage('tts'):
+            response = tts_client.synthesize_speech(
+                input=texttospeech.SynthesisInput(text=text),
+                voice=voice.params,
+                audio_config=voice.audio_config,
+                **options
+            )
+        return response.audio_content
+    
+    return single_flight.do(
+        'tts', key,
+        lambda: tts_cache.get_or_synthesize(key, synthesize, characters=len(text)),
+        timeout=timeout
+    )
+
+
+# Configure Gemini model
+generation_config = {
+    "temperature": 0.7,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 1024,
+}
+
+safety_settings = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+]
+
+# System prompt for the receptionist persona
+RECEPTIONIST_SYSTEM_PROMPT = """You are a friendly and professional virtual receptionist. 
+Your role is to:
+- Greet visitors warmly and professionally
+- Answer questions about the company, office directions, and event schedules
+- Be helpful and courteous at all times
+- If you don't know something, politely acknowledge it and offer to connect them with support
+- Keep responses concise and natural (2-3 sentences maximum for spoken responses)
+- Support multilingual interactions (English, Finnish, Arabic)
+- Remember context from the conversation
+
+Company Information:
+- Company Name: TechInnovate Solutions
+- Address: 123 Innovation Drive, Tech City, TC 12345
+- Office Hours: Monday-Friday, 9 AM - 6 PM
+- Reception Desk: Ground Floor, Main Building
+- Upcoming Events: Tech Conference on November 15th, Product Launch on December 1st
+
+Always be polite, professional, and helpful. If the question is beyond your scope, say: 
+"I'd be happy to connect you with our support team for more detailed assistance."
+"""
+
+
+def build_recognition_config(encoding=None, sample_rate_hertz=48000):
+    """
+    Speech recognition settings (browser WebM/Opus recordings by default,
+    16 kHz LINEAR16 for preprocessed uploads)
+    """
+    return speech.RecognitionConfig(
+        encoding=encoding or speech.RecognitionConfig.AudioEncoding.WEBM_OPUS,
+        sample_rate_hertz=sample_rate_hertz,
+        language_code="en-US",
+        alternative_language_codes=["fi-FI", "ar-SA"],  # Support Finnish and Arabic
+        enable_automatic_punctuation=True,
+    )
+
+
+# Decode, downsample to 16 kHz mono and trim silence before STT
+# (AUDIO_PREPROCESS=false sends uploads unchanged)
+audio_preprocessor = None
+if os.getenv('AUDIO_PREPROCESS', 'true').lower() == 'true':
+    audio_preprocessor = AudioPreprocessor(
+        floor_db=float(os.getenv('VAD_FLOOR_DB', -45)),
+        noise_margin_db=float(os.getenv('VAD_NOISE_MARGIN_DB', 12)),
+        padding_ms=int(os.getenv('VAD_PADDING_MS', 200)),
+        min_speech_ms=int(os.getenv('VAD_MIN_SPEECH_MS', 120)),
+        ffmpeg_path=os.getenv('FFMPEG_PATH'),
+    )
+
+
+def build_recognition_request(audio_content):
+    """
+    Preprocess an uploaded recording for Speech-to-Text
+    
+    Returns: (RecognitionAudio, RecognitionConfig), or None when the
+    recording holds no speech (so no API call is needed)
+    """
+    if audio_preprocessor is None:
+        return speech.RecognitionAudio(content=audio_content), build_recognition_config()
+    
+    with metrics.stage('audio_prep'):
+        prepared = audio_preprocessor.process(audio_content)
+    
+    if not prepared.speech:
+        return None
+    if prepared.encoding == 'linear16':
+        config = build_recognition_config(
+            speech.RecognitionConfig.AudioEncoding.LINEAR16, prepared.sample_rate
+        )
+    else:
+        # Could not decode it here (no ffmpeg): let the API decode WebM/Opus
+        config = build_recognition_config()
+    return speech.RecognitionAudio(content=prepared.content), config
+
+
+# Reply used to close the seeded persona exchange (see build_chat_model)
+PERSONA_ACKNOWLEDGEMENT = (
+    "Understood. I'm the virtual receptionist for TechInnovate Solutions "
+    "and I'll follow these guidelines in every reply."
+)
+
+
+GEMINI_FAKE = os.getenv('GEMINI_BACKEND', 'google') == 'fake'
+
+
+def supports_system_instruction():
+    return 'system_instruction' in inspect.signature(genai.GenerativeModel).parameters
+
+
+def build_chat_model():
+    """
+    Build the Gemini model (once, on first use)
+    
+    The persona is delivered without a conversational round trip: as a
+    system instruction when the SDK supports it, otherwise as a pre-seeded
+    persona exchange (see persona_history) that prefixes every chat.
+    """
+    if GEMINI_FAKE:
+        return fakes.FakeGenerativeModel()
+    
+    genai.configure(api_key=GEMINI_API_KEY)
+    options = {
+        'model_name': 'gemini-1.5-pro',  # Using Gemini 1.5 Pro (closest to 2.5 Pro)
+        'generation_config': generation_config,
+        'safety_settings': safety_settings,
+    }
+    
+    if supports_system_instruction():
+        options['system_instruction'] = RECEPTIONIST_SYSTEM_PROMPT
+    return genai.GenerativeModel(**options)
+
+
+@functools.lru_cache(maxsize=1)
+def persona_history():
+    """Seeded persona exchange, converted once (empty with system instructions)"""
+    if GEMINI_FAKE or supports_system_instruction():
+        return []
+    return content_types.to_contents([
+        {"role": "user", "parts": [RECEPTIONIST_SYSTEM_PROMPT]},
+        {"role": "model", "parts": [PERSONA_ACKNOWLEDGEMENT]},
+    ])
+
+
+clients.register(
+    'gemini', build_chat_model,
+    # count_tokens is free and goes through the same channel as chat calls
+    warm=None if GEMINI_FAKE else lambda model: model.count_tokens("Hello")
+)
+chat_model = clients.proxy('gemini')
+
+
+# Bounds the prompt per request: recent turns verbatim, older turns
+# folded into a summary, oldest window turns left out past the budget
+history_manager = HistoryManager(
+    window_turns=int(os.getenv('HISTORY_WINDOW_TURNS', 6)),
+    summary_max_chars=int(os.getenv('HISTORY_SUMMARY_MAX_CHARS', 1200)),
+    token_budget=int(os.getenv('HISTORY_TOKEN_BUDGET', 2000)),
+    base_tokens=estimate_tokens(RECEPTIONIST_SYSTEM_PROMPT + PERSONA_ACKNOWLEDGEMENT),
+)
+
+prompt_tokens = metrics.histogram(
+    'gemini_prompt_tokens', 'Prompt size per Gemini request (tokens)',
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+)
+
+
+def get_chat(session_id, message=''):
+    """
+    Rebuild the Gemini chat for a session from its stored history
+    
+    Only the summary and the recent window (within the token budget) are
+    loaded into the chat. The stored history and summary are kept on the
+    chat object for save_chat.
+    """
+    session = session_store.load(session_id)
+    history = session['history'] if session else []
+    summary = session.get('summary') if session else None
+    
+    messages, estimated_tokens = history_manager.build(history, summary, message)
+    chat = chat_model.start_chat(history=persona_history() + messages)
+    chat.stored_history = history
+    chat.stored_summary = summary
+    chat.base_length = len(chat.history)
+    chat.estimated_prompt_tokens = estimated_tokens
+    return chat
+
+
+def is_first_turn(chat):
+    """True while a session holds no conversation yet"""
+    return not chat.stored_history and not chat.stored_summary
+
+
+def track_prompt_size(chat, response=None):
+    """Record the prompt size of a request (as reported, else estimated)"""
+    usage = getattr(response, 'usage_metadata', None)
+    tokens = getattr(usage, 'prompt_token_count', None) or chat.estimated_prompt_tokens
+    history_manager.record_prompt(tokens)
+    prompt_tokens.observe(tokens)
+
+
+# Gemini replies reused for similar context-free first questions
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+response_cache = SemanticCache(
+    threshold=float(os.getenv('RESPONSE_CACHE_THRESHOLD', 0.9)),
+    ttl=float(os.getenv('RESPONSE_CACHE_TTL', 3600)),
+    max_entries=int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1000)),
+)
+
+
+def cached_reply(chat, user_text, language_code=None):
+    """
+    Look up a cached Gemini reply for a first turn
+    Returns: (reply or None, whether this turn may be cached)
+    """
+    if not RESPONSE_CACHE_ENABLED:
+        return None, False
+    first_turn = is_first_turn(chat)
+    language = language_code[:2].lower() if language_code else None
+    return response_cache.lookup(user_text, language, cacheable=first_turn), first_turn
+
+
+def remember_reply(user_text, reply, language_code=None):
+    """Store a first-turn Gemini reply in the response cache"""
+    language = language_code[:2].lower() if language_code else None
+    response_cache.put(user_text, reply, language)
+
+
+def ask_gemini(session_id, user_text, language_code=None):
+    """
+    Gemini chat stage: answer one message and store the turn
+    
+    Context-free first turns are served from the semantic response cache
+    when a similar question was answered before.
+    Returns: reply text
+    """
+    chat = get_chat(session_id, user_text)
+    reply, cacheable = cached_reply(chat, user_text, language_code)
+    if reply is not None:
+        record_turn(session_id, user_text, reply)
+        return reply
+    
+    with upstream_limits.slot('gemini'), metrics.stage('gemini'):
+        response = chat.send_message(user_text)
+    track_prompt_size(chat, response)
+    save_chat(session_id, chat)
+    
+    if cacheable:
+        remember_reply(user_text, response.text, language_code)
+    return response.text
+
+
+def save_chat(session_id, chat):
+    """Append the chat's new messages to the stored history"""
+    new_messages = [
+        {"role": content.role, "parts": [part.text for part in content.parts]}
+        for content in chat.history[chat.base_length:]
+    ]
+    append_history(session_id, new_messages)
+
+
+def append_history(session_id, messages):
+    """
+    Append messages to a session's history, compacting older turns into
+    the summary
+    
+    The append is applied to the session as it is stored now, not as it
+    was when the request loaded it, so concurrent requests on one session
+    (double-submits, two tabs, two workers) both keep their turn.
+    """
+    def apply(session):
+        history = session['history'] if session else []
+        summary = session.get('summary') if session else None
+        return history_manager.compact(history + messages, summary)
+    
+    session_store.update(session_id, apply)
+
+
+def select_voice(text, language_code=None, voice_name=None):
+    """
+    Voice for a TTS request: an explicit voice name, else the requested
+    language, else the language the text is written in
+    
+    Raises: ValueError for an invalid voice name
+    """
+    if voice_name:
+        return voice_registry.named(voice_name)
+    if language_code:
+        return voice_registry.get(language_code)
+    return voice_registry.for_text(text)
+
+
+def video_status(job):
+    """Client-facing status of a tracked talk ('processing', 'completed' or 'error')"""
+    if job['status'] == 'done':
+        return {
+            "status": "completed",
+            "video_url": job['result_url']
+        }
+    if job['status'] in ('error', 'rejected'):
+        return {
+            "status": "error",
+            "error": job['error'] or "Video generation failed"
+        }
+    return {"status": "processing"}
+
+
+# Seconds between keepalive comments on idle video event streams
+VIDEO_EVENTS_KEEPALIVE = float(os.getenv('VIDEO_EVENTS_KEEPALIVE', 15))
+
+
+# Frequent questions answered without Gemini (pre-rendered by a warm-up job)
+FAQ_ENABLED = os.getenv('FAQ_ENABLED', 'true').lower() == 'true'
+faq_bank = FAQBank.from_file(
+    os.getenv('FAQ_PATH', 'faq.json'),
+    media_dir=os.path.join('static', 'faq'),
+    url_prefix='/faq',
+    threshold=float(os.getenv('FAQ_MATCH_THRESHOLD', 0.8)),
+)
+
+
+def synthesize_faq_answer(text, language_code):
+    """FAQ warm-up: speak an answer in its language's receptionist voice"""
+    return synthesize_speech(text, voice_registry.get(language_code))
+
+
+def save_talk_video(talk_id, path):
+    """
+    Wait for a D-ID talk to finish and download its video to path
+    Returns: the talk's final state ('done' once the video was saved)
+    """
+    talk_tracker.track(talk_id)
+    job = talk_tracker.wait(talk_id, timeout=talk_tracker.timeout + 10)
+    if job and job['status'] == 'done':
+        if not job['result_url']:
+            return dict(job, status='error', error="No result_url for finished talk")
+        download_video(job['result_url'], path)
+    return job
+
+
+def render_faq_video(audio_content, path):
+    """
+    FAQ warm-up: render the avatar video for an answer and save it to path
+    Returns: True if the video was written
+    """
+    talk_id = create_talk(audio_content)
+    if not talk_id:
+        return False
+    job = save_talk_video(talk_id, path)
+    return bool(job) and job['status'] == 'done'
+
+
+def render_idle_video(force=False):
+    """
+    Render the idle-avatar clip once: the presenter over IDLE_VIDEO_SECONDS
+    of silence, saved to the static file behind IDLE_VIDEO_URL
+    Returns: True if the clip exists afterwards
+    """
+    path = os.path.join('static', IDLE_VIDEO_URL.lstrip('/'))
+    if os.path.exists(path) and not force:
+        return True
+    try:
+        voice = voice_registry.get()
+        seconds = min(10.0, float(os.getenv('IDLE_VIDEO_SECONDS', 5)))
+        with upstream_limits.slot('tts'), metrics.stage('tts'):
+            silence = tts_client.synthesize_speech(
+                input=texttospeech.SynthesisInput(
+                    ssml=f'<speak><break time="{seconds:g}s"/></speak>'
+                ),
+                voice=voice.params,
+                audio_config=voice.audio_config
+            ).audio_content
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return render_faq_video(silence, path)
+    except Exception as e:
+        print(f"Error rendering idle avatar video: {str(e)}")
+        return False
+
+
+def warm_faq_bank(force=False, video=True):
+    """Start pre-rendering FAQ answers in the background"""
+    return faq_bank.warm_in_background(
+        synthesize_faq_answer,
+        render_video=render_faq_video if video and DID_API_KEY else None,
+        force=force,
+        max_workers=int(os.getenv('FAQ_WARMUP_WORKERS', 4)),
+    )
+
+
+def record_turn(session_id, user_text, assistant_text):
+    """Append an exchange answered without Gemini to the session history"""
+    append_history(session_id, [
+        {"role": "user", "parts": [user_text]},
+        {"role": "model", "parts": [assistant_text]},
+    ])
+
+
+def idle_video_url():
+    """URL of the idle-avatar clip, or None if there is none"""
+    if IDLE_VIDEO_URL.startswith(('http://', 'https://')):
+        return IDLE_VIDEO_URL
+    path = os.path.join('static', IDLE_VIDEO_URL.lstrip('/'))
+    return IDLE_VIDEO_URL if os.path.exists(path) else None
+
+
+def audio_only_avatar(reason):
+    """
+    Avatar fields of a degraded reply: the audio is played on its own,
+    over the looping idle-avatar clip
+    """
+    degraded_responses.inc(reason)
+    return {
+        "talk_id": None,
+        "status": "audio_only",
+        "degraded": reason,
+        "idle_video_url": idle_video_url()
+    }
+
+
+def start_avatar_video(audio_content, deadline=None, kiosk_id=None):
+    """
+    Create the avatar video for an audio clip (or reuse a cached one)
+    
+    A kiosk with a connected avatar stream gets the reply spoken into the
+    stream instead (status 'streaming'); if that fails, a clip is rendered.
+    
+    With a deadline the avatar is optional: when D-ID's circuit breaker is
+    open, when too little time is left to create the talk, or when
+    creating it fails or times out, the reply goes out audio-only instead.
+    
+    Returns: dict with 'talk_id' and 'status' ('processing', 'completed'
+    with 'video_url', 'streaming' with 'stream_id', or 'audio_only' with
+    'degraded' and 'idle_video_url')
+    """
+    streamed = stream_avatar_reply(kiosk_id, audio_content, deadline)
+    if streamed:
+        return streamed
+    
+    video_key = video_cache_key(audio_content)
+    cached_video = video_cache.lookup(video_key)
+    
+    if cached_video:
+        return {
+            "talk_id": None,
+            "video_url": cached_video['video_url'],
+            "status": "completed"
+        }
+    
+    if deadline is None:
+        talk_id = create_talk(audio_content)
+    else:
+        budget = deadline.budget('did')
+        if upstream_limits.circuit_open('did'):
+            return audio_only_avatar('avatar_unavailable')
+        if budget < DEADLINE_DID_MIN_SECONDS:
+            return audio_only_avatar('deadline')
+        try:
+            talk_id = create_talk(audio_content, timeout=budget)
+        except (requests.exceptions.RequestException, Overloaded, FlightTimeout) as e:
+            print(f"Error creating avatar video, replying with audio only: {str(e)}")
+            return audio_only_avatar('avatar_error')
+    
+    if talk_id:
+        talk_tracker.track(talk_id, context=video_key)
+    
+    # Return immediately with talk_id for polling
+    return {
+        "talk_id": talk_id,
+        "status": "processing"
+    }
+
+
+def answer_from_faq(session_id, user_text, avatar=True, deadline=None, kiosk_id=None):
+    """
+    Answer a frequent question from the FAQ bank instead of Gemini
+    
+    Uses the pre-rendered audio and video when the warm-up has produced
+    them (no upstream calls at all); otherwise synthesizes the stored answer.
+    Returns: response dict like respond_to_text's, or None if nothing matched
+    """
+    if not FAQ_ENABLED:
+        return None
+    match = faq_bank.match(user_text)
+    if match is None:
+        return None
+    
+    record_turn(session_id, user_text, match['answer'])
+    
+    audio_content = faq_bank.audio(match['id'], match['language'])
+    if audio_content is None:
+        audio_content = synthesize_faq_answer(match['answer'], match['language'])
+    
+    result = {
+        "session_id": session_id,
+        "user_text": user_text,
+        "assistant_text": match['answer'],
+        "source": "faq",
+        "faq_id": match['id'],
+        "language": match['language'],
+    }
+    result.update(audio_fields(audio_content))
+    
+    if avatar:
+        # A kiosk's live avatar speaks the answer; others get the clip
+        video_url = faq_bank.video_url(match['id'], match['language'])
+        streamed = stream_avatar_reply(kiosk_id, audio_content, deadline)
+        if streamed:
+            result.update(streamed)
+        elif video_url:
+            result.update({"talk_id": None, "status": "completed", "video_url": video_url})
+        else:
+            result.update(start_avatar_video(audio_content, deadline))
+    return result
+
+
+def respond_to_text(session_id, user_text, language_code=None, deadline=None,
+                    kiosk_id=None):
+    """
+    Run the post-recognition stages for one utterance:
+    Gemini chat, text-to-speech and avatar video creation
+    
+    Frequent questions are answered from the FAQ bank without Gemini.
+    With a deadline, TTS gets its share of the time left and the avatar
+    video is skipped (audio-only reply) if it cannot be started in time.
+    With a kiosk_id, the kiosk's live avatar stream (if any) speaks it.
+    Returns: response dict (the /api/complete-flow JSON body)
+    """
+    faq_result = answer_from_faq(session_id, user_text, deadline=deadline,
+                                 kiosk_id=kiosk_id)
+    if faq_result:
+        return faq_result
+    
+    # Step 2: Gemini Chat (or a cached reply to the same first question)
+    assistant_text = ask_gemini(session_id, user_text, language_code)
+    
+    # Step 3: Text-to-Speech, in the voice of the reply's language
+    voice = voice_registry.for_text(assistant_text, hint=language_code)
+    audio_content = synthesize_speech(
+        assistant_text, voice, timeout=deadline.timeout('tts') if deadline else None
+    )
+    
+    result = {
+        "session_id": session_id,
+        "user_text": user_text,
+        "assistant_text": assistant_text,
+    }
+    result.update(audio_fields(audio_content))
+    
+    # Step 4: Create Avatar Video (or reuse an identical cached clip)
+    result.update(start_avatar_video(audio_content, deadline, kiosk_id))
+    return result
+
+
+def sse_event(data):
+    """Format a dict as one Server-Sent Events message"""
+    return f"data: {json.dumps(data)}\n\n"
+
+
+def respond_to_text_pipelined(session_id, user_text, avatar=True, language_code=None,
+                              deadline=None, kiosk_id=None):
+    """
+    Pipelined variant of respond_to_text, yielding SSE messages
+    
+    Gemini's reply is streamed and split into sentences; each sentence is
+    synthesized on the TTS pool as soon as it is complete and sent to the
+    client in order ('audio' events), so playback starts while the rest of
+    the reply is still being generated. A final 'done' event carries the
+    full text and, if requested, the avatar video for the whole reply
+    (or, past the deadline, an audio-only status; see start_avatar_video).
+    
+    The response headers are sent before any of this runs, so the 'done'
+    event carries the stream's own Server-Timing value ('server_timing').
+    """
+    # Collect stage timings for the stream; the pipeline's threads run in
+    # copies of this context and record into the same list
+    started = metrics.start_request()
+    try:
+        faq_result = answer_from_faq(session_id, user_text, avatar=avatar, deadline=deadline,
+                                     kiosk_id=kiosk_id)
+        if faq_result:
+            # The whole answer is ready at once: one audio event, then done
+            audio = {key: faq_result.pop(key)
+                     for key in ('audio_base64', 'audio_url', 'audio_id') if key in faq_result}
+            yield sse_event(dict(audio, type="audio", index=0,
+                                 text=faq_result['assistant_text']))
+            yield sse_event(dict(faq_result, type="done",
+                                 server_timing=metrics.server_timing(started)))
+            return
+        
+        chat = get_chat(session_id, user_text)
+        cached, cacheable = cached_reply(chat, user_text, language_code)
+        reply_parts = []
+        
+        def reply_chunks():
+            if cached is not None:
+                yield cached
+                return
+            started = time.perf_counter()
+            first = True
+            with upstream_limits.slot('gemini'), metrics.stage('gemini'):
+                for chunk in chat.send_message(user_text, stream=True):
+                    if first:
+                        metrics.observe_stage(
+                            'gemini_first_chunk', time.perf_counter() - started
+                        )
+                        first = False
+                    reply_parts.append(chunk.text)
+                    yield chunk.text
+        
+        # The first sentence whose language is recognizable picks the
+        # voice for the rest of the reply
+        reply_voice = {}
+        
+        def synthesize(sentence):
+            detected = voice_registry.detect(sentence)
+            if detected:
+                voice = reply_voice.setdefault('voice', voice_registry.get(detected))
+            else:
+                voice = reply_voice.get('voice') or voice_registry.get(language_code)
+            return synthesize_speech(sentence, voice)
+        
+        sentences = []
+        audio_segments = []
+        for index, sentence, audio_content in pipelined_speech(
+                reply_chunks(), synthesize, tts_executor):
+            sentences.append(sentence)
+            audio_segments.append(audio_content)
+            event = {
+                "type": "audio",
+                "index": index,
+                "text": sentence,
+            }
+            event.update(audio_fields(audio_content))
+            yield sse_event(event)
+        
+        if cached is not None:
+            record_turn(session_id, user_text, cached)
+        else:
+            track_prompt_size(chat)
+            save_chat(session_id, chat)
+            if cacheable:
+                remember_reply(user_text, ''.join(reply_parts), language_code)
+        
+        done = {
+            "type": "done",
+            "session_id": session_id,
+            "user_text": user_text,
+            "assistant_text": ' '.join(sentences),
+        }
+        
+        if avatar and audio_segments:
+            # MP3 frames can be concatenated into one clip for the avatar
+            done.update(start_avatar_video(b''.join(audio_segments), deadline, kiosk_id))
+        
+        done["server_timing"] = metrics.server_timing(started)
+        yield sse_event(done)
+    
+    except Exception as e:
+        print(f"Error in pipelined response: {str(e)}")
+        yield sse_event({"type": "error", "error": f"Pipelined response error: {str(e)}"})
+
+
+def event_stream(events):
+    """Wrap an SSE generator in a streaming response"""
+    return Response(events, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+class LimitedStreamingBackend:
+    """Holds an 'stt' upstream slot for the lifetime of each stream"""
+    
+    def __init__(self, backend):
+        self.backend = backend
+    
+    def recognize(self, chunks):
+        with upstream_limits.slot('stt'), metrics.stage('stt_stream'):
+            yield from self.backend.recognize(chunks)
+
+
+def respond_to_stream(stream, transcript, confidence):
+    """Streaming recognizer callback: answer the finished utterance"""
+    return respond_to_text(stream.session_id, transcript, kiosk_id=stream.kiosk_id)
+
+
+# Thread pool for sentence-level TTS in pipelined responses
+tts_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('TTS_PIPELINE_WORKERS', 4)),
+    thread_name_prefix='tts'
+)
+
+# Streaming speech recognition (chunked upload -> streaming_recognize)
+streaming_recognizer = StreamingRecognizer(
+    backend=LimitedStreamingBackend(
+        GoogleStreamingBackend(speech_client, build_recognition_config)
+    ),
+    on_final=respond_to_stream,
+    max_streams=int(os.getenv('STT_STREAM_MAX_STREAMS', 100)),
+    idle_timeout=float(os.getenv('STT_STREAM_IDLE_TIMEOUT', 10)),
+)
+
+# Gauges read from the shared components when /metrics is scraped
+metrics.gauge_callback(
+    'cache_hit_ratio', 'Hit ratio per media cache',
+    lambda: {"tts": tts_cache.stats()['hit_ratio'],
+             "video": video_cache.stats()['hit_ratio'],
+             "responses": response_cache.stats()['hit_ratio']},
+    labelname='cache'
+)
+metrics.counter_callback(
+    'llm_calls_avoided_total', 'Gemini calls answered from the response cache',
+    lambda: response_cache.stats()['llm_calls_avoided']
+)
+metrics.gauge_callback(
+    'upstream_in_flight', 'Calls holding an upstream concurrency slot',
+    lambda: {name: s['in_flight'] for name, s in upstream_limits.stats().items()},
+    labelname='upstream'
+)
+metrics.gauge_callback(
+    'admission_waiting', 'Requests and upstream calls waiting for a slot',
+    lambda: admission_waiting(),
+    labelname='gate'
+)
+metrics.counter_callback(
+    'load_shed_total', 'Requests and upstream calls rejected with 503 by admission control',
+    lambda: load_shed(),
+    labelname='gate'
+)
+metrics.gauge_callback(
+    'circuit_open', 'Upstreams whose circuit breaker is refusing calls',
+    lambda: {name: 1 if breaker.is_open() else 0 for name, breaker in upstream_breakers.items()},
+    labelname='upstream'
+)
+metrics.counter_callback(
+    'upstream_calls_coalesced_total', 'Calls that shared an identical in-flight upstream call',
+    lambda: {group: s['coalesced'] for group, s in single_flight.stats().items()},
+    labelname='call'
+)
+metrics.counter_callback(
+    'stt_audio_seconds_total', 'Recorded audio uploaded, and sent to STT after trimming',
+    lambda: (
+        {"uploaded": audio_preprocessor.stats()['seconds_in'],
+         "sent": audio_preprocessor.stats()['seconds_out']}
+        if audio_preprocessor else {}
+    ),
+    labelname='audio'
+)
+metrics.counter_callback(
+    'stt_silent_uploads_total', 'Recordings rejected as silence before calling STT',
+    lambda: audio_preprocessor.stats()['rejected_silence'] if audio_preprocessor else 0
+)
+metrics.gauge_callback(
+    'client_ready', 'Upstream clients built (and warmed up) per client',
+    lambda: {name: 1 if client['state'] in ('ready', 'warm', 'injected') else 0
+             for name, client in clients.status()['clients'].items()},
+    labelname='client'
+)
+metrics.gauge_callback(
+    'did_talks_in_flight', 'D-ID talks still rendering',
+    lambda: talk_tracker.stats()['in_flight']
+)
+metrics.gauge_callback(
+    'avatar_streams', 'Live D-ID avatar streams per state',
+    lambda: avatar_streams.stats()['states'],
+    labelname='state'
+)
+metrics.gauge_callback(
+    'stt_streams_active', 'Open streaming recognition requests',
+    lambda: streaming_recognizer.stats()['active']
+)
 
-# Google Cloud imports
-from google.cloud import speech
-from google.cloud import texttospeech
-import google.generativeai as genai
 
-# Load environment variables
-load_dotenv()
+# Build and connect the upstream clients right after boot
+if CLIENT_WARMUP:
+    clients.warm_in_background(timeout=CLIENT_WARMUP_TIMEOUT + 5)
 
-# Initialize Flask app
-app = Flask(__name__, static_folder='static', static_url_path='')
-CORS(app)  # Enable CORS for browser testing
 
-# Configure API keys
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-DID_API_KEY = os.getenv('DID_API_KEY')
-GOOGLE_CREDENTIALS = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
+# Optionally pre-render the FAQ bank when the server starts
+if FAQ_ENABLED and os.getenv('FAQ_WARMUP_ON_START', 'false').lower() == 'true':
+    warm_faq_bank()
+
+# Optionally render the idle-avatar clip for audio-only replies
+if os.getenv('IDLE_VIDEO_RENDER_ON_START', 'false').lower() == 'true' and DID_API_KEY \
+        and not IDLE_VIDEO_URL.startswith(('http://', 'https://')):
+    threading.Thread(target=render_idle_video, name='idle-video', daemon=True).start()
+
+
+def synthesize_script(text, language_code=None, voice_name=None):
+    """Batch jobs: speak a script and report the voice that was used"""
+    voice = select_voice(text, language_code, voice_name)
+    return synthesize_speech(text, voice), voice.to_dict()
 
-# Initialize Google Gemini
-genai.configure(api_key=GEMINI_API_KEY)
 
-# Initialize Google Cloud clients
-speech_client = speech.SpeechClient()
-tts_client = texttospeech.TextToSpeechClient()
+# Bulk avatar clip generation (POST /api/batch-jobs or batch_generate.py).
+# Progress lives in static/video/batch/<job_id>/job.json, so unfinished
+# jobs are resumed when the server starts.
+batch_jobs = BatchJobs(
+    directory=os.path.join('static', 'video', 'batch'),
+    url_prefix='/video/batch',
+    synthesize=synthesize_script,
+    create_talk=create_talk,
+    save_video=save_talk_video,
+    concurrency=int(os.getenv('BATCH_CONCURRENCY', 3)),
+    max_attempts=int(os.getenv('BATCH_MAX_ATTEMPTS', 4)),
+    backoff=float(os.getenv('BATCH_BACKOFF', 5)),
+    max_scripts=int(os.getenv('BATCH_MAX_SCRIPTS', 200)),
+)
+if os.getenv('BATCH_RESUME_ON_START', 'true').lower() == 'true':
+    batch_jobs.resume_all()
 
-# Session storage for conversation context (in-memory for demo)
-# In production, use Redis or a database
-conversation_sessions = {}
 
+@app.before_request
+def start_request_timer():
+    """Start collecting stage timings for this request"""
+    g.metrics_started = metrics.start_request()
 
-def get_did_headers():
+
+@app.after_request
+def add_server_timing(response):
     """
-    Get properly formatted headers for D-ID API
-    
-    D-ID API supports two authentication methods:
-    1. API key header: x-api-key (RECOMMENDED - used here)
-    2. Basic auth: Authorization: Basic base64(api_key:)
+    Record request latency and report per-stage timings to the browser
     
-    This application uses the x-api-key method as it's simpler and
-    is the recommended approach per D-ID's official documentation.
+    For streamed (SSE) responses only the stages run before the first
+    byte are included; pipelined replies report the rest in their 'done'
+    event (see respond_to_text_pipelined).
     """
-    return {
-        "accept": "application/json",
-        "content-type": "application/json",
-        "x-api-key": DID_API_KEY
-    }
+    started = g.get('metrics_started')
+    if started is not None and request.path.startswith('/api/'):
+        response.headers['Server-Timing'] = metrics.finish_request(
+            started, request.endpoint, response.status_code
+        )
+    return response
 
-# Configure Gemini model
-generation_config = {
-    "temperature": 0.7,
-    "top_p": 0.95,
-    "top_k": 40,
-    "max_output_tokens": 1024,
-}
 
-safety_settings = [
-    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-]
+def request_priority():
+    """Requests continuing an existing conversation are admitted first"""
+    data = request.get_json(silent=True) if request.is_json else request.form
+    session_id = (data or {}).get('session_id') or request.args.get('session_id')
+    if session_id and session_store.exists(session_id):
+        return PRIORITY_ACTIVE_SESSION
+    return PRIORITY_NORMAL
 
-# System prompt for the receptionist persona
-RECEPTIONIST_SYSTEM_PROMPT = """You are a friendly and professional virtual receptionist. 
-Your role is to:
-- Greet visitors warmly and professionally
-- Answer questions about the company, office directions, and event schedules
-- Be helpful and courteous at all times
-- If you don't know something, politely acknowledge it and offer to connect them with support
-- Keep responses concise and natural (2-3 sentences maximum for spoken responses)
-- Support multilingual interactions (English, Finnish, Arabic)
-- Remember context from the conversation
 
-Company Information:
-- Company Name: TechInnovate Solutions
-- Address: 123 Innovation Drive, Tech City, TC 12345
-- Office Hours: Monday-Friday, 9 AM - 6 PM
-- Reception Desk: Ground Floor, Main Building
-- Upcoming Events: Tech Conference on November 15th, Product Launch on December 1st
+def overloaded_response(error):
+    """503 with Retry-After for a request shed by admission control"""
+    response = jsonify({
+        "error": "The receptionist is busy, please try again shortly",
+        "overloaded": error.name,
+        "reason": error.reason,
+        "retry_after": error.retry_after
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(max(1, round(error.retry_after)))
+    return response
+
+
+@app.errorhandler(Overloaded)
+def handle_overloaded(error):
+    return overloaded_response(error)
+
+
+@app.before_request
+def admit_request():
+    """
+    Admission control for the conversation endpoints: set the priority of
+    the request's upstream calls and wait for an admission slot (503 with
+    Retry-After when the queue is full or the wait would be too long)
+    """
+    if request.endpoint not in ADMITTED_ENDPOINTS:
+        set_priority(PRIORITY_NORMAL)
+        return None
+    priority = request_priority()
+    set_priority(priority)
+    if admission_gate is None:
+        return None
+    try:
+        admission_gate.acquire(priority)
+    except Overloaded as e:
+        return overloaded_response(e)
+    g.admitted_at = time.monotonic()
+    return None
 
-Always be polite, professional, and helpful. If the question is beyond your scope, say: 
-"I'd be happy to connect you with our support team for more detailed assistance."
-"""
+
+@app.after_request
+def release_admission_on_close(response):
+    """Hold the admission slot until the response (or stream) is finished"""
+    started = g.pop('admitted_at', None)
+    if started is not None:
+        response.call_on_close(
+            lambda: admission_gate.release(time.monotonic() - started)
+        )
+    return response
+
+
+@app.teardown_request
+def release_admission(error=None):
+    """Release the slot of a request that ended without a response"""
+    started = g.pop('admitted_at', None)
+    if started is not None:
+        admission_gate.release(time.monotonic() - started)
 
 
 @app.route('/')
@@ -115,6 +1420,23 @@ def health_check():
     return jsonify({"status": "healthy", "service": "Virtual Receptionist Avatar API"})
 
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """
+    Readiness probe: 200 once the upstream clients are built and connected
+    (with CLIENT_WARMUP), 503 while warming up or if a required client failed
+    
+    Unlike /health, use this to decide when a replica takes traffic.
+    """
+    ready = clients.ready()
+    if not ready:
+        # Failed warm-ups (e.g. a network blip at boot) are retried
+        clients.rewarm_failed(timeout=CLIENT_WARMUP_TIMEOUT + 5)
+    status = clients.status()
+    status["ready"] = ready
+    return jsonify(status), 200 if ready else 503
+
+
 @app.route('/api/speech-to-text', methods=['POST'])
 def speech_to_text():
     """
@@ -129,18 +1451,15 @@ def speech_to_text():
         audio_file = request.files['audio']
         audio_content = audio_file.read()
         
-        # Configure speech recognition
-        audio = speech.RecognitionAudio(content=audio_content)
-        config = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.WEBM_OPUS,
-            sample_rate_hertz=48000,
-            language_code="en-US",
-            alternative_language_codes=["fi-FI", "ar-SA"],  # Support Finnish and Arabic
-            enable_automatic_punctuation=True,
-        )
+        # Trim silence and downsample; silent recordings never reach the API
+        recognition = build_recognition_request(audio_content)
+        if recognition is None:
+            return jsonify({"error": "No speech detected"}), 400
+        audio, config = recognition
         
         # Perform speech recognition
-        response = speech_client.recognize(config=config, audio=audio)
+        with upstream_limits.slot('stt'), metrics.stage('stt'):
+            response = speech_client.recognize(config=config, audio=audio)
         
         if not response.results:
             return jsonify({"error": "No speech detected"}), 400
@@ -154,6 +1473,8 @@ def speech_to_text():
             "confidence": confidence
         })
     
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         print(f"Error in speech-to-text: {str(e)}")
         return jsonify({"error": f"Speech-to-text error: {str(e)}"}), 500
@@ -163,7 +1484,7 @@ def speech_to_text():
 def chat_with_gemini():
     """
     Process user message through Gemini and get response
-    Expects: JSON with 'message' and optional 'session_id'
+    Expects: JSON with 'message' and optional 'session_id', 'language_code'
     Returns: Gemini's response text
     """
     try:
@@ -174,170 +1495,264 @@ def chat_with_gemini():
         if not user_message:
             return jsonify({"error": "No message provided"}), 400
         
-        # Get or create conversation session
-        if session_id not in conversation_sessions:
-            # Initialize new conversation with system prompt
-            model = genai.GenerativeModel(
-                model_name='gemini-1.5-pro',  # Using Gemini 1.5 Pro (closest to 2.5 Pro)
-                generation_config=generation_config,
-                safety_settings=safety_settings,
-            )
-            chat = model.start_chat(history=[])
-            conversation_sessions[session_id] = {
-                'chat': chat,
-                'created_at': time.time()
-            }
-            
-            # Send system prompt as first message
-            chat.send_message(RECEPTIONIST_SYSTEM_PROMPT)
-        
-        # Get existing chat session
-        chat = conversation_sessions[session_id]['chat']
-        
-        # Send user message and get response
-        response = chat.send_message(user_message)
-        assistant_message = response.text
+        # Send user message and get response (first turns may be cached)
+        assistant_message = ask_gemini(session_id, user_message,
+                                       data.get('language_code'))
         
         return jsonify({
             "response": assistant_message,
             "session_id": session_id
         })
     
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         print(f"Error in Gemini chat: {str(e)}")
         return jsonify({"error": f"Chat error: {str(e)}"}), 500
 
 
+@app.route('/api/chat-stream', methods=['POST'])
+def chat_stream():
+    """
+    Pipelined chat + speech: stream Gemini's reply sentence by sentence
+    Expects: JSON with 'message', optional 'session_id', 'avatar',
+             'language_code' and 'kiosk_id'
+    Returns: Server-Sent Events ('audio' per sentence, then 'done')
+    """
+    data = request.get_json(silent=True) or {}
+    user_message = data.get('message', '')
+    session_id = data.get('session_id', str(uuid.uuid4()))
+    
+    if not user_message:
+        return jsonify({"error": "No message provided"}), 400
+    
+    return event_stream(respond_to_text_pipelined(
+        session_id, user_message, avatar=bool(data.get('avatar', False)),
+        language_code=data.get('language_code'), kiosk_id=data.get('kiosk_id')
+    ))
+
+
 @app.route('/api/text-to-speech', methods=['POST'])
 def text_to_speech():
     """
     Convert text to speech using Google Cloud Text-to-Speech
-    Expects: JSON with 'text' and optional 'language_code'
-    Returns: audio file (base64 encoded)
+    Expects: JSON with 'text' and optional 'language_code' or 'voice_name'
+             (without either, the voice follows the text's language)
+    Returns: the clip's URL (or base64 audio with AUDIO_DELIVERY=base64);
+             the MP3 itself when the request sends 'Accept: audio/mpeg'
     """
     try:
         data = request.json
         text = data.get('text', '')
-        language_code = data.get('language_code', 'en-US')
         
         if not text:
             return jsonify({"error": "No text provided"}), 400
         
-        # Set up the text input
-        synthesis_input = texttospeech.SynthesisInput(text=text)
-        
-        # Select voice based on language
-        voice_params = {
-            'en-US': ('en-US', texttospeech.SsmlVoiceGender.FEMALE, 'en-US-Neural2-F'),
-            'fi-FI': ('fi-FI', texttospeech.SsmlVoiceGender.FEMALE, 'fi-FI-Standard-A'),
-            'ar-SA': ('ar-XA', texttospeech.SsmlVoiceGender.FEMALE, 'ar-XA-Standard-A'),
-        }
-        
-        lang_code, gender, name = voice_params.get(language_code, voice_params['en-US'])
+        try:
+            voice = select_voice(text, data.get('language_code'), data.get('voice_name'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        voice = texttospeech.VoiceSelectionParams(
-            language_code=lang_code,
-            name=name,
-            ssml_gender=gender
-        )
+        # Perform text-to-speech (served from cache when possible)
+        audio_content = synthesize_speech(text, voice)
         
-        # Configure audio output
-        audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3,
-            speaking_rate=1.0,
-            pitch=0.0
-        )
+        if request.accept_mimetypes.best_match(['application/json', 'audio/mpeg']) == 'audio/mpeg':
+            return audio_response(audio_store.put(audio_content))
         
-        # Perform text-to-speech
-        response = tts_client.synthesize_speech(
-            input=synthesis_input,
-            voice=voice,
-            audio_config=audio_config
-        )
+        if AUDIO_DELIVERY == 'url':
+            # Written once to the audio store; the browser streams it by URL
+            audio_id = audio_store.put(audio_content)
+            return jsonify({
+                "audio_id": audio_id,
+                "audio_url": audio_store.url_for(audio_id),
+                "format": "mp3"
+            })
         
         # Encode audio to base64
-        audio_base64 = base64.b64encode(response.audio_content).decode('utf-8')
+        audio_base64 = base64.b64encode(audio_content).decode('utf-8')
         
         return jsonify({
             "audio": audio_base64,
             "format": "mp3"
         })
     
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        print(f"Error in text-to-speech: {str(e)}")
+        return jsonify({"error": f"Text-to-speech error: {str(e)}"}), 500
+
+
+@app.route('/api/text-to-speech', methods=['GET'])
+def text_to_speech_audio():
+    """
+    Speak a text as a binary MP3, for use directly as an <audio src>
+    Expects: query parameters 'text' and optional 'language_code' or 'voice_name'
+    Returns: audio/mpeg (ETag, Cache-Control, Range and 304 supported)
+    """
+    try:
+        text = request.args.get('text', '')
+        
+        if not text:
+            return jsonify({"error": "No text provided"}), 400
+        
+        try:
+            voice = select_voice(text, request.args.get('language_code'),
+                                 request.args.get('voice_name'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        audio_content = synthesize_speech(text, voice)
+        # The URL names a text, not a clip: a voice change can alter it
+        return audio_response(audio_store.put(audio_content), max_age=TTS_HTTP_MAX_AGE)
+    
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         print(f"Error in text-to-speech: {str(e)}")
         return jsonify({"error": f"Text-to-speech error: {str(e)}"}), 500
 
 
+@app.route('/api/audio/<audio_id>.mp3', methods=['GET'])
+def get_audio(audio_id):
+    """
+    Stream a stored clip (from audio_url in TTS and complete-flow responses)
+    Returns: audio/mpeg (strong ETag, immutable caching, Range and 304 supported)
+    """
+    if not audio_store.valid_id(audio_id) or not audio_store.exists(audio_id):
+        return jsonify({"error": "Audio not found"}), 404
+    return audio_response(audio_id)
+
+
+# Thread pool and size limit for batch TTS requests
+tts_batch_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('TTS_BATCH_WORKERS', 4)),
+    thread_name_prefix='tts-batch'
+)
+TTS_BATCH_MAX_VARIANTS = int(os.getenv('TTS_BATCH_MAX_VARIANTS', 8))
+
+
+@app.route('/api/text-to-speech/batch', methods=['POST'])
+def text_to_speech_batch():
+    """
+    Render several TTS variants in one request, in parallel
+    Expects: JSON with 'variants' (list of objects with 'text', and
+             optional 'language_code' or 'voice_name'), or 'text' with
+             'language_codes' / 'voice_names' to speak one text in
+             several voices; a variant without 'text' uses the top-level one
+    Returns: 'variants' in request order, each with its voice and audio
+             (or an 'error')
+    """
+    try:
+        data = request.json
+        text = data.get('text', '')
+        variants = list(data.get('variants') or [])
+        variants += [{"language_code": code} for code in data.get('language_codes') or []]
+        variants += [{"voice_name": name} for name in data.get('voice_names') or []]
+        
+        if not variants:
+            return jsonify({"error": "No variants provided"}), 400
+        if len(variants) > TTS_BATCH_MAX_VARIANTS:
+            return jsonify({
+                "error": f"At most {TTS_BATCH_MAX_VARIANTS} variants per request"
+            }), 400
+        
+        jobs = []
+        for variant in variants:
+            variant_text = variant.get('text') or text
+            if not variant_text:
+                return jsonify({"error": "No text provided"}), 400
+            try:
+                voice = select_voice(variant_text, variant.get('language_code'),
+                                     variant.get('voice_name'))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            jobs.append((variant_text, voice))
+        
+        def render(job):
+            variant_text, voice = job
+            result = {"text": variant_text}
+            result.update(voice.to_dict())
+            try:
+                result.update(audio_fields(synthesize_speech(variant_text, voice)))
+            except Exception as e:
+                print(f"Error in batch text-to-speech ({voice.name}): {str(e)}")
+                result["error"] = f"Text-to-speech error: {str(e)}"
+            return result
+        
+        # Each render runs in a copy of the request context, so the
+        # request's priority and stage timings reach the TTS calls
+        futures = [
+            tts_batch_executor.submit(contextvars.copy_context().run, render, job)
+            for job in jobs
+        ]
+        results = [future.result() for future in futures]
+        
+        status = 500 if all('error' in result for result in results) else 200
+        return jsonify({"variants": results, "format": "mp3"}), status
+    
+    except Exception as e:
+        print(f"Error in batch text-to-speech: {str(e)}")
+        return jsonify({"error": f"Text-to-speech error: {str(e)}"}), 500
+
+
+@app.route('/api/voices', methods=['GET'])
+def list_voices():
+    """Receptionist voice used for each supported language"""
+    return jsonify({"voices": voice_registry.languages(), "default": voice_registry.default})
+
+
 @app.route('/api/create-avatar-video', methods=['POST'])
 def create_avatar_video():
     """
     Create talking avatar video using D-ID API
-    Expects: JSON with 'audio_base64' (base64 encoded audio)
-    Returns: video URL or video data
+    Expects: JSON with 'audio_base64' (base64 encoded audio) or 'audio_id'
+             (a clip in the audio store, from /api/text-to-speech in url mode),
+             optional 'kiosk_id' (speak it into that kiosk's avatar stream)
+    Returns: talk_id to poll via /api/check-video-status/<talk_id>
     """
     try:
         data = request.json
         audio_base64 = data.get('audio_base64', '')
+        audio_id = data.get('audio_id', '')
         
-        if not audio_base64:
+        if audio_id:
+            if not audio_store.valid_id(audio_id) or not audio_store.exists(audio_id):
+                return jsonify({"error": "Unknown audio_id"}), 400
+            with open(audio_store.path_for(audio_id), 'rb') as f:
+                audio_content = f.read()
+        elif audio_base64:
+            audio_content = base64.b64decode(audio_base64)
+        else:
             return jsonify({"error": "No audio provided"}), 400
         
-        # D-ID API endpoint
-        url = "https://api.d-id.com/talks"
+        # A kiosk with a live avatar stream needs no video at all
+        streamed = stream_avatar_reply(data.get('kiosk_id'), audio_content)
+        if streamed:
+            return jsonify(streamed)
         
-        # Prepare the request payload
-        payload = {
-            "script": {
-                "type": "audio",
-                "audio_url": f"data:audio/mp3;base64,{audio_base64}"
-            },
-            "config": {
-                "fluent": True,
-                "pad_audio": 0.0
-            },
-            "source_url": "https://create-images-results.d-id.com/default-presenter-image.png"
-        }
+        # Reuse a previously rendered clip for identical audio
+        video_key = video_cache_key(audio_content)
+        cached_video = video_cache.lookup(video_key)
         
-        headers = get_did_headers()
+        if cached_video:
+            return jsonify({
+                "status": "completed",
+                "video_url": cached_video['video_url'],
+                "talk_id": None,
+                "cached": True
+            })
         
         # Create the talk
-        response = requests.post(url, json=payload, headers=headers)
-        response.raise_for_status()
-        
-        talk_data = response.json()
-        talk_id = talk_data.get('id')
+        talk_id = create_talk(audio_content)
         
         if not talk_id:
             return jsonify({"error": "Failed to create talk"}), 500
         
-        # Poll for video completion (with timeout)
-        max_attempts = 30
-        attempt = 0
-        
-        while attempt < max_attempts:
-            # Check talk status
-            status_url = f"https://api.d-id.com/talks/{talk_id}"
-            status_response = requests.get(status_url, headers=headers)
-            status_data = status_response.json()
-            
-            status = status_data.get('status')
-            
-            if status == 'done':
-                # Video is ready
-                video_url = status_data.get('result_url')
-                return jsonify({
-                    "status": "completed",
-                    "video_url": video_url,
-                    "talk_id": talk_id
-                })
-            elif status == 'error':
-                return jsonify({"error": "Video generation failed"}), 500
-            
-            # Wait before polling again
-            time.sleep(2)
-            attempt += 1
-        
-        # Timeout - return status for frontend to poll
+        # Hand the talk to the background tracker and return right away;
+        # the browser follows up via /api/check-video-status/<talk_id>
+        talk_tracker.track(talk_id, context=video_key)
+        
         return jsonify({
             "status": "processing",
             "talk_id": talk_id,
@@ -347,6 +1762,8 @@ def create_avatar_video():
     except requests.exceptions.RequestException as e:
         print(f"Error in D-ID API: {str(e)}")
         return jsonify({"error": f"Avatar video creation error: {str(e)}"}), 500
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         print(f"Error in avatar video creation: {str(e)}")
         return jsonify({"error": f"Avatar video error: {str(e)}"}), 500
@@ -357,37 +1774,62 @@ def check_video_status(talk_id):
     """
     Check the status of a D-ID video generation
     Used for polling when video takes longer to generate
+    
+    Answers from the talk tracker's shared state, so browser polls never
+    turn into D-ID requests of their own.
     """
     try:
-        url = f"https://api.d-id.com/talks/{talk_id}"
-        headers = get_did_headers()
+        job = talk_tracker.get(talk_id)
         
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
+        if job is None:
+            # Unknown talk (e.g. created before a restart) - start tracking it
+            job = talk_tracker.track(talk_id)
         
-        status_data = response.json()
-        status = status_data.get('status')
+        result = video_status(job)
         
-        if status == 'done':
-            return jsonify({
-                "status": "completed",
-                "video_url": status_data.get('result_url')
-            })
-        elif status == 'error':
-            return jsonify({
-                "status": "error",
-                "error": "Video generation failed"
-            }), 500
-        else:
-            return jsonify({
-                "status": "processing"
-            })
+        if result['status'] == 'error':
+            return jsonify(result), 500
+        return jsonify(result)
     
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         print(f"Error checking video status: {str(e)}")
         return jsonify({"error": f"Status check error: {str(e)}"}), 500
 
 
+@app.route('/api/video-events/<talk_id>', methods=['GET'])
+def video_events(talk_id):
+    """
+    Push a talk's status to the browser as Server-Sent Events
+    
+    Sends 'processing' right away and the final status ('completed' with
+    'video_url', or 'error') as soon as the talk tracker sees the talk
+    finish. Every subscriber waits on the tracker's single watch of the
+    talk, so open streams add no requests to this server or to D-ID.
+    """
+    if talk_tracker.get(talk_id) is None:
+        talk_tracker.track(talk_id)
+    
+    def generate():
+        yield sse_event({"talk_id": talk_id, "status": "processing"})
+        while True:
+            job = talk_tracker.wait(talk_id, timeout=VIDEO_EVENTS_KEEPALIVE)
+            if job is None:
+                yield sse_event({"talk_id": talk_id, "status": "error",
+                                 "error": "Unknown talk"})
+                return
+            result = video_status(job)
+            if result['status'] != 'processing':
+                result['talk_id'] = talk_id
+                yield sse_event(result)
+                return
+            # Comment line keeps proxies from closing an idle stream
+            yield ": keepalive\n\n"
+    
+    return event_stream(generate())
+
+
 @app.route('/api/complete-flow', methods=['POST'])
 def complete_flow():
     """
@@ -397,128 +1839,359 @@ def complete_flow():
     3. Text-to-Speech
     4. Avatar Video
     
-    Expects: audio file
+    Expects: audio file, optional 'session_id', 'mode' and 'kiosk_id'
     Returns: video URL and conversation data
+    
+    With mode=pipelined the reply is streamed as Server-Sent Events
+    (sentence-level audio segments, then a 'done' event).
+    
+    The request runs against a RESPONSE_DEADLINE budget: if the avatar
+    video cannot be started in time (or D-ID is failing), the reply is
+    returned audio-only with status 'audio_only'.
+    
+    With a 'kiosk_id' whose avatar stream is connected (DID_STREAMS), the
+    reply is spoken into the stream instead (status 'streaming').
     """
     try:
+        deadline = new_deadline()
+        
         if 'audio' not in request.files:
             return jsonify({"error": "No audio file provided"}), 400
         
         session_id = request.form.get('session_id', str(uuid.uuid4()))
+        kiosk_id = request.form.get('kiosk_id')
         
         # Step 1: Speech-to-Text
         audio_file = request.files['audio']
         audio_content = audio_file.read()
         
-        audio = speech.RecognitionAudio(content=audio_content)
-        config = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.WEBM_OPUS,
-            sample_rate_hertz=48000,
-            language_code="en-US",
-            alternative_language_codes=["fi-FI", "ar-SA"],
-            enable_automatic_punctuation=True,
-        )
+        recognition = build_recognition_request(audio_content)
+        if recognition is None:
+            return jsonify({"error": "No speech detected"}), 400
+        audio, config = recognition
         
-        stt_response = speech_client.recognize(config=config, audio=audio)
+        options = {'timeout': deadline.timeout('stt')} if deadline else {}
+        with upstream_limits.slot('stt'), metrics.stage('stt'):
+            stt_response = speech_client.recognize(config=config, audio=audio, **options)
         
         if not stt_response.results:
             return jsonify({"error": "No speech detected"}), 400
         
         user_text = stt_response.results[0].alternatives[0].transcript
+        # Language the recognizer picked (partitions the response cache)
+        language_code = getattr(stt_response.results[0], 'language_code', '') or None
         
-        # Step 2: Gemini Chat
-        if session_id not in conversation_sessions:
-            model = genai.GenerativeModel(
-                model_name='gemini-1.5-pro',
-                generation_config=generation_config,
-                safety_settings=safety_settings,
+        # Steps 2-4: Gemini Chat, Text-to-Speech, Avatar Video
+        if request.form.get('mode') == 'pipelined':
+            avatar = request.form.get('avatar', 'true').lower() == 'true'
+            return event_stream(
+                respond_to_text_pipelined(session_id, user_text, avatar=avatar,
+                                          language_code=language_code, deadline=deadline,
+                                          kiosk_id=kiosk_id)
             )
-            chat = model.start_chat(history=[])
-            conversation_sessions[session_id] = {
-                'chat': chat,
-                'created_at': time.time()
-            }
-            chat.send_message(RECEPTIONIST_SYSTEM_PROMPT)
-        
-        chat = conversation_sessions[session_id]['chat']
-        gemini_response = chat.send_message(user_text)
-        assistant_text = gemini_response.text
-        
-        # Step 3: Text-to-Speech
-        synthesis_input = texttospeech.SynthesisInput(text=assistant_text)
-        voice = texttospeech.VoiceSelectionParams(
-            language_code="en-US",
-            name="en-US-Neural2-F",
-            ssml_gender=texttospeech.SsmlVoiceGender.FEMALE
-        )
-        audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3,
-            speaking_rate=1.0,
-            pitch=0.0
-        )
-        
-        tts_response = tts_client.synthesize_speech(
-            input=synthesis_input,
-            voice=voice,
-            audio_config=audio_config
-        )
-        
-        audio_base64 = base64.b64encode(tts_response.audio_content).decode('utf-8')
-        
-        # Step 4: Create Avatar Video
-        url = "https://api.d-id.com/talks"
-        payload = {
-            "script": {
-                "type": "audio",
-                "audio_url": f"data:audio/mp3;base64,{audio_base64}"
-            },
-            "config": {
-                "fluent": True,
-                "pad_audio": 0.0
-            },
-            "source_url": "https://create-images-results.d-id.com/default-presenter-image.png"
-        }
-        
-        headers = get_did_headers()
-        
-        did_response = requests.post(url, json=payload, headers=headers)
-        did_response.raise_for_status()
-        
-        talk_data = did_response.json()
-        talk_id = talk_data.get('id')
         
-        # Return immediately with talk_id for polling
-        return jsonify({
-            "session_id": session_id,
-            "user_text": user_text,
-            "assistant_text": assistant_text,
-            "audio_base64": audio_base64,
-            "talk_id": talk_id,
-            "status": "processing"
-        })
+        return jsonify(respond_to_text(session_id, user_text, language_code, deadline,
+                                       kiosk_id))
     
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         print(f"Error in complete flow: {str(e)}")
         return jsonify({"error": f"Complete flow error: {str(e)}"}), 500
 
 
-# Clean up old sessions periodically (simple cleanup for demo)
+@app.route('/api/stt-stream', methods=['POST'])
+def start_stt_stream():
+    """
+    Start a streaming speech recognition request
+    Expects: optional JSON with 'session_id' and 'kiosk_id' (whose live
+             avatar stream, if any, speaks the reply)
+    Returns: stream_id for the chunk/end/events endpoints
+    """
+    data = request.get_json(silent=True) or {}
+    session_id = data.get('session_id', str(uuid.uuid4()))
+    
+    stream = streaming_recognizer.create(session_id, kiosk_id=data.get('kiosk_id'))
+    if stream is None:
+        return jsonify({"error": "Too many active speech streams"}), 503
+    
+    return jsonify({
+        "stream_id": stream.stream_id,
+        "session_id": session_id
+    })
+
+
+@app.route('/api/stt-stream/<stream_id>/chunk', methods=['POST'])
+def push_stt_chunk(stream_id):
+    """
+    Append a MediaRecorder chunk to a recognition stream
+    Expects: raw audio bytes as the request body (chunks in order)
+    """
+    stream = streaming_recognizer.get(stream_id)
+    if stream is None:
+        return jsonify({"error": "Unknown stream"}), 404
+    
+    accepted = stream.push_audio(request.get_data())
+    return jsonify({"accepted": accepted})
+
+
+@app.route('/api/stt-stream/<stream_id>/end', methods=['POST'])
+def end_stt_stream(stream_id):
+    """Signal that the recording has stopped"""
+    stream = streaming_recognizer.get(stream_id)
+    if stream is None:
+        return jsonify({"error": "Unknown stream"}), 404
+    
+    stream.close_audio()
+    return jsonify({"status": "closed"})
+
+
+@app.route('/api/stt-stream/<stream_id>/events', methods=['GET'])
+def stt_stream_events(stream_id):
+    """
+    Server-Sent Events for a recognition stream:
+    interim / end_of_utterance / final / response / error / done
+    """
+    stream = streaming_recognizer.get(stream_id)
+    if stream is None:
+        return jsonify({"error": "Unknown stream"}), 404
+    
+    def generate():
+        for event in stream.events():
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                yield sse_event(event)
+    
+    return event_stream(generate())
+
+
+def avatar_stream_request(kiosk_id=None):
+    """
+    Validate an avatar stream request
+    Returns: (kiosk_id, JSON body, error response or None)
+    """
+    data = request.get_json(silent=True) or {}
+    kiosk_id = kiosk_id or data.get('kiosk_id', '')
+    if not DID_STREAMS_ENABLED:
+        return kiosk_id, data, (jsonify({"error": "Avatar streams are disabled"}), 404)
+    if not KIOSK_ID_PATTERN.match(kiosk_id):
+        return kiosk_id, data, (jsonify({"error": "Invalid kiosk_id"}), 400)
+    return kiosk_id, data, None
+
+
+@app.route('/api/avatar-stream', methods=['POST'])
+def open_avatar_stream():
+    """
+    Open (or reopen) the live avatar stream of a kiosk
+    Expects: JSON with 'kiosk_id'
+    Returns: stream_id, the SDP 'offer' and 'ice_servers' for the
+             browser's RTCPeerConnection; any previous stream of the
+             kiosk is closed
+    """
+    kiosk_id, data, error = avatar_stream_request()
+    if error:
+        return error
+    
+    try:
+        return jsonify(avatar_streams.open(kiosk_id))
+    except Overloaded as e:
+        return overloaded_response(e)
+    except requests.exceptions.RequestException as e:
+        print(f"Error opening avatar stream: {str(e)}")
+        return jsonify({"error": f"Avatar stream error: {str(e)}"}), 500
+
+
+@app.route('/api/avatar-stream/<kiosk_id>/sdp', methods=['POST'])
+def answer_avatar_stream(kiosk_id):
+    """
+    Complete the WebRTC handshake of a kiosk's avatar stream
+    Expects: JSON with 'stream_id' and 'answer' (the browser's SDP answer)
+    """
+    kiosk_id, data, error = avatar_stream_request(kiosk_id)
+    if error:
+        return error
+    
+    try:
+        return jsonify(avatar_streams.answer(kiosk_id, data.get('stream_id'), data.get('answer')))
+    except StreamClosed as e:
+        return jsonify({"error": str(e), "state": "closed"}), 404
+    except Overloaded as e:
+        return overloaded_response(e)
+    except requests.exceptions.RequestException as e:
+        print(f"Error connecting avatar stream: {str(e)}")
+        return jsonify({"error": f"Avatar stream error: {str(e)}"}), 500
+
+
+@app.route('/api/avatar-stream/<kiosk_id>/ice', methods=['POST'])
+def avatar_stream_ice(kiosk_id):
+    """
+    Forward an ICE candidate of a kiosk's avatar stream to D-ID
+    Expects: JSON with 'stream_id', 'candidate', 'sdpMid' and 'sdpMLineIndex'
+    """
+    kiosk_id, data, error = avatar_stream_request(kiosk_id)
+    if error:
+        return error
+    
+    candidate = {key: data.get(key) for key in ('candidate', 'sdpMid', 'sdpMLineIndex')}
+    try:
+        avatar_streams.add_ice_candidate(kiosk_id, data.get('stream_id'), candidate)
+        return jsonify({"status": "ok"})
+    except StreamClosed as e:
+        return jsonify({"error": str(e), "state": "closed"}), 404
+    except Overloaded as e:
+        return overloaded_response(e)
+    except requests.exceptions.RequestException as e:
+        print(f"Error adding avatar stream ICE candidate: {str(e)}")
+        return jsonify({"error": f"Avatar stream error: {str(e)}"}), 500
+
+
+@app.route('/api/avatar-stream/<kiosk_id>/keepalive', methods=['POST'])
+def avatar_stream_keepalive(kiosk_id):
+    """
+    Heartbeat of a kiosk's avatar stream (sent while the page is open)
+    Expects: JSON with 'stream_id'
+    Returns: the stream's 'state'; 'expired' or 'closed' means reconnect
+    """
+    kiosk_id, data, error = avatar_stream_request(kiosk_id)
+    if error:
+        return error
+    
+    stream = avatar_streams.keepalive(kiosk_id, data.get('stream_id'))
+    if stream is None:
+        return jsonify({"kiosk_id": kiosk_id, "state": "closed"})
+    stream.pop('offer', None)
+    return jsonify(stream)
+
+
+@app.route('/api/avatar-stream/<kiosk_id>/close', methods=['POST'])
+def close_avatar_stream(kiosk_id):
+    """
+    Close a kiosk's avatar stream (page unload; sent with sendBeacon)
+    Expects: JSON with optional 'stream_id'
+    """
+    kiosk_id, data, error = avatar_stream_request(kiosk_id)
+    if error:
+        return error
+    
+    closed = avatar_streams.close(kiosk_id, data.get('stream_id'))
+    return jsonify({"kiosk_id": kiosk_id, "closed": closed})
+
+
+@app.route('/api/avatar-streams', methods=['GET'])
+def avatar_stream_stats():
+    """Open avatar streams by state, spares and reconnect/reap counters"""
+    return jsonify(dict(avatar_streams.stats(), enabled=DID_STREAMS_ENABLED))
+
+
+@app.route('/api/cache-stats', methods=['GET'])
+def cache_stats():
+    """Report cache hit/miss counters and estimated savings"""
+    return jsonify({
+        "tts": tts_cache.stats(),
+        "video": video_cache.stats(),
+        "responses": response_cache.stats(),
+        "coalesced": single_flight.stats()
+    })
+
+
+@app.route('/api/admission', methods=['GET'])
+def admission_status():
+    """Admission control and upstream limits: in flight, waiting, shed"""
+    return jsonify(admission_stats())
+
+
+@app.route('/api/faq', methods=['GET'])
+def faq_stats():
+    """FAQ bank match counters and pre-rendering progress"""
+    return jsonify(faq_bank.stats())
+
+
+@app.route('/api/faq/warmup', methods=['POST'])
+def faq_warmup():
+    """
+    Pre-render audio and avatar video for every FAQ answer (background job)
+    Expects: optional JSON with 'force' (re-render everything) and
+             'video' (false for audio only)
+    """
+    data = request.get_json(silent=True) or {}
+    started = warm_faq_bank(force=bool(data.get('force')),
+                            video=data.get('video', True) is not False)
+    
+    if not started:
+        return jsonify({"message": "Warm-up already running",
+                        "faq": faq_bank.stats()}), 409
+    return jsonify({"message": "Warm-up started"}), 202
+
+
+@app.route('/api/batch-jobs', methods=['POST'])
+def create_batch_job():
+    """
+    Render a list of scripts into avatar videos (background job)
+    Expects: JSON with 'scripts' (strings, or objects with 'text' and
+             optional 'name', 'language_code', 'voice_name') and optional
+             'concurrency'
+    Returns: the job, to follow via /api/batch-jobs/<job_id>
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            job = batch_jobs.submit(data.get('scripts'), data.get('concurrency'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(job), 202
+    
+    except Exception as e:
+        print(f"Error creating batch job: {str(e)}")
+        return jsonify({"error": f"Batch job error: {str(e)}"}), 500
+
+
+@app.route('/api/batch-jobs', methods=['GET'])
+def list_batch_jobs():
+    """Summaries of all batch jobs, newest first"""
+    return jsonify({"jobs": batch_jobs.list(), "stats": batch_jobs.stats()})
+
+
+@app.route('/api/batch-jobs/<job_id>', methods=['GET'])
+def get_batch_job(job_id):
+    """Progress of a batch job, with URLs of the finished clips"""
+    job = batch_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job)
+
+
+@app.route('/api/batch-jobs/<job_id>/resume', methods=['POST'])
+def resume_batch_job(job_id):
+    """
+    Resume an interrupted batch job, or retry the failed scripts of a
+    finished one
+    """
+    if batch_jobs.get(job_id) is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if not batch_jobs.start(job_id, retry_failed=True):
+        return jsonify({"message": "Job is finished or already running",
+                        "job": batch_jobs.get(job_id)}), 409
+    return jsonify(batch_jobs.get(job_id)), 202
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Per-stage latency histograms, gauges and error counters (Prometheus format)"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+# Sessions expire automatically; this endpoint only forces it early
 @app.route('/api/cleanup-sessions', methods=['POST'])
 def cleanup_sessions():
-    """Remove sessions older than 1 hour"""
+    """Remove expired sessions now (they are also expired automatically)"""
     try:
-        current_time = time.time()
-        old_sessions = []
-        
-        for session_id, session_data in conversation_sessions.items():
-            if current_time - session_data['created_at'] > 3600:  # 1 hour
-                old_sessions.append(session_id)
-        
-        for session_id in old_sessions:
-            del conversation_sessions[session_id]
+        removed = session_store.purge_expired()
         
         return jsonify({
-            "message": f"Cleaned up {len(old_sessions)} old sessions"
+            "message": f"Cleaned up {removed} old sessions",
+            "sessions": session_store.stats(),
+            "history": history_manager.stats()
         })
     
     except Exception as e:
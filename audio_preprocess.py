@@ -0,0 +1,242 @@
+"""
+Speech Upload Preprocessing
+===========================
+Prepares recorded audio before it is sent to Speech-to-Text.
+
+1. Decode the upload to mono samples: WAV with the standard library,
+   anything else (browser WebM/Opus, Ogg, MP3) through ffmpeg when it is
+   installed.
+2. Downsample to 16 kHz - all the recognizer needs for speech.
+3. Energy-based voice-activity detection over 30 ms frames (vectorized
+   with NumPy) and trim leading and trailing silence, keeping a little
+   padding around the speech.
+
+The result is 16-bit PCM (LINEAR16), usually a fraction of the original
+upload. Clips without any speech are flagged so the caller can reject them
+before calling the API. Uploads that cannot be decoded (no ffmpeg) are
+passed through unchanged.
+"""
+
+import io
+import shutil
+import subprocess
+import threading
+import wave
+
+import numpy as np
+
+
+TARGET_RATE = 16000
+
+
+class PreparedAudio:
+    """
+    Outcome of preprocessing one upload.
+
+    Attributes:
+        content: bytes to send to the recognizer
+        encoding: 'linear16' (16-bit PCM) or 'passthrough' (original upload)
+        sample_rate: sample rate of ``content`` (None for passthrough)
+        speech: False when the clip held nothing but silence
+        seconds_in / seconds_out: duration before and after trimming
+    """
+
+    def __init__(self, content, encoding, sample_rate=None, speech=True,
+                 seconds_in=None, seconds_out=None):
+        self.content = content
+        self.encoding = encoding
+        self.sample_rate = sample_rate
+        self.speech = speech
+        self.seconds_in = seconds_in
+        self.seconds_out = seconds_out
+
+
+def decode_wav(audio_bytes):
+    """WAV bytes -> (float32 mono samples in [-1, 1], sample rate)"""
+    with wave.open(io.BytesIO(audio_bytes), 'rb') as wav:
+        width = wav.getsampwidth()
+        channels = wav.getnchannels()
+        rate = wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(frames, dtype='<i2').astype(np.float32) / 32768
+    elif width == 4:
+        samples = np.frombuffer(frames, dtype='<i4').astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {width} bytes")
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples, rate
+
+
+def decode_ffmpeg(audio_bytes, ffmpeg_path, rate=TARGET_RATE, timeout=10):
+    """Decode any container/codec ffmpeg understands to mono ``rate`` Hz"""
+    result = subprocess.run(
+        [ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0',
+         '-ac', '1', '-ar', str(rate), '-f', 's16le', 'pipe:1'],
+        input=audio_bytes, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        timeout=timeout, check=True
+    )
+    samples = np.frombuffer(result.stdout, dtype='<i2').astype(np.float32) / 32768
+    return samples, rate
+
+
+def resample(samples, rate, target=TARGET_RATE):
+    """
+    Downsample to ``target`` Hz
+
+    Integer ratios (48 kHz, 32 kHz) average each block of samples, which
+    also filters out most of what would alias; other rates are linearly
+    interpolated.
+    """
+    if rate == target or not len(samples):
+        return samples
+    if rate % target == 0:
+        factor = rate // target
+        usable = len(samples) - len(samples) % factor
+        return samples[:usable].reshape(-1, factor).mean(axis=1)
+    duration = len(samples) / rate
+    positions = np.arange(int(duration * target)) * (rate / target)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def frame_levels(samples, rate, frame_ms=30):
+    """RMS level of each frame in dBFS"""
+    frame = max(1, int(rate * frame_ms / 1000))
+    count = len(samples) // frame
+    if not count:
+        return np.zeros(0, dtype=np.float32)
+    frames = samples[:count * frame].reshape(count, frame)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def voiced_frames(levels, floor_db=-45.0, noise_margin_db=12.0, peak_range_db=25.0):
+    """
+    Mark frames that carry speech
+
+    A frame is voiced when it is louder than ``floor_db`` and louder than
+    the clip's noise floor (10th percentile level) by ``noise_margin_db``.
+    The second condition is capped at ``peak_range_db`` below the loudest
+    frame, so a clip that is speech from end to end is not cut into.
+
+    A clip whose loudest frame is not ``noise_margin_db`` above its noise
+    floor has no speech in it at all (steady noise, hum, silence).
+    """
+    if not len(levels):
+        return np.zeros(0, dtype=bool)
+    noise_floor = np.percentile(levels, 10)
+    if levels.max() - noise_floor < noise_margin_db:
+        return np.zeros(len(levels), dtype=bool)
+    threshold = max(floor_db, min(noise_floor + noise_margin_db,
+                                  levels.max() - peak_range_db))
+    return levels > threshold
+
+
+class AudioPreprocessor:
+    """
+    Decode, downsample and silence-trim speech uploads.
+
+    Args:
+        target_rate: sample rate sent to the recognizer
+        frame_ms: VAD frame length
+        floor_db: frames below this level (dBFS) are always silence
+        noise_margin_db: how far above the noise floor speech must be
+        padding_ms: audio kept before the first and after the last voiced frame
+        min_speech_ms: clips with less voiced audio count as silence
+        ffmpeg_path: ffmpeg binary for non-WAV uploads (None: WAV only)
+    """
+
+    def __init__(self, target_rate=TARGET_RATE, frame_ms=30, floor_db=-45.0,
+                 noise_margin_db=12.0, padding_ms=200, min_speech_ms=120,
+                 ffmpeg_path=None):
+        self.target_rate = target_rate
+        self.frame_ms = frame_ms
+        self.floor_db = floor_db
+        self.noise_margin_db = noise_margin_db
+        self.padding_ms = padding_ms
+        self.min_speech_ms = min_speech_ms
+        self.ffmpeg_path = ffmpeg_path or shutil.which('ffmpeg')
+
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.passthrough = 0
+        self.rejected_silence = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds_in = 0.0
+        self.seconds_out = 0.0
+
+    def decode(self, audio_bytes):
+        """Mono samples at ``target_rate``, or None if the upload can't be decoded"""
+        try:
+            if audio_bytes[:4] == b'RIFF' and audio_bytes[8:12] == b'WAVE':
+                samples, rate = decode_wav(audio_bytes)
+            elif self.ffmpeg_path:
+                samples, rate = decode_ffmpeg(audio_bytes, self.ffmpeg_path,
+                                              self.target_rate)
+            else:
+                return None
+        except (subprocess.SubprocessError, OSError, ValueError, EOFError,
+                wave.Error) as e:
+            print(f"Error decoding audio upload: {str(e)}")
+            return None
+        return resample(samples, rate, self.target_rate)
+
+    def process(self, audio_bytes):
+        """Prepare an upload for recognition (see PreparedAudio)"""
+        samples = self.decode(audio_bytes)
+        if samples is None:
+            with self._lock:
+                self.passthrough += 1
+            return PreparedAudio(audio_bytes, 'passthrough')
+
+        rate = self.target_rate
+        voiced = voiced_frames(frame_levels(samples, rate, self.frame_ms),
+                               self.floor_db, self.noise_margin_db)
+        frame = int(rate * self.frame_ms / 1000)
+        seconds_in = len(samples) / rate
+
+        if voiced.sum() * self.frame_ms < self.min_speech_ms:
+            with self._lock:
+                self.processed += 1
+                self.rejected_silence += 1
+                self.bytes_in += len(audio_bytes)
+                self.seconds_in += seconds_in
+            return PreparedAudio(b'', 'linear16', rate, speech=False,
+                                 seconds_in=seconds_in, seconds_out=0.0)
+
+        indexes = np.flatnonzero(voiced)
+        padding = int(rate * self.padding_ms / 1000)
+        start = max(0, indexes[0] * frame - padding)
+        end = min(len(samples), (indexes[-1] + 1) * frame + padding)
+        trimmed = samples[start:end]
+
+        pcm = (np.clip(trimmed, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+        seconds_out = len(trimmed) / rate
+        with self._lock:
+            self.processed += 1
+            self.bytes_in += len(audio_bytes)
+            self.bytes_out += len(pcm)
+            self.seconds_in += seconds_in
+            self.seconds_out += seconds_out
+        return PreparedAudio(pcm, 'linear16', rate, seconds_in=seconds_in,
+                             seconds_out=seconds_out)
+
+    def stats(self):
+        """Uploads processed and how much audio trimming removed"""
+        with self._lock:
+            return {
+                "ffmpeg": bool(self.ffmpeg_path),
+                "processed": self.processed,
+                "passthrough": self.passthrough,
+                "rejected_silence": self.rejected_silence,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "seconds_in": round(self.seconds_in, 2),
+                "seconds_out": round(self.seconds_out, 2),
+            }
@@ -0,0 +1,126 @@
+"""
+Audio Artifact Store
+====================
+Content-addressed storage for synthesized audio.
+
+Each clip is written once under its SHA-256 digest (``<digest>.mp3``) and
+then referenced by URL, both in the D-ID ``/talks`` payload and in API
+responses, instead of being inlined as base64 (33% larger and copied
+several times in memory per request). A local directory stands in for an
+object store; the interface (``put`` returning an id and a URL) is what a
+bucket-backed implementation would provide.
+
+Because a clip's id is the hash of its bytes, a clip URL never changes
+content: the digest doubles as a strong HTTP ETag and clips can be cached
+indefinitely by browsers and CDNs.
+"""
+
+import hashlib
+import os
+import re
+import threading
+
+
+AUDIO_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+class AudioStore:
+    """
+    Write-once audio files addressed by content hash.
+
+    Args:
+        directory: where clips are stored
+        url_prefix: URL path the directory is served under
+        public_base_url: absolute origin external services (D-ID) can
+            reach; None when the server is not publicly reachable
+        max_bytes: total size budget; least recently stored (or stored
+            again) clips are removed first when exceeded
+        extension: file extension of stored clips
+    """
+
+    def __init__(self, directory, url_prefix='/audio', public_base_url=None,
+                 max_bytes=1024 * 1024 * 1024, extension='mp3'):
+        self.directory = directory
+        self.url_prefix = url_prefix.rstrip('/')
+        self.public_base_url = public_base_url.rstrip('/') if public_base_url else None
+        self.max_bytes = max_bytes
+        self.extension = extension
+
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._bytes = sum(size for _, size, _ in self._files())
+
+    @staticmethod
+    def digest(audio_bytes):
+        return hashlib.sha256(audio_bytes).hexdigest()
+
+    def put(self, audio_bytes):
+        """
+        Store a clip. A clip already present is only marked as recently
+        used (its mtime, which eviction goes by). Returns its id (digest)
+        """
+        audio_id = self.digest(audio_bytes)
+        path = self.path_for(audio_id)
+        try:
+            os.utime(path)
+            return audio_id
+        except FileNotFoundError:
+            pass
+
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(audio_bytes)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._bytes += len(audio_bytes)
+            over_budget = self._bytes > self.max_bytes
+        if over_budget:
+            self._evict(keep=audio_id)
+        return audio_id
+
+    @staticmethod
+    def valid_id(audio_id):
+        """Whether ``audio_id`` looks like a clip id (guards file paths)"""
+        return bool(AUDIO_ID_PATTERN.match(audio_id or ''))
+
+    def exists(self, audio_id):
+        return os.path.exists(self.path_for(audio_id))
+
+    def path_for(self, audio_id):
+        return os.path.join(self.directory, f"{audio_id}.{self.extension}")
+
+    def url_for(self, audio_id):
+        """Relative URL for browsers"""
+        return f"{self.url_prefix}/{audio_id}.{self.extension}"
+
+    def public_url_for(self, audio_id):
+        """Absolute URL for external services, or None if not configured"""
+        if not self.public_base_url:
+            return None
+        return f"{self.public_base_url}{self.url_for(audio_id)}"
+
+    def _files(self):
+        suffix = '.' + self.extension
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(suffix):
+                stat = entry.stat()
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def _evict(self, keep):
+        """Remove oldest clips until under budget (never the newest one)"""
+        keep_path = self.path_for(keep)
+        files = sorted(self._files(), key=lambda item: item[2])
+        total = sum(size for _, size, _ in files)
+        for path, size, _ in files:
+            if total <= self.max_bytes:
+                break
+            if path == keep_path:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
+        with self._lock:
+            self._bytes = total
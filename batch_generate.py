@@ -0,0 +1,112 @@
+"""
+Batch Avatar Clip Generator
+===========================
+Command-line entry point for bulk avatar content (announcements, event
+greetings, ...). Runs the same batch jobs as ``POST /api/batch-jobs``
+in-process, with the credentials from .env, and prints progress until the
+job is finished.
+
+Scripts come from a JSON file (a list of strings or of objects with
+'text' and optional 'name', 'language_code', 'voice_name', or
+{"scripts": [...]}) or a text file with one script per line.
+
+Usage:
+    python batch_generate.py announcements.json
+    python batch_generate.py greetings.txt --concurrency 5
+    python batch_generate.py --resume 3f2a9c1b7d4e   # continue an interrupted job
+    python batch_generate.py --list
+
+Clips and manifest.json are written to static/video/batch/<job_id>/.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+
+def load_scripts(path):
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.json'):
+            data = json.load(f)
+            return data.get('scripts') if isinstance(data, dict) else data
+        return [line.strip() for line in f if line.strip()]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Render scripts into avatar videos")
+    parser.add_argument('scripts', nargs='?', help="JSON or text file with the scripts")
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help="scripts rendered at once (default BATCH_CONCURRENCY)")
+    parser.add_argument('--resume', metavar='JOB_ID',
+                        help="resume a job, retrying scripts that failed")
+    parser.add_argument('--list', action='store_true', help="list jobs and exit")
+    parser.add_argument('--interval', type=float, default=2.0,
+                        help="seconds between progress lines")
+    args = parser.parse_args(argv)
+    if not (args.scripts or args.resume or args.list):
+        parser.error("give a scripts file, --resume JOB_ID or --list")
+    return args
+
+
+def print_progress(job):
+    counts = job['counts']
+    print(f"[{time.strftime('%H:%M:%S')}] {job['job_id']}: "
+          f"{counts['done']}/{counts['total']} done, {counts['failed']} failed, "
+          f"{counts['rendering']} rendering, {counts['audio'] + counts['pending']} waiting")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scripts = load_scripts(args.scripts) if args.scripts else None
+
+    # app.py resolves static/ relative to the working directory; only this
+    # job should run here, not every unfinished one
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    os.environ.setdefault('BATCH_RESUME_ON_START', 'false')
+    from app import batch_jobs
+
+    if args.list:
+        for job in batch_jobs.list():
+            print_progress(job)
+        return 0
+
+    if args.resume:
+        if batch_jobs.get(args.resume) is None:
+            print(f"Unknown job: {args.resume}")
+            return 1
+        job_id = args.resume
+        thread = batch_jobs.start(job_id, retry_failed=True)
+        if thread is None:
+            print(f"Job {job_id} is finished or already running elsewhere")
+            print_progress(batch_jobs.get(job_id))
+            return 1
+    else:
+        try:
+            job_id = batch_jobs.submit(scripts, args.concurrency)['job_id']
+        except ValueError as e:
+            print(f"Error: {str(e)}")
+            return 1
+        thread = batch_jobs.start(job_id)
+        print(f"Started job {job_id} ({len(scripts)} scripts)")
+
+    last = None
+    while thread is not None and thread.is_alive():
+        thread.join(args.interval)
+        job = batch_jobs.get(job_id)
+        if job['counts'] != last:
+            print_progress(job)
+            last = job['counts']
+
+    job = batch_jobs.get(job_id)
+    print_progress(job)
+    for item in job['items']:
+        if item['status'] == 'failed':
+            print(f"  failed: {item['base']}: {item['error']}")
+    print(f"Manifest: static/video/batch/{job_id}/manifest.json")
+    return 1 if job['counts']['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
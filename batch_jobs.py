@@ -0,0 +1,481 @@
+"""
+Batch Avatar Content Generation
+===============================
+Renders a list of scripts (announcements, greetings, ...) into avatar
+videos without anyone driving the API clip by clip.
+
+Each script goes through TTS -> D-ID talk -> download, with a bounded
+number of scripts in flight per job. Every step is persisted to
+``<directory>/<job_id>/job.json`` as it completes, so a job interrupted by
+a restart resumes where it stopped: synthesized audio is not synthesized
+again and talks already created at D-ID are picked up by their talk_id
+instead of being created twice.
+
+Rate limits: when D-ID or TTS answers 429 (or 5xx, or the connection
+fails) after the client's own retries, or the local upstream limits shed
+the call, every worker of every job pauses (honouring Retry-After) and the
+step is retried, up to ``max_attempts``.
+
+Finished clips (MP4 + MP3) are written next to the job state, with a
+``manifest.json`` listing them.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from upstream_limits import Overloaded
+
+
+# Item steps, in order; 'failed' items keep the last error
+ITEM_STATUSES = ('pending', 'audio', 'rendering', 'done', 'failed')
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+MAX_SCRIPT_CHARS = 5000  # Google TTS request limit
+
+# An empty or unreadable job lock is left alone for this long (its owner
+# may still be writing it) before it is taken over
+LOCK_GRACE_SECONDS = 30
+
+
+def slugify(text, limit=40):
+    slug = re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-')
+    return slug[:limit].rstrip('-') or 'clip'
+
+
+def parse_scripts(scripts):
+    """
+    Normalize a script list: strings or objects with 'text' and optional
+    'name', 'language_code', 'voice_name'
+
+    Raises: ValueError for an empty or invalid list
+    """
+    if not isinstance(scripts, list) or not scripts:
+        raise ValueError("No scripts provided")
+
+    parsed = []
+    for index, script in enumerate(scripts):
+        if isinstance(script, str):
+            script = {"text": script}
+        if not isinstance(script, dict):
+            raise ValueError(f"Script {index} must be a string or an object")
+        text = (script.get('text') or '').strip()
+        if not text:
+            raise ValueError(f"Script {index} has no text")
+        if len(text) > MAX_SCRIPT_CHARS:
+            raise ValueError(f"Script {index} is longer than {MAX_SCRIPT_CHARS} characters")
+        parsed.append({
+            "text": text,
+            "name": slugify(script.get('name') or text),
+            "language_code": script.get('language_code'),
+            "voice_name": script.get('voice_name'),
+        })
+    return parsed
+
+
+def retry_delay(error):
+    """
+    Seconds to wait before retrying after ``error`` (0 when a retry would
+    not help, None when the server did not say)
+    """
+    if isinstance(error, Overloaded):
+        return error.retry_after
+    if isinstance(error, requests.exceptions.HTTPError):
+        response = error.response
+        if response is None or response.status_code not in RETRY_STATUSES:
+            return 0
+        try:
+            return float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            return None
+    if isinstance(error, (requests.exceptions.ConnectionError,
+                          requests.exceptions.Timeout)):
+        return None
+    return 0
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class BatchJobs:
+    """
+    Persistent batch jobs.
+
+    Args:
+        directory: where job folders (state, media, manifest) are written
+        url_prefix: URL path ``directory`` is served under
+        synthesize: callable(text, language_code, voice_name) ->
+            (MP3 bytes, {"language_code": ..., "voice_name": ...})
+        create_talk: callable(MP3 bytes) -> D-ID talk_id
+        save_video: callable(talk_id, path) -> final talk state (dict with
+            'status' and 'error'; 'done' once the MP4 was written)
+        concurrency: default scripts in flight per job
+        max_attempts: tries per step on rate limits and transient errors
+        backoff: base pause (seconds) after a rate-limited step
+        max_scripts: largest accepted job
+    """
+
+    def __init__(self, directory, url_prefix, synthesize, create_talk, save_video,
+                 concurrency=3, max_attempts=4, backoff=5.0, max_scripts=200):
+        self.directory = directory
+        self.url_prefix = url_prefix.rstrip('/')
+        self.synthesize = synthesize
+        self.create_talk = create_talk
+        self.save_video = save_video
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_scripts = max_scripts
+
+        self._jobs = {}       # job_id -> state dict (jobs run by this process)
+        self._threads = {}    # job_id -> runner thread
+        self._lock = threading.Lock()
+        self._pause_until = 0.0
+        self.rate_limited = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # Jobs
+    # ------------------------------------------------------------------
+
+    def submit(self, scripts, concurrency=None):
+        """
+        Create a job for a script list and start it
+
+        Raises: ValueError for an invalid script list
+        Returns: job summary
+        """
+        items = parse_scripts(scripts)
+        if len(items) > self.max_scripts:
+            raise ValueError(f"At most {self.max_scripts} scripts per job")
+
+        job_id = uuid.uuid4().hex[:12]
+        width = len(str(len(items)))
+        state = {
+            "job_id": job_id,
+            "status": "queued",
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "concurrency": max(1, min(int(concurrency or self.concurrency), 16)),
+            "items": [
+                dict(item, index=index, base=f"{index:0{width}d}-{item['name']}",
+                     status='pending', audio=None, video=None, talk_id=None,
+                     error=None, attempts=0)
+                for index, item in enumerate(items)
+            ],
+        }
+        os.makedirs(self._job_dir(job_id), exist_ok=True)
+        with self._lock:
+            self._jobs[job_id] = state
+            self._save(state)
+        self.start(job_id)
+        return self.get(job_id)
+
+    def start(self, job_id, retry_failed=False):
+        """
+        Run (or resume) a job on a background thread
+
+        Returns: the runner thread, or None if the job is unknown, already
+        finished (unless ``retry_failed``) or run by another process
+        """
+        with self._lock:
+            thread = self._threads.get(job_id)
+            if thread is not None and thread.is_alive():
+                return thread
+
+            state = self._jobs.get(job_id) or self._load(job_id)
+            if state is None:
+                return None
+            failed = [item for item in state['items'] if item['status'] == 'failed']
+            if state['status'] == 'completed' and not (retry_failed and failed):
+                return None
+            if not self._claim(job_id):
+                return None
+
+            if retry_failed:
+                for item in failed:
+                    # Start over from the last step that produced something;
+                    # a talk already created is polled again, not paid twice
+                    if item['talk_id']:
+                        status = 'rendering'
+                    else:
+                        status = 'audio' if item['audio'] else 'pending'
+                    item.update(status=status, error=None, attempts=0)
+            state.update(status='running', finished_at=None)
+            state['started_at'] = state['started_at'] or time.time()
+            self._jobs[job_id] = state
+            self._save(state)
+
+            thread = threading.Thread(target=self._run, args=(job_id,),
+                                      name=f"batch-{job_id}", daemon=True)
+            self._threads[job_id] = thread
+        thread.start()
+        return thread
+
+    def resume_all(self):
+        """Resume every unfinished job (e.g. after a restart). Returns their ids"""
+        resumed = []
+        for job_id in sorted(os.listdir(self.directory)):
+            state = self._load(job_id)
+            if state and state['status'] in ('queued', 'running') and self.start(job_id):
+                resumed.append(job_id)
+        return resumed
+
+    def get(self, job_id):
+        """Job state with per-item progress and clip URLs, or None"""
+        with self._lock:
+            state = self._jobs.get(job_id)
+            if state is None:
+                state = self._load(job_id)
+            if state is None:
+                return None
+            state = json.loads(json.dumps(state))
+
+        for item in state['items']:
+            item['video_url'] = self._url(job_id, item['video'])
+            item['audio_url'] = self._url(job_id, item['audio'])
+        state['counts'] = self._counts(state)
+        state['manifest_url'] = self._url(job_id, 'manifest.json')
+        return state
+
+    def list(self):
+        """Summaries of all jobs, newest first"""
+        jobs = []
+        for job_id in os.listdir(self.directory):
+            state = self.get(job_id)
+            if state:
+                jobs.append({key: state[key] for key in
+                             ('job_id', 'status', 'created_at', 'finished_at', 'counts')})
+        return sorted(jobs, key=lambda job: job['created_at'], reverse=True)
+
+    def stats(self):
+        with self._lock:
+            running = sum(1 for thread in self._threads.values() if thread.is_alive())
+            return {
+                "running": running,
+                "rate_limited": self.rate_limited,
+                "paused_seconds": round(max(0.0, self._pause_until - time.time()), 1),
+            }
+
+    # ------------------------------------------------------------------
+    # Running
+    # ------------------------------------------------------------------
+
+    def _run(self, job_id):
+        state = self._jobs[job_id]
+        pending = [item for item in state['items'] if item['status'] not in ('done', 'failed')]
+        try:
+            with ThreadPoolExecutor(max_workers=state['concurrency'],
+                                    thread_name_prefix=f"batch-{job_id}") as pool:
+                list(pool.map(lambda item: self._process(job_id, item), pending))
+        except Exception as e:
+            print(f"Error in batch job {job_id}: {str(e)}")
+        finally:
+            with self._lock:
+                state.update(status='completed', finished_at=time.time())
+                self._save(state)
+                self._write_manifest(state)
+                self._release(job_id)
+
+    def _process(self, job_id, item):
+        """Take one script through the remaining steps, retrying transient errors"""
+        while True:
+            self._wait_if_paused()
+            try:
+                self._step(job_id, item)
+                if item['status'] == 'done':
+                    return
+            except Exception as e:
+                delay = retry_delay(e)
+                with self._lock:
+                    item['attempts'] += 1
+                    item['error'] = str(e)
+                    if delay == 0 or item['attempts'] >= self.max_attempts:
+                        item['status'] = 'failed'
+                        print(f"Error in batch job {job_id}, script {item['index']}: {str(e)}")
+                    else:
+                        # Back off every worker, not just this one
+                        delay = delay or self.backoff * (2 ** (item['attempts'] - 1))
+                        self._pause_until = max(self._pause_until, time.time() + delay)
+                        self.rate_limited += 1
+                    self._save(self._jobs[job_id])
+                if item['status'] == 'failed':
+                    return
+
+    def _step(self, job_id, item):
+        """Run the next step of an item and persist the result"""
+        job_dir = self._job_dir(job_id)
+
+        if item['status'] == 'pending':
+            audio_content, voice = self.synthesize(
+                item['text'], item['language_code'], item['voice_name']
+            )
+            self._write(os.path.join(job_dir, f"{item['base']}.mp3"), audio_content)
+            self._update(job_id, item, status='audio', audio=f"{item['base']}.mp3", **voice)
+
+        elif item['status'] == 'audio':
+            with open(os.path.join(job_dir, item['audio']), 'rb') as f:
+                audio_content = f.read()
+            talk_id = self.create_talk(audio_content)
+            if not talk_id:
+                raise RuntimeError("D-ID did not return a talk id")
+            self._update(job_id, item, status='rendering', talk_id=talk_id)
+
+        elif item['status'] == 'rendering':
+            video = f"{item['base']}.mp4"
+            talk = self.save_video(item['talk_id'], os.path.join(job_dir, video))
+            if talk and talk['status'] == 'done':
+                self._update(job_id, item, status='done', video=video, error=None)
+                with self._lock:
+                    self._write_manifest(self._jobs[job_id])
+            elif talk and talk['status'] in ('error', 'rejected'):
+                # The render itself failed; only a new talk can fix that
+                self._update(job_id, item, talk_id=None)
+                raise RuntimeError(talk.get('error') or f"Talk {talk['status']}")
+            else:
+                raise RuntimeError(f"Talk {item['talk_id']} did not finish in time")
+
+    def _wait_if_paused(self):
+        while True:
+            with self._lock:
+                remaining = self._pause_until - time.time()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, 1.0))
+
+    def _update(self, job_id, item, **changes):
+        with self._lock:
+            item.update(changes)
+            self._save(self._jobs[job_id])
+
+    # ------------------------------------------------------------------
+    # Persistence (caller holds the lock where state is shared)
+    # ------------------------------------------------------------------
+
+    def _job_dir(self, job_id):
+        return os.path.join(self.directory, job_id)
+
+    def _url(self, job_id, name):
+        return f"{self.url_prefix}/{job_id}/{name}" if name else None
+
+    def _load(self, job_id):
+        if not re.fullmatch(r'[0-9a-f]{12}', job_id or ''):
+            return None
+        try:
+            with open(os.path.join(self._job_dir(job_id), 'job.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, state):
+        data = json.dumps(state, indent=2).encode('utf-8')
+        self._write(os.path.join(self._job_dir(state['job_id']), 'job.json'), data)
+
+    def _write_manifest(self, state):
+        clips = [
+            {
+                "index": item['index'],
+                "name": item['name'],
+                "text": item['text'],
+                "language_code": item['language_code'],
+                "voice_name": item['voice_name'],
+                "video": item['video'],
+                "audio": item['audio'],
+                "video_url": self._url(state['job_id'], item['video']),
+                "talk_id": item['talk_id'],
+            }
+            for item in state['items'] if item['status'] == 'done'
+        ]
+        manifest = {
+            "job_id": state['job_id'],
+            "created_at": state['created_at'],
+            "finished_at": state['finished_at'],
+            "counts": self._counts(state),
+            "clips": clips,
+        }
+        data = json.dumps(manifest, indent=2, ensure_ascii=False).encode('utf-8')
+        self._write(os.path.join(self._job_dir(state['job_id']), 'manifest.json'), data)
+
+    @staticmethod
+    def _counts(state):
+        counts = {status: 0 for status in ITEM_STATUSES}
+        for item in state['items']:
+            counts[item['status']] += 1
+        counts['total'] = len(state['items'])
+        return counts
+
+    @staticmethod
+    def _write(path, content):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def _claim(self, job_id):
+        """
+        Take the job's lock file so only one process (server worker or CLI)
+        runs it; locks of dead processes are taken over
+
+        The pid is written to a temporary file that is then hard-linked into
+        place, so the lock never exists without its owner. A lock that is
+        empty or unreadable anyway counts as held for LOCK_GRACE_SECONDS.
+        """
+        lock_path = os.path.join(self._job_dir(job_id), 'lock')
+        tmp_path = f"{lock_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(str(os.getpid()))
+        try:
+            for _ in range(2):
+                try:
+                    os.link(tmp_path, lock_path)
+                    return True
+                except FileExistsError:
+                    pass
+                try:
+                    with open(lock_path) as f:
+                        owner = int(f.read().strip())
+                except FileNotFoundError:
+                    continue
+                except (OSError, ValueError):
+                    owner = None
+                if not owner:
+                    try:
+                        age = time.time() - os.path.getmtime(lock_path)
+                    except OSError:
+                        continue
+                    if age < LOCK_GRACE_SECONDS:
+                        return False
+                elif owner == os.getpid() or pid_alive(owner):
+                    return owner == os.getpid()
+                try:
+                    os.remove(lock_path)
+                except OSError:
+                    pass
+            return False
+        finally:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def _release(self, job_id):
+        try:
+            os.remove(os.path.join(self._job_dir(job_id), 'lock'))
+        except OSError:
+            pass
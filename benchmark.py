@@ -0,0 +1,530 @@
+"""
+Offline Benchmark
+=================
+Load test for the receptionist pipeline with every upstream replaced by a
+local fake (see fakes.py). Speech-to-Text, Text-to-Speech and Gemini run
+in-process with configurable latency distributions, and D-ID is served by
+a stub HTTP server, so no network access or API keys are needed.
+
+The app is served by a threaded WSGI server on a free local port and
+driven over HTTP by a fixed number of concurrent clients. The report
+shows throughput and p50/p95/p99 latency per endpoint, mean time per
+pipeline stage, and how saturated the server and each upstream were.
+
+Usage:
+    python benchmark.py                                  # complete flow, 8 clients
+    python benchmark.py --scenario chat --concurrency 32 --requests 500
+    python benchmark.py --gemini-latency lognormal:0.9,0.4 --output baseline.json
+    python benchmark.py --baseline baseline.json         # compare after a change
+    python benchmark.py --response-cache                 # measure cache hits
+
+Latencies are seconds or a distribution: uniform:a,b, normal:mean,sd,
+lognormal:median,sigma.
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import fakes
+
+
+# Environment for importing app.py with offline fakes
+FAKE_ENVIRONMENT = {
+    'STT_BACKEND': 'fake',
+    'TTS_BACKEND': 'fake',
+    'GEMINI_BACKEND': 'fake',
+    'DID_API_KEY': 'benchmark',
+    'TTS_CACHE_DISK': 'false',
+    'VIDEO_CACHE_DOWNLOAD': 'false',
+    'SESSION_STORE_URL': '',
+    'CLIENT_WARMUP': 'false',
+    # The fake transcript is a frequent question; measure the full pipeline
+    'FAQ_ENABLED': 'false',
+    # Every client asks the same question; a cache hit would skip Gemini
+    'RESPONSE_CACHE_ENABLED': 'false',
+}
+
+# Placeholder recording uploaded to the speech endpoints
+FAKE_AUDIO = b'\x1aE\xdf\xa3' + b'\x00' * 16 * 1024
+
+SCENARIOS = ('complete-flow', 'pipelined', 'chat')
+
+
+# ----------------------------------------------------------------------
+# Measurement
+# ----------------------------------------------------------------------
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Recorder:
+    """Latency samples and error counts per endpoint"""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, ok=True):
+        with self._lock:
+            self.samples.setdefault(name, [])
+            self.errors.setdefault(name, 0)
+            if ok:
+                self.samples[name].append(seconds)
+            else:
+                self.errors[name] += 1
+
+    def summary(self, elapsed):
+        results = {}
+        with self._lock:
+            for name, values in self.samples.items():
+                values = sorted(values)
+                count = len(values)
+                results[name] = {
+                    "count": count,
+                    "errors": self.errors[name],
+                    "throughput": round(count / elapsed, 2) if elapsed else 0.0,
+                    "mean_ms": round(1000 * sum(values) / count, 1) if count else 0.0,
+                    "p50_ms": round(1000 * percentile(values, 50), 1),
+                    "p95_ms": round(1000 * percentile(values, 95), 1),
+                    "p99_ms": round(1000 * percentile(values, 99), 1),
+                    "max_ms": round(1000 * values[-1], 1) if count else 0.0,
+                }
+        return results
+
+
+class ActiveRequests:
+    """WSGI middleware counting requests in progress (incl. streamed bodies)"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def _change(self, delta):
+        with self._lock:
+            self.active += delta
+
+    def __call__(self, environ, start_response):
+        self._change(1)
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except Exception:
+            self._change(-1)
+            raise
+        return _CountedBody(body, lambda: self._change(-1))
+
+
+class _CountedBody:
+    def __init__(self, body, on_close):
+        self.body = body
+        self.on_close = on_close
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.body)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self.on_close()
+
+
+class SaturationSampler:
+    """Periodically samples server and upstream concurrency"""
+
+    def __init__(self, app_module, active_requests, interval=0.05):
+        self.app = app_module
+        self.active_requests = active_requests
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            upstreams = self.app.upstream_limits.stats()
+            self.samples.append({
+                "active_requests": self.active_requests.active,
+                "tts_queue": self.app.tts_executor._work_queue.qsize(),
+                "talks_in_flight": self.app.talk_tracker.stats()['in_flight'],
+                "upstreams": {
+                    name: (s['in_flight'], s['limit']) for name, s in upstreams.items()
+                },
+            })
+
+    def summary(self, concurrency):
+        if not self.samples:
+            return {}
+
+        def describe(values, limit=None):
+            result = {
+                "mean": round(sum(values) / len(values), 2),
+                "peak": max(values),
+            }
+            if limit:
+                at_limit = sum(1 for value in values if value >= limit)
+                result["limit"] = limit
+                result["at_limit_pct"] = round(100.0 * at_limit / len(values), 1)
+            return result
+
+        summary = {
+            "active_requests": describe(
+                [s['active_requests'] for s in self.samples], concurrency
+            ),
+            "tts_queue": describe([s['tts_queue'] for s in self.samples]),
+            "talks_in_flight": describe([s['talks_in_flight'] for s in self.samples]),
+        }
+        for name in self.samples[0]['upstreams']:
+            limit = self.samples[0]['upstreams'][name][1]
+            summary[f"upstream_{name}"] = describe(
+                [s['upstreams'][name][0] for s in self.samples], limit
+            )
+        return summary
+
+
+# ----------------------------------------------------------------------
+# Scenarios
+# ----------------------------------------------------------------------
+
+def wait_for_video(http, base_url, talk_id, started, recorder, args):
+    """Poll the status endpoint until the talk finishes"""
+    deadline = time.time() + args.video_timeout
+    while time.time() < deadline:
+        time.sleep(args.poll_interval)
+        t0 = time.perf_counter()
+        try:
+            response = http.get(f"{base_url}/api/check-video-status/{talk_id}", timeout=30)
+            data = response.json()
+        except (requests.RequestException, ValueError):
+            recorder.record('check-video-status', 0, ok=False)
+            continue
+        recorder.record('check-video-status', time.perf_counter() - t0, response.ok)
+
+        if data.get('status') == 'completed':
+            recorder.record('video-ready', time.perf_counter() - started)
+            return
+        if data.get('status') == 'error':
+            break
+    recorder.record('video-ready', 0, ok=False)
+
+
+def run_complete_flow(http, base_url, session_id, recorder, args):
+    started = time.perf_counter()
+    response = http.post(
+        f"{base_url}/api/complete-flow",
+        files={'audio': ('recording.webm', FAKE_AUDIO, 'audio/webm')},
+        data={'session_id': session_id},
+        timeout=120,
+    )
+    recorder.record('complete-flow', time.perf_counter() - started, response.ok)
+    if not response.ok or not args.wait_video:
+        return
+
+    data = response.json()
+    if data.get('status') == 'completed':
+        recorder.record('video-ready', time.perf_counter() - started)
+    elif data.get('talk_id'):
+        wait_for_video(http, base_url, data['talk_id'], started, recorder, args)
+
+
+def run_pipelined(http, base_url, session_id, recorder, args):
+    started = time.perf_counter()
+    response = http.post(
+        f"{base_url}/api/complete-flow",
+        files={'audio': ('recording.webm', FAKE_AUDIO, 'audio/webm')},
+        data={'session_id': session_id, 'mode': 'pipelined',
+              'avatar': 'true' if args.wait_video else 'false'},
+        stream=True,
+        timeout=120,
+    )
+    if not response.ok:
+        recorder.record('pipelined', 0, ok=False)
+        return
+
+    first_audio = True
+    done = None
+    for line in response.iter_lines():
+        if not line.startswith(b'data: '):
+            continue
+        event = json.loads(line[len(b'data: '):])
+        if event['type'] == 'audio' and first_audio:
+            recorder.record('first-audio', time.perf_counter() - started)
+            first_audio = False
+        elif event['type'] in ('done', 'error'):
+            done = event
+    recorder.record('pipelined', time.perf_counter() - started,
+                    ok=bool(done) and done['type'] == 'done')
+
+    if done and done.get('talk_id') and args.wait_video:
+        wait_for_video(http, base_url, done['talk_id'], started, recorder, args)
+
+
+def run_chat(http, base_url, session_id, recorder, args):
+    started = time.perf_counter()
+    response = http.post(
+        f"{base_url}/api/chat",
+        json={'message': 'What are your office hours?', 'session_id': session_id},
+        timeout=120,
+    )
+    recorder.record('chat', time.perf_counter() - started, response.ok)
+
+
+SCENARIO_RUNNERS = {
+    'complete-flow': run_complete_flow,
+    'pipelined': run_pipelined,
+    'chat': run_chat,
+}
+
+
+# ----------------------------------------------------------------------
+# Harness
+# ----------------------------------------------------------------------
+
+def load_app(args):
+    """Import app.py with fakes in place of every upstream"""
+    if args.faq:
+        os.environ['FAQ_ENABLED'] = 'true'
+    if args.response_cache:
+        os.environ['RESPONSE_CACHE_ENABLED'] = 'true'
+    for name, value in FAKE_ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+
+    import app
+    from did_client import DIDClient
+    from tts_cache import TTSCache
+    from video_cache import VideoCache
+
+    app.speech_client.latency = fakes.latency(args.stt_latency)
+    app.tts_client.latency = fakes.latency(args.tts_latency)
+    app.chat_model.latency = fakes.latency(args.gemini_latency)
+    app.chat_model.chunk_latency = fakes.latency(args.gemini_chunk_latency)
+
+    if not args.repeat_replies:
+        # Distinct replies, so the TTS and video caches do not hide upstream cost
+        counter = itertools.count(1)
+        template = app.chat_model.reply
+        app.chat_model.reply = lambda message: f"{template} (Ref {next(counter)}.)"
+
+    stub = fakes.StubDIDServer(
+        render_seconds=fakes.latency(args.did_render),
+        latency=fakes.latency(args.did_latency),
+    ).start()
+    app.clients.inject('did', DIDClient(
+        api_key='benchmark', base_url=stub.url, pool_size=max(20, args.concurrency)
+    ))
+
+    # Keep benchmark media out of the real caches
+    scratch = tempfile.mkdtemp(prefix='receptionist-benchmark-')
+    app.tts_cache = TTSCache(disk_dir=None)
+    app.video_cache = VideoCache(
+        index_path=os.path.join(scratch, 'index.json'),
+        video_dir=scratch,
+        url_prefix='/video/cache',
+    )
+    return app, stub, scratch
+
+
+def serve(wsgi_app):
+    """Serve the app on a free local port from a background thread"""
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)  # no per-request log lines
+    server = make_server('127.0.0.1', 0, wsgi_app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name='bench-server', daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def run(args):
+    app, stub, scratch = load_app(args)
+    active_requests = ActiveRequests(app.app.wsgi_app)
+    app.app.wsgi_app = active_requests
+    server, base_url = serve(app.app)
+
+    runner = SCENARIO_RUNNERS[args.scenario]
+    recorder = Recorder()
+    issued = itertools.count()
+    deadline = time.time() + args.duration if args.duration else None
+
+    def client(worker):
+        http = requests.Session()
+        local = 0
+        while True:
+            if deadline is not None:
+                if time.time() >= deadline:
+                    break
+            elif next(issued) >= args.requests:
+                break
+            session_id = f"bench-{worker}-{local // args.turns}"
+            local += 1
+            try:
+                runner(http, base_url, session_id, recorder, args)
+            except (requests.RequestException, ValueError) as e:
+                print(f"Error in benchmark request: {str(e)}")
+                recorder.record(args.scenario, 0, ok=False)
+        http.close()
+
+    sampler = SaturationSampler(app, active_requests).start()
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(client, range(args.concurrency)))
+    finally:
+        elapsed = time.perf_counter() - started
+        sampler.stop()
+        server.shutdown()
+        app.talk_tracker.stop()
+        stub.stop()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    stages = {
+        labels[0]: {"calls": count, "mean_ms": round(1000 * total / count, 1)}
+        for labels, (count, total) in sorted(app.metrics.stage_seconds.totals().items())
+        if count
+    }
+    return {
+        "config": vars(args),
+        "elapsed_s": round(elapsed, 2),
+        "endpoints": recorder.summary(elapsed),
+        "stages": stages,
+        "saturation": sampler.summary(args.concurrency),
+    }
+
+
+# ----------------------------------------------------------------------
+# Reporting
+# ----------------------------------------------------------------------
+
+def delta(current, previous):
+    if not previous:
+        return ''
+    return f"{100.0 * (current - previous) / previous:+.0f}%"
+
+
+def print_report(results, baseline=None):
+    config = results['config']
+    print(f"\nScenario {config['scenario']}: concurrency {config['concurrency']}, "
+          f"{results['elapsed_s']} s")
+
+    base_endpoints = (baseline or {}).get('endpoints', {})
+    print(f"\n{'endpoint':<20}{'count':>7}{'errors':>8}{'req/s':>8}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, stats in results['endpoints'].items():
+        print(f"{name:<20}{stats['count']:>7}{stats['errors']:>8}{stats['throughput']:>8}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+              f"{stats['max_ms']:>10}")
+        previous = base_endpoints.get(name)
+        if previous:
+            print(f"{'  vs baseline':<35}"
+                  f"{delta(stats['throughput'], previous['throughput']):>8}"
+                  f"{delta(stats['p50_ms'], previous['p50_ms']):>10}"
+                  f"{delta(stats['p95_ms'], previous['p95_ms']):>10}"
+                  f"{delta(stats['p99_ms'], previous['p99_ms']):>10}"
+                  f"{delta(stats['max_ms'], previous['max_ms']):>10}")
+
+    print("\nStages (mean ms per call):")
+    for name, stats in results['stages'].items():
+        print(f"  {name:<20}{stats['mean_ms']:>10}  ({stats['calls']} calls)")
+
+    print("\nSaturation (sampled every 50 ms):")
+    for name, stats in results['saturation'].items():
+        line = f"  {name:<20} mean {stats['mean']:<8} peak {stats['peak']}"
+        if 'limit' in stats:
+            line += f"  (limit {stats['limit']}, at limit {stats['at_limit_pct']}% of the time)"
+        print(line)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Offline load test with fake Google, Gemini and D-ID backends"
+    )
+    parser.add_argument('--scenario', choices=SCENARIOS, default='complete-flow')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help="concurrent clients")
+    parser.add_argument('--requests', type=int, default=100,
+                        help="total requests (ignored with --duration)")
+    parser.add_argument('--duration', type=float, default=None,
+                        help="run for this many seconds instead of a request count")
+    parser.add_argument('--turns', type=int, default=1,
+                        help="requests per conversation session")
+    parser.add_argument('--no-video', dest='wait_video', action='store_false',
+                        help="do not wait for avatar videos")
+    parser.add_argument('--poll-interval', type=float, default=1.0,
+                        help="seconds between video status polls")
+    parser.add_argument('--video-timeout', type=float, default=120.0)
+    parser.add_argument('--repeat-replies', action='store_true',
+                        help="identical Gemini replies (measures cache hits)")
+    parser.add_argument('--faq', action='store_true',
+                        help="answer the (frequent) fake question from the FAQ bank")
+    parser.add_argument('--response-cache', action='store_true',
+                        help="answer the repeated fake question from the response cache")
+
+    parser.add_argument('--stt-latency', default='lognormal:0.6,0.3')
+    parser.add_argument('--gemini-latency', default='lognormal:1.0,0.4',
+                        help="time to the first reply chunk")
+    parser.add_argument('--gemini-chunk-latency', default='0.05',
+                        help="time between streamed reply chunks")
+    parser.add_argument('--tts-latency', default='lognormal:0.3,0.3')
+    parser.add_argument('--did-latency', default='uniform:0.05,0.15',
+                        help="D-ID API response time")
+    parser.add_argument('--did-render', default='lognormal:3.0,0.3',
+                        help="D-ID video render time")
+
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--baseline', help="compare against a previous --output file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = run(args)
+    print_report(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    failed = sum(stats['errors'] for stats in results['endpoints'].values())
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""
+Upstream Circuit Breakers
+=========================
+Stops calling an upstream API that keeps failing, for a cool-down period.
+
+When at least ``failure_threshold`` calls failed within the last
+``window`` seconds, and they are at least ``failure_ratio`` of the calls
+in that window, the breaker opens: calls are refused at once with
+``CircuitOpen`` (a 503 with Retry-After at the web layer) instead of each
+one waiting for its own timeout. After ``reset_timeout`` seconds one probe
+call is let through (half-open); its success closes the breaker, its
+failure opens it again.
+
+Only failures that say something about the upstream's health count:
+timeouts, connection errors, 5xx and 429. Client errors (4xx) and calls
+shed locally by admission control do not.
+
+Usage:
+    breaker = CircuitBreaker('did')
+    breaker.check()            # raises CircuitOpen while open
+    try:
+        call()
+    except Exception as e:
+        breaker.record(e)
+        raise
+    breaker.record()
+"""
+
+import threading
+import time
+from collections import deque
+
+from upstream_limits import Overloaded
+
+
+class CircuitOpen(Overloaded):
+    """Raised instead of calling an upstream whose breaker is open"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(name, retry_after, 'circuit_open')
+
+
+def is_upstream_failure(error):
+    """Whether an exception counts against the upstream's health"""
+    if isinstance(error, Overloaded):
+        return False
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if status is None:
+        # google.api_core errors carry the HTTP status as .code
+        status = getattr(error, 'code', None)
+    if isinstance(status, int) and 400 <= status < 500 and status not in (408, 429):
+        return False
+    return True
+
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker over a sliding time window.
+
+    Args:
+        name: upstream name (reported in errors and stats)
+        failure_threshold: failures within ``window`` that open the breaker
+        reset_timeout: seconds to stay open before a probe call
+        failure_ratio: share of failed calls the window must also reach
+        window: seconds of call history considered
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, failure_ratio=0.5,
+                 window=60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failure_ratio = failure_ratio
+        self.window = window
+        self.state = 'closed'   # closed -> open -> half_open -> closed (or open)
+        self._calls = deque()   # (time, failed) within the window
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.refused = 0
+
+    def is_open(self):
+        """Whether calls would be refused now (does not start a probe)"""
+        with self._lock:
+            if self.state == 'closed':
+                return False
+            if self.state == 'open':
+                return time.monotonic() - self._opened_at < self.reset_timeout
+            return self._probing
+
+    def retry_after(self):
+        with self._lock:
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+        return max(1, round(remaining))
+
+    def check(self):
+        """Allow a call, or raise CircuitOpen"""
+        with self._lock:
+            if self.state == 'closed':
+                return
+            if self.state == 'open' and \
+                    time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self._probing:
+                # Let one probe through to test the upstream
+                self._probing = True
+                return
+            self.refused += 1
+        raise CircuitOpen(self.name, self.retry_after())
+
+    def record(self, error=None):
+        """Record the outcome of an allowed call (``error`` if it raised)"""
+        failed = error is not None and is_upstream_failure(error)
+        now = time.monotonic()
+        with self._lock:
+            self._probing = False
+            if error is not None and not failed:
+                # Says nothing about the upstream's health
+                return
+            if not failed and self.state == 'half_open':
+                # The probe succeeded: start over with a clean history
+                self.state = 'closed'
+                self._calls.clear()
+                return
+            self._calls.append((now, failed))
+            while self._calls and now - self._calls[0][0] > self.window:
+                self._calls.popleft()
+            if not failed:
+                return
+            failures = sum(1 for _, call_failed in self._calls if call_failed)
+            if self.state == 'half_open' or (
+                    self.state == 'closed' and failures >= self.failure_threshold and
+                    failures >= self.failure_ratio * len(self._calls)):
+                if self.state == 'closed':
+                    self.opened += 1
+                    print(f"Circuit breaker for {self.name} opened after "
+                          f"{failures} of {len(self._calls)} calls failed")
+                self.state = 'open'
+                self._opened_at = now
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "recent_calls": len(self._calls),
+                "recent_failures": sum(1 for _, failed in self._calls if failed),
+                "opened": self.opened,
+                "refused": self.refused,
+            }
@@ -0,0 +1,232 @@
+"""
+Upstream Client Lifecycle
+=========================
+Creates the upstream API clients (Speech-to-Text, Text-to-Speech, Gemini,
+D-ID) on first use instead of at import time, and optionally warms them
+up in the background right after boot.
+
+- ``LazyModule`` defers heavy SDK imports (google.cloud.*, generativeai)
+  until an attribute is first used.
+- ``UpstreamClients`` builds each registered client once, on the first
+  ``get()``. A build that fails is retried on the next ``get()``.
+- ``warm()`` builds every client and runs its warm-up call (e.g. waiting
+  for the gRPC channel to connect), so the first real request does not
+  pay for channel setup, TLS and auth. ``status()`` and ``ready()`` back
+  the /ready endpoint.
+- ``inject()`` swaps in a fake or preconfigured client.
+- ``proxy()`` returns a stand-in object for module-level names such as
+  ``app.tts_client``, resolved on each attribute access.
+
+Usage:
+    clients.register('tts', texttospeech.TextToSpeechClient, warm=list_voices)
+    tts_client = clients.proxy('tts')
+    clients.warm_in_background()
+"""
+
+import importlib
+import threading
+import time
+
+
+class LazyModule:
+    """Module stand-in that imports the module on first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+
+class ClientProxy:
+    """Forwards attribute access to the managed client (built on first use)"""
+
+    def __init__(self, manager, name):
+        object.__setattr__(self, '_manager', manager)
+        object.__setattr__(self, '_name', name)
+
+    def __getattr__(self, attr):
+        return getattr(self._manager.get(self._name), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._manager.get(self._name), attr, value)
+
+    def __repr__(self):
+        return f"<client proxy {self._name!r}>"
+
+
+class _Entry:
+    def __init__(self, factory, warm, required):
+        self.factory = factory
+        self.warm = warm
+        self.required = required
+        self.client = None
+        self.state = 'cold'   # cold -> ready (built) -> warm, or error
+        self.error = None
+        self.build_seconds = None
+        self.warm_seconds = None
+        self.lock = threading.Lock()
+
+
+class UpstreamClients:
+    """
+    Registry of lazily built upstream clients.
+
+    Args:
+        warmup: whether readiness waits for ``warm()`` to finish
+    """
+
+    def __init__(self, warmup=False):
+        self.warmup = warmup
+        self._entries = {}
+        self._warmup_state = 'idle'   # idle -> running -> finished
+        self._last_warmup = None
+        self._lock = threading.Lock()
+
+    def register(self, name, factory, warm=None, required=True):
+        """
+        Register a client
+
+        Args:
+            factory: zero-argument callable that builds the client
+            warm: optional callable(client) that pre-establishes its
+                connection; its errors are reported, not raised
+            required: whether /ready depends on this client
+        """
+        self._entries[name] = _Entry(factory, warm, required)
+
+    def get(self, name):
+        """The client, built on first use"""
+        entry = self._entries[name]
+        if entry.client is not None:
+            return entry.client
+        with entry.lock:
+            if entry.client is None:
+                started = time.perf_counter()
+                try:
+                    client = entry.factory()
+                except Exception as e:
+                    entry.state, entry.error = 'error', str(e)
+                    raise
+                entry.build_seconds = round(time.perf_counter() - started, 3)
+                entry.client = client
+                if entry.state in ('cold', 'error'):
+                    entry.state, entry.error = 'ready', None
+        return entry.client
+
+    def inject(self, name, client):
+        """Use ``client`` (a fake, or a preconfigured instance) from now on"""
+        entry = self._entries[name]
+        with entry.lock:
+            entry.client = client
+            entry.state, entry.error = 'injected', None
+
+    def proxy(self, name):
+        return ClientProxy(self, name)
+
+    # ------------------------------------------------------------------
+    # Warm-up and readiness
+    # ------------------------------------------------------------------
+
+    def warm(self, names=None, timeout=None):
+        """
+        Build the clients and run their warm-up calls in parallel
+
+        Returns: status() once every warm-up finished (or ``timeout`` passed)
+        """
+        with self._lock:
+            self._warmup_state = 'running'
+            self._last_warmup = time.monotonic()
+        threads = [
+            threading.Thread(target=self._warm_one, args=(name,),
+                             name=f"warm-{name}", daemon=True)
+            for name in (names or list(self._entries))
+        ]
+        for thread in threads:
+            thread.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in threads:
+            thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+        with self._lock:
+            self._warmup_state = 'finished'
+        return self.status()
+
+    def warm_in_background(self, timeout=None):
+        """Start ``warm`` on a thread (right after boot)"""
+        with self._lock:
+            self._warmup_state = 'running'
+        thread = threading.Thread(target=self.warm, kwargs={'timeout': timeout},
+                                  name='client-warmup', daemon=True)
+        thread.start()
+        return thread
+
+    def rewarm_failed(self, min_interval=30, timeout=None):
+        """
+        Retry the warm-up of failed clients in the background, at most
+        once per ``min_interval`` seconds. Returns True if a retry started
+        """
+        with self._lock:
+            if self._warmup_state == 'running':
+                return False
+            if self._last_warmup and time.monotonic() - self._last_warmup < min_interval:
+                return False
+            failed = [name for name, entry in self._entries.items() if entry.state == 'error']
+            if not failed:
+                return False
+            self._warmup_state = 'running'
+        threading.Thread(target=self.warm, kwargs={'names': failed, 'timeout': timeout},
+                         name='client-rewarm', daemon=True).start()
+        return True
+
+    def _warm_one(self, name):
+        entry = self._entries[name]
+        try:
+            client = self.get(name)
+            if entry.warm is not None and entry.state != 'injected':
+                started = time.perf_counter()
+                entry.warm(client)
+                entry.warm_seconds = round(time.perf_counter() - started, 3)
+            if entry.state in ('ready', 'error'):
+                entry.state, entry.error = 'warm', None
+        except Exception as e:
+            print(f"Error warming up {name} client: {str(e)}")
+            entry.state, entry.error = 'error', str(e)
+
+    def ready(self):
+        """
+        Whether the process should take traffic: the warm-up (if enabled)
+        finished and no required client failed
+        """
+        with self._lock:
+            if self.warmup and self._warmup_state != 'finished':
+                return False
+        return not any(
+            entry.required and entry.state == 'error'
+            for entry in self._entries.values()
+        )
+
+    def status(self):
+        with self._lock:
+            warmup = self._warmup_state
+        return {
+            "warmup": warmup,
+            "clients": {
+                name: {
+                    "state": entry.state,
+                    "required": entry.required,
+                    "build_seconds": entry.build_seconds,
+                    "warm_seconds": entry.warm_seconds,
+                    "error": entry.error,
+                }
+                for name, entry in self._entries.items()
+            },
+        }
@@ -0,0 +1,86 @@
+"""
+Request Deadlines
+=================
+A latency budget for one visitor request, split across the pipeline
+stages (STT, Gemini, TTS, D-ID).
+
+Each stage gets a share of the time that is *left* when it starts,
+weighted against the stages still to come, so time an earlier stage did
+not use rolls forward and an overrun is absorbed by the later stages.
+Stages pass their budget to the upstream client as a timeout, or use it
+to decide to skip optional work: the avatar video is left out when D-ID
+could not finish creating the talk in time.
+
+Usage:
+    deadline = Deadline(12.0)
+    speech_client.recognize(..., timeout=deadline.timeout('stt'))
+    ...
+    if deadline.budget('did') < 1.5:
+        ...  # answer with audio only
+"""
+
+import time
+
+
+# Default split of a request's budget (relative weights, in pipeline order)
+DEFAULT_SPLIT = {'stt': 0.2, 'gemini': 0.4, 'tts': 0.15, 'did': 0.25}
+
+
+def parse_split(text):
+    """'stt:0.2,gemini:0.4,...' -> dict of stage -> weight (pipeline order)"""
+    split = {}
+    for item in (text or '').split(','):
+        if ':' in item:
+            stage, weight = item.split(':', 1)
+            split[stage.strip()] = float(weight)
+    return split or dict(DEFAULT_SPLIT)
+
+
+class Deadline:
+    """
+    Time budget of one request.
+
+    Args:
+        seconds: total budget, counted from creation
+        split: dict of stage -> relative weight, in pipeline order
+        min_timeout: smallest timeout handed to an upstream call
+    """
+
+    def __init__(self, seconds, split=None, min_timeout=0.5):
+        self.seconds = seconds
+        self.split = split or DEFAULT_SPLIT
+        self.min_timeout = min_timeout
+        self.started = time.monotonic()
+        self.expires = self.started + seconds
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def budget(self, stage):
+        """
+        Seconds ``stage`` may take: its weight's share of the remaining
+        time among the stages from ``stage`` on
+        """
+        stages = list(self.split)
+        if stage not in self.split:
+            return self.remaining()
+        ahead = stages[stages.index(stage):]
+        total = sum(self.split[name] for name in ahead)
+        return self.remaining() * self.split[stage] / total if total else self.remaining()
+
+    def timeout(self, stage):
+        """
+        Timeout for an upstream call of ``stage``: its budget, but at least
+        ``min_timeout`` so a required stage still gets a chance to answer
+        after an overrun
+        """
+        return max(self.min_timeout, self.budget(stage))
+
+    def to_dict(self):
+        return {
+            "budget_seconds": self.seconds,
+            "elapsed_seconds": round(self.elapsed(), 3),
+        }
@@ -0,0 +1,237 @@
+"""
+D-ID API Client
+===============
+Pooled, keep-alive HTTP client for all D-ID traffic.
+
+One ``requests.Session`` with a sized connection pool is shared by every
+call, so requests reuse TCP+TLS connections instead of handshaking each
+time. Every call has connect/read timeouts, and transient failures
+(429 and 5xx) are retried with jittered exponential backoff.
+
+Authentication uses the ``x-api-key`` header, D-ID's recommended method
+(the alternative is ``Authorization: Basic base64(api_key:)``). Headers are
+built once when the client is created.
+
+The base URL and session are injectable so the client can be pointed at a
+local stub server (see fakes.StubDIDServer).
+"""
+
+import os
+import random
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+
+# Statuses worth retrying: rate limited or temporarily unavailable
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Creating a talk is not idempotent; only retry when D-ID did not process it
+CREATE_RETRY_STATUSES = (429, 503)
+
+
+class DIDClient:
+    """
+    Client for the D-ID talks and streams APIs.
+
+    Args:
+        api_key: D-ID API key
+        base_url: API root (override to target a stub server)
+        pool_size: max keep-alive connections kept per host
+        connect_timeout: seconds to establish a connection
+        read_timeout: seconds to wait for a response
+        max_retries: retries after the first attempt
+        backoff: base delay (seconds) for exponential backoff
+        max_retry_after: longest pause (seconds) taken from a Retry-After
+            header before retrying
+        session: optional pre-configured ``requests.Session``
+    """
+
+    def __init__(self, api_key, base_url='https://api.d-id.com', pool_size=20,
+                 connect_timeout=3.05, read_timeout=20, max_retries=3,
+                 backoff=0.5, max_retry_after=30.0, session=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_retry_after = max_retry_after
+
+        self.headers = {
+            "accept": "application/json",
+            "content-type": "application/json",
+            "x-api-key": api_key or ""
+        }
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+        self.session = session
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def create_talk(self, payload, timeout=None):
+        """
+        POST /talks - returns the created talk JSON
+
+        With ``timeout`` (seconds) the whole call, retries included, ends
+        within that time: attempts get shorter read timeouts and no retry
+        is started that could not finish in time.
+        """
+        response = self._request(
+            'POST', '/talks', json=payload,
+            retry_statuses=CREATE_RETRY_STATUSES, retry_read_errors=False,
+            deadline=time.monotonic() + timeout if timeout else None
+        )
+        return response.json()
+
+    def get_talk(self, talk_id):
+        """GET /talks/{id} - returns the talk JSON (status, result_url, ...)"""
+        return self._request('GET', f'/talks/{talk_id}').json()
+
+    # Streams API (persistent WebRTC avatar sessions, see did_streams.py)
+
+    def create_stream(self, source_url, **options):
+        """
+        POST /talks/streams - returns the new stream's JSON: 'id',
+        'session_id', the SDP 'offer' and 'ice_servers'
+        """
+        response = self._request(
+            'POST', '/talks/streams', json=dict(options, source_url=source_url),
+            retry_statuses=CREATE_RETRY_STATUSES, retry_read_errors=False
+        )
+        return response.json()
+
+    def start_stream(self, stream_id, session_id, answer):
+        """POST /talks/streams/{id}/sdp - the browser's SDP answer"""
+        return self._request(
+            'POST', f'/talks/streams/{stream_id}/sdp',
+            json={"answer": answer, "session_id": session_id}
+        ).json()
+
+    def add_ice_candidate(self, stream_id, session_id, candidate):
+        """
+        POST /talks/streams/{id}/ice - one ICE candidate from the browser
+        (a dict with 'candidate', 'sdpMid' and 'sdpMLineIndex')
+        """
+        return self._request(
+            'POST', f'/talks/streams/{stream_id}/ice',
+            json=dict(candidate, session_id=session_id)
+        ).json()
+
+    def stream_talk(self, stream_id, session_id, payload, timeout=None):
+        """
+        POST /talks/streams/{id} - make the streamed avatar speak a script
+
+        Like create_talk, not retried once D-ID may have processed it.
+        """
+        response = self._request(
+            'POST', f'/talks/streams/{stream_id}', json=dict(payload, session_id=session_id),
+            retry_statuses=CREATE_RETRY_STATUSES, retry_read_errors=False,
+            deadline=time.monotonic() + timeout if timeout else None
+        )
+        return response.json()
+
+    def delete_stream(self, stream_id, session_id):
+        """DELETE /talks/streams/{id} - close a stream"""
+        return self._request(
+            'DELETE', f'/talks/streams/{stream_id}', json={"session_id": session_id}
+        ).json()
+
+    def download(self, url, path, chunk_size=64 * 1024):
+        """
+        Stream a result file (e.g. a finished talk's MP4) to ``path``.
+
+        Result URLs point at D-ID's storage, so no API key is sent.
+        """
+        tmp_path = path + '.part'
+        with self.session.get(url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            with open(tmp_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+        os.replace(tmp_path, path)
+
+    def warm(self):
+        """
+        Open a pooled connection (TCP + TLS) to the API ahead of the first
+        request; any HTTP status counts, only connection errors raise
+        """
+        self.session.head(self.base_url, timeout=self.timeout)
+
+    def close(self):
+        self.session.close()
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _request(self, method, path, retry_statuses=RETRY_STATUSES,
+                 retry_read_errors=True, deadline=None, **kwargs):
+        url = f"{self.base_url}{path}"
+        attempt = 0
+        while True:
+            timeout = self.timeout
+            if deadline is not None:
+                remaining = max(0.01, deadline - time.monotonic())
+                timeout = (min(self.timeout[0], remaining), min(self.timeout[1], remaining))
+            try:
+                response = self.session.request(
+                    method, url, headers=self.headers, timeout=timeout, **kwargs
+                )
+            except requests.exceptions.ConnectionError as e:
+                # Connect failures never reached D-ID; read errors only
+                # retried for idempotent calls
+                reached_server = self._reached_server(e)
+                delay = self._delay(attempt)
+                if attempt >= self.max_retries or (reached_server and not retry_read_errors) \
+                        or self._past(deadline, delay):
+                    raise
+            except requests.exceptions.Timeout:
+                delay = self._delay(attempt)
+                if attempt >= self.max_retries or not retry_read_errors \
+                        or self._past(deadline, delay):
+                    raise
+            else:
+                delay = self._delay(attempt, response.headers.get('Retry-After'))
+                if response.status_code not in retry_statuses or attempt >= self.max_retries \
+                        or self._past(deadline, delay):
+                    response.raise_for_status()
+                    return response
+
+            time.sleep(delay)
+            attempt += 1
+
+    def _delay(self, attempt, retry_after=None):
+        """
+        Jittered exponential backoff (honours Retry-After when given, up to
+        ``max_retry_after``)
+        """
+        delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), self.max_retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    @staticmethod
+    def _reached_server(error):
+        """
+        Whether a failed connection may have delivered the request to D-ID.
+        Connect timeouts, refused connections and DNS failures did not.
+        """
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return False
+        cause = error.args[0] if error.args else None
+        return not isinstance(getattr(cause, 'reason', cause), NewConnectionError)
+
+    @staticmethod
+    def _past(deadline, delay):
+        """Whether a retry after ``delay`` seconds would start past the deadline"""
+        return deadline is not None and time.monotonic() + delay >= deadline
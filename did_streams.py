@@ -0,0 +1,392 @@
+"""
+D-ID Avatar Streams
+===================
+Persistent avatar sessions per kiosk, using D-ID's streams API instead of a
+new ``/talks`` job (render, then MP4 download) for every reply.
+
+Each kiosk keeps one WebRTC stream of the presenter open. Every reply's TTS
+audio is pushed into that stream, and the kiosk sees the avatar speak it
+live. Only the WebRTC media flows between the kiosk browser and D-ID; the
+stream is created, negotiated (SDP answer, ICE candidates) and driven
+through this server, which holds the API key.
+
+- Pooling: one stream per kiosk, at most ``max_streams`` at once.
+  Optionally ``spares`` streams are created ahead of time, so a kiosk that
+  (re)connects gets an offer at once instead of waiting for D-ID.
+- Keepalive: the kiosk heartbeats its stream while the page is open. The
+  streams API has no keepalive call of its own, and D-ID closes streams
+  that stay idle; a heartbeat past ``upstream_idle_timeout`` reports the
+  stream as ``expired`` so the kiosk reconnects before the next reply
+  rather than during it.
+- Reconnection: a kiosk reconnects by opening its stream again (the old
+  one is closed). A stream D-ID no longer knows is dropped when a reply is
+  pushed into it (``StreamClosed``); that reply falls back to a video clip.
+- Idle reaping: ``reap()`` closes streams whose kiosk stopped heartbeating,
+  streams never connected within ``connect_timeout``, and stale spares.
+
+Usage:
+    pool = StreamPool(did_client, source_url)
+    offer = pool.open('kiosk-lobby')        # -> browser, which answers
+    pool.answer('kiosk-lobby', offer['stream_id'], answer_sdp)
+    pool.speak('kiosk-lobby', {"type": "audio", "audio_url": url})
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+from upstream_limits import Overloaded
+
+
+# Statuses D-ID answers for a stream it has closed or never had
+CLOSED_STREAM_STATUSES = (400, 404, 410)
+
+
+class StreamClosed(Exception):
+    """The kiosk has no connected stream (or D-ID closed it); reconnect"""
+
+
+@contextmanager
+def _unguarded(stage):
+    yield
+
+
+class AvatarStream:
+    """One D-ID stream, owned by a kiosk once claimed"""
+
+    def __init__(self, stream_id, session_id, offer, ice_servers):
+        self.stream_id = stream_id
+        self.session_id = session_id
+        self.offer = offer
+        self.ice_servers = ice_servers
+        self.kiosk_id = None
+        self.state = 'new'   # new (spare) -> connecting -> connected -> closed
+        self.created_at = time.time()
+        self.last_seen = self.created_at     # last heartbeat or use by the kiosk
+        self.last_active = self.created_at   # last call into D-ID for this stream
+        self.talks = 0
+
+    def to_dict(self, upstream_idle_timeout=None):
+        state = self.state
+        if state == 'connected' and upstream_idle_timeout and \
+                time.time() - self.last_active > upstream_idle_timeout:
+            state = 'expired'
+        return {
+            "kiosk_id": self.kiosk_id,
+            "stream_id": self.stream_id,
+            "state": state,
+            "offer": self.offer,
+            "ice_servers": self.ice_servers,
+            "talks": self.talks,
+            "created_at": self.created_at,
+        }
+
+
+class StreamPool:
+    """
+    One persistent D-ID stream per kiosk.
+
+    Args:
+        client: DIDClient (or anything with the same streams methods)
+        source_url: presenter image of every stream
+        config: talk config sent with each reply (e.g. {"fluent": True})
+        max_streams: streams open at once, spares included
+        spares: streams kept created ahead of time for kiosks that connect
+        idle_timeout: close a stream when its kiosk has not been seen for
+            this many seconds (no heartbeat, no reply)
+        connect_timeout: close a stream the kiosk has not connected to
+            within this many seconds
+        upstream_idle_timeout: seconds after which D-ID is assumed to have
+            closed an idle stream (reported to the kiosk as 'expired')
+        spare_ttl: close spares older than this (their offer goes stale)
+        guard: optional callable(stage) -> context manager wrapped around
+            every D-ID call (upstream limits, metrics)
+    """
+
+    def __init__(self, client, source_url, config=None, max_streams=20, spares=0,
+                 idle_timeout=90, connect_timeout=30, upstream_idle_timeout=240,
+                 spare_ttl=60, guard=None):
+        self.client = client
+        self.source_url = source_url
+        self.config = config or {}
+        self.max_streams = max_streams
+        self.spares = spares
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.upstream_idle_timeout = upstream_idle_timeout
+        self.spare_ttl = spare_ttl
+        self.guard = guard or _unguarded
+
+        self._streams = {}   # kiosk_id -> AvatarStream
+        self._spares = []
+        self._pending_spares = 0
+        self._pending_opens = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+        self.created = 0
+        self.reconnects = 0
+        self.reaped = 0
+        self.talks = 0
+        self.closed_upstream = 0
+
+    # ------------------------------------------------------------------
+    # Kiosk API
+    # ------------------------------------------------------------------
+
+    def open(self, kiosk_id):
+        """
+        Give the kiosk a fresh stream to connect to (closing its old one)
+
+        Returns: stream dict with the SDP 'offer' and 'ice_servers'
+        Raises: Overloaded when ``max_streams`` are open (or from the guard),
+            requests errors when D-ID fails
+        """
+        with self._lock:
+            old = self._streams.pop(kiosk_id, None)
+            if old is not None:
+                self.reconnects += 1
+            stream = self._take_spare()
+            if stream is None and self._open_count() >= self.max_streams:
+                if old is not None:
+                    self._streams[kiosk_id] = old
+                raise Overloaded('avatar_streams', self.connect_timeout, 'pool_full')
+            if stream is None:
+                # Hold the slot while D-ID creates the stream, so concurrent
+                # opens cannot all pass the check above
+                self._pending_opens += 1
+        if old is not None:
+            self._close_upstream(old)
+        if stream is None:
+            try:
+                stream = self._create()
+            finally:
+                with self._lock:
+                    self._pending_opens -= 1
+        with self._lock:
+            stream.kiosk_id = kiosk_id
+            stream.state = 'connecting'
+            stream.last_seen = time.time()
+            self._streams[kiosk_id] = stream
+            snapshot = stream.to_dict()
+        self._replenish_in_background()
+        return snapshot
+
+    def answer(self, kiosk_id, stream_id, answer):
+        """Pass the kiosk's SDP answer to D-ID; the stream is then connected"""
+        stream = self._get(kiosk_id, stream_id)
+        with self.guard('did_stream_sdp'):
+            self.client.start_stream(stream.stream_id, stream.session_id, answer)
+        with self._lock:
+            stream.state = 'connected'
+            stream.last_seen = stream.last_active = time.time()
+            return stream.to_dict()
+
+    def add_ice_candidate(self, kiosk_id, stream_id, candidate):
+        """Pass one ICE candidate from the kiosk to D-ID"""
+        stream = self._get(kiosk_id, stream_id)
+        with self.guard('did_stream_ice'):
+            self.client.add_ice_candidate(stream.stream_id, stream.session_id, candidate)
+
+    def keepalive(self, kiosk_id, stream_id=None):
+        """
+        Heartbeat from the kiosk
+
+        Returns: the stream dict ('expired' state: reconnect now), or None
+            if the kiosk has no stream (reconnect too)
+        """
+        with self._lock:
+            stream = self._streams.get(kiosk_id)
+            if stream is None or (stream_id and stream.stream_id != stream_id):
+                return None
+            stream.last_seen = time.time()
+            return stream.to_dict(self.upstream_idle_timeout)
+
+    def is_connected(self, kiosk_id):
+        with self._lock:
+            stream = self._streams.get(kiosk_id)
+            return stream is not None and stream.state == 'connected'
+
+    def speak(self, kiosk_id, script, timeout=None):
+        """
+        Make the kiosk's avatar speak ``script`` (a D-ID talk script)
+
+        Returns: the stream dict
+        Raises: StreamClosed if the kiosk has no connected stream or D-ID
+            has closed it (the stream is dropped; the kiosk reconnects)
+        """
+        with self._lock:
+            stream = self._streams.get(kiosk_id)
+            if stream is None or stream.state != 'connected':
+                raise StreamClosed(f"No connected avatar stream for {kiosk_id}")
+        payload = {"script": script, "config": self.config}
+        try:
+            with self.guard('did_stream_talk'):
+                self.client.stream_talk(stream.stream_id, stream.session_id, payload,
+                                        timeout=timeout)
+        except requests.exceptions.HTTPError as e:
+            status = getattr(e.response, 'status_code', None)
+            if status not in CLOSED_STREAM_STATUSES:
+                raise
+            with self._lock:
+                stream.state = 'closed'
+                if self._streams.get(kiosk_id) is stream:
+                    del self._streams[kiosk_id]
+                self.closed_upstream += 1
+            raise StreamClosed(f"Avatar stream {stream.stream_id} was closed by D-ID")
+        with self._lock:
+            stream.talks += 1
+            self.talks += 1
+            stream.last_seen = stream.last_active = time.time()
+            return stream.to_dict()
+
+    def close(self, kiosk_id, stream_id=None):
+        """Close the kiosk's stream (page unload). Returns True if one was open"""
+        with self._lock:
+            stream = self._streams.get(kiosk_id)
+            if stream is None or (stream_id and stream.stream_id != stream_id):
+                return False
+            del self._streams[kiosk_id]
+        self._close_upstream(stream)
+        return True
+
+    # ------------------------------------------------------------------
+    # Pool upkeep
+    # ------------------------------------------------------------------
+
+    def reap(self):
+        """
+        Close abandoned streams and stale spares, then top up the spares
+
+        Returns: number of streams closed
+        """
+        now = time.time()
+        with self._lock:
+            abandoned = [
+                kiosk_id for kiosk_id, stream in self._streams.items()
+                if now - stream.last_seen > self.idle_timeout or
+                (stream.state == 'connecting' and now - stream.last_seen > self.connect_timeout)
+            ]
+            closing = [self._streams.pop(kiosk_id) for kiosk_id in abandoned]
+            stale = [spare for spare in self._spares if now - spare.created_at > self.spare_ttl]
+            self._spares = [spare for spare in self._spares if spare not in stale]
+            self.reaped += len(closing)
+        for stream in closing + stale:
+            self._close_upstream(stream)
+        self.replenish()
+        return len(closing)
+
+    def replenish(self):
+        """Create spare streams until ``spares`` are ready (or the pool is full)"""
+        while True:
+            with self._lock:
+                if len(self._spares) + self._pending_spares >= self.spares or \
+                        self._open_count() >= self.max_streams:
+                    return
+                self._pending_spares += 1
+            try:
+                stream = self._create()
+            except Exception as e:
+                print(f"Error creating spare avatar stream: {str(e)}")
+                return
+            finally:
+                with self._lock:
+                    self._pending_spares -= 1
+            with self._lock:
+                self._spares.append(stream)
+
+    def start_reaper(self, interval=15):
+        """Run ``reap`` every ``interval`` seconds on a background thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+        self._stopped.clear()
+
+        def run():
+            while not self._stopped.wait(interval):
+                try:
+                    self.reap()
+                except Exception as e:
+                    print(f"Error reaping avatar streams: {str(e)}")
+
+        self._thread = threading.Thread(target=run, name='did-stream-reaper', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        """Stop the reaper and close every stream (shutdown and tests)"""
+        self._stopped.set()
+        with self._lock:
+            streams = list(self._streams.values()) + self._spares
+            self._streams, self._spares = {}, []
+        for stream in streams:
+            self._close_upstream(stream)
+
+    def stats(self):
+        with self._lock:
+            states = {}
+            for stream in self._streams.values():
+                state = stream.to_dict(self.upstream_idle_timeout)['state']
+                states[state] = states.get(state, 0) + 1
+            return {
+                "streams": len(self._streams),
+                "states": states,
+                "spares": len(self._spares),
+                "max_streams": self.max_streams,
+                "created": self.created,
+                "reconnects": self.reconnects,
+                "reaped": self.reaped,
+                "closed_upstream": self.closed_upstream,
+                "talks": self.talks,
+            }
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _open_count(self):
+        """Open streams, spares and streams being created (caller holds the lock)"""
+        return (len(self._streams) + len(self._spares) +
+                self._pending_spares + self._pending_opens)
+
+    def _take_spare(self):
+        """Newest spare whose offer is still fresh (caller holds the lock)"""
+        now = time.time()
+        while self._spares:
+            spare = self._spares.pop()
+            if now - spare.created_at <= self.spare_ttl:
+                return spare
+            threading.Thread(target=self._close_upstream, args=(spare,), daemon=True).start()
+        return None
+
+    def _create(self):
+        with self.guard('did_stream_create'):
+            data = self.client.create_stream(self.source_url)
+        with self._lock:
+            self.created += 1
+        return AvatarStream(data['id'], data.get('session_id'), data.get('offer'),
+                            data.get('ice_servers') or [])
+
+    def _replenish_in_background(self):
+        if self.spares:
+            threading.Thread(target=self.replenish, name='did-stream-spares',
+                             daemon=True).start()
+
+    def _get(self, kiosk_id, stream_id):
+        with self._lock:
+            stream = self._streams.get(kiosk_id)
+        if stream is None or stream.stream_id != stream_id:
+            raise StreamClosed(f"Unknown avatar stream {stream_id} for {kiosk_id}")
+        return stream
+
+    def _close_upstream(self, stream):
+        stream.state = 'closed'
+        try:
+            with self.guard('did_stream_close'):
+                self.client.delete_stream(stream.stream_id, stream.session_id)
+        except requests.exceptions.HTTPError as e:
+            if getattr(e.response, 'status_code', None) not in CLOSED_STREAM_STATUSES:
+                print(f"Error closing avatar stream {stream.stream_id}: {str(e)}")
+        except Exception as e:
+            print(f"Error closing avatar stream {stream.stream_id}: {str(e)}")
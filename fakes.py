@@ -0,0 +1,447 @@
+"""
+Offline Fakes
+=============
+Stand-ins for the upstream services so the pipeline can be exercised
+without network access or API keys.
+
+Usage:
+    import app, fakes
+    app.clients.inject('stt', fakes.FakeSpeechClient("What are your office hours?"))
+    app.clients.inject('tts', fakes.FakeTTSClient(latency=fakes.latency("uniform:0.2,0.4")))
+    app.clients.inject('gemini', fakes.FakeGenerativeModel(latency=0.8))
+
+    with fakes.StubDIDServer() as did:
+        app.clients.inject('did', DIDClient(api_key="test", base_url=did.url))
+
+Every ``latency`` argument accepts seconds or a zero-argument callable
+returning seconds (see ``latency()`` for distributions).
+"""
+
+import hashlib
+import json
+import math
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+
+def latency(spec):
+    """
+    Parse a latency distribution.
+
+    - ``"0.3"``: constant 0.3 seconds
+    - ``"uniform:0.2,0.6"``: uniform between the two bounds
+    - ``"normal:0.5,0.1"``: normal(mean, stddev), clipped at 0
+    - ``"lognormal:0.8,0.5"``: log-normal with the given median and sigma
+      (long right tail, like real API latencies)
+
+    Returns: a number or a callable sampling one
+    """
+    if isinstance(spec, (int, float)) or callable(spec):
+        return spec
+    kind, _, params = spec.partition(':')
+    if not params:
+        return float(kind)
+
+    a, b = (float(x) for x in params.split(','))
+    if kind == 'uniform':
+        return lambda: random.uniform(a, b)
+    if kind == 'normal':
+        return lambda: max(0.0, random.gauss(a, b))
+    if kind == 'lognormal':
+        return lambda: random.lognormvariate(math.log(a), b)
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def sample(value):
+    """Seconds from a constant or a distribution"""
+    return value() if callable(value) else value
+
+
+def _sleep(value):
+    seconds = sample(value)
+    if seconds and seconds > 0:
+        time.sleep(seconds)
+
+
+def _recognition_result(transcript, confidence, is_final=True):
+    alternative = SimpleNamespace(transcript=transcript, confidence=confidence)
+    return SimpleNamespace(alternatives=[alternative], is_final=is_final)
+
+
+class FakeSpeechClient:
+    """
+    Fake Google Cloud Speech client.
+
+    ``recognize`` returns the scripted transcript. ``streaming_recognize``
+    emits one interim result per received chunk (revealing the transcript
+    word by word), then signals end-of-utterance and the final result once
+    ``chunks_per_utterance`` chunks were received or the input ends.
+
+    Args:
+        transcript: text the fake "hears"
+        confidence: confidence reported with final results
+        latency: seconds to sleep per call (or per streamed chunk)
+        chunks_per_utterance: chunks after which end-of-utterance is
+            detected (None means wait for the end of the input)
+    """
+
+    def __init__(self, transcript="What are your office hours?", confidence=0.95,
+                 latency=0.0, chunks_per_utterance=None):
+        self.transcript = transcript
+        self.confidence = confidence
+        self.latency = latency
+        self.chunks_per_utterance = chunks_per_utterance
+        self.calls = 0
+
+    def recognize(self, config=None, audio=None, **kwargs):
+        self.calls += 1
+        _sleep(self.latency)
+        if not self.transcript:
+            return SimpleNamespace(results=[])
+        return SimpleNamespace(
+            results=[_recognition_result(self.transcript, self.confidence)]
+        )
+
+    def streaming_recognize(self, config=None, requests=None, **kwargs):
+        self.calls += 1
+        words = self.transcript.split()
+        received = 0
+
+        for request in requests:
+            if not request.audio_content:
+                continue
+            received += 1
+            _sleep(self.latency)
+
+            partial = ' '.join(words[:received])
+            if partial and received < len(words):
+                yield SimpleNamespace(
+                    speech_event_type='SPEECH_EVENT_UNSPECIFIED',
+                    results=[_recognition_result(partial, 0.0, is_final=False)],
+                )
+
+            if self.chunks_per_utterance and received >= self.chunks_per_utterance:
+                break
+
+        if not received or not words:
+            return
+
+        yield SimpleNamespace(speech_event_type='END_OF_SINGLE_UTTERANCE', results=[])
+        yield SimpleNamespace(
+            speech_event_type='SPEECH_EVENT_UNSPECIFIED',
+            results=[_recognition_result(self.transcript, self.confidence)],
+        )
+
+
+class FakeTTSClient:
+    """
+    Fake Google Cloud Text-to-Speech client.
+
+    Returns deterministic placeholder bytes (distinct per text and voice)
+    sized like real MP3 speech, so payload encoding and caching behave as
+    they would in production.
+
+    Args:
+        latency: seconds to sleep per call
+        bytes_per_char: audio size per input character (~120 for MP3 at
+            the default speaking rate)
+    """
+
+    def __init__(self, latency=0.0, bytes_per_char=120):
+        self.latency = latency
+        self.bytes_per_char = bytes_per_char
+        self.calls = 0
+        self.characters = 0
+
+    def synthesize_speech(self, input=None, voice=None, audio_config=None, **kwargs):
+        self.calls += 1
+        text = input.text or input.ssml or ''
+        self.characters += len(text)
+        _sleep(self.latency)
+
+        seed = hashlib.sha256(f"{getattr(voice, 'name', '')}|{text}".encode('utf-8')).digest()
+        size = max(len(seed), len(text) * self.bytes_per_char)
+        audio = b'ID3' + (seed * (size // len(seed) + 1))[:size]
+        return SimpleNamespace(audio_content=audio)
+
+
+class FakeChatSession:
+    """Chat returned by FakeGenerativeModel.start_chat"""
+
+    def __init__(self, model, history):
+        self.model = model
+        self.history = [self._content(item) for item in history or []]
+
+    @staticmethod
+    def _content(item):
+        if isinstance(item, dict):
+            parts = [SimpleNamespace(text=str(part)) for part in item.get('parts', [])]
+            return SimpleNamespace(role=item.get('role'), parts=parts)
+        return item
+
+    def send_message(self, content, stream=False, **kwargs):
+        model = self.model
+        with model._lock:
+            model.calls += 1
+            reply = model.reply(content) if callable(model.reply) else model.reply
+
+        self.history.append(self._content({"role": "user", "parts": [content]}))
+        self.history.append(self._content({"role": "model", "parts": [reply]}))
+
+        _sleep(model.latency)
+        if not stream:
+            return SimpleNamespace(text=reply)
+        return self._stream(reply)
+
+    def _stream(self, reply):
+        words = reply.split(' ')
+        size = self.model.chunk_words
+        for start in range(0, len(words), size):
+            if start:
+                _sleep(self.model.chunk_latency)
+            text = ' '.join(words[start:start + size])
+            yield SimpleNamespace(text=text + (' ' if start + size < len(words) else ''))
+
+
+class FakeGenerativeModel:
+    """
+    Fake Gemini model (``genai.GenerativeModel`` stand-in).
+
+    Args:
+        reply: reply text, or callable(user_message) returning it
+        latency: seconds before the reply (time to first chunk when
+            streaming)
+        chunk_latency: seconds between streamed chunks
+        chunk_words: words per streamed chunk
+    """
+
+    def __init__(self, reply="Our office is open Monday to Friday, from 9 AM to 6 PM. "
+                             "Is there anything else I can help you with?",
+                 latency=0.0, chunk_latency=0.0, chunk_words=4):
+        self.reply = reply
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self.chunk_words = chunk_words
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def start_chat(self, history=None):
+        return FakeChatSession(self, history)
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    """Does not log clients that hang up mid-response (e.g. on a timeout)"""
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StubDIDServer:
+    """
+    Local HTTP server mimicking the D-ID talks API.
+
+    - ``POST /talks`` creates a talk and returns ``{"id": ..., "status": "created"}``
+    - ``GET /talks/<id>`` reports ``started`` until ``render_seconds`` have
+      passed, then ``done`` with a ``result_url`` served by this stub
+    - ``GET /results/<id>.mp4`` returns placeholder video bytes
+    - Streams API: ``POST /talks/streams`` returns an ``id``, ``session_id``
+      and a placeholder SDP ``offer``; ``POST /talks/streams/<id>/sdp`` and
+      ``/ice`` accept the browser's answer and candidates;
+      ``POST /talks/streams/<id>`` records a talk on a connected stream;
+      ``DELETE /talks/streams/<id>`` closes it. Unknown, closed or
+      mismatched-session streams get a 404 (400 if not yet connected).
+
+    Args:
+        render_seconds: simulated render time per talk (sampled per talk
+            when a distribution is given)
+        latency: seconds added to every response
+        fail_first: answer this many requests with ``fail_status``
+        fail_status: status used for injected failures (e.g. 429, 503)
+        stream_idle_timeout: close streams idle this many seconds, like
+            D-ID does (None keeps them open)
+        port: port to bind (0 picks a free one)
+    """
+
+    def __init__(self, render_seconds=0.5, latency=0.0, fail_first=0,
+                 fail_status=503, stream_idle_timeout=None, port=0):
+        self.render_seconds = render_seconds
+        self.latency = latency
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.stream_idle_timeout = stream_idle_timeout
+        self.talks = {}
+        self.streams = {}
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = _QuietHTTPServer(('127.0.0.1', port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name='stub-did', daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _stream(self, stream_id, session_id):
+        """Open stream with this id and session, or None (closed or expired)"""
+        with self._lock:
+            stream = self.streams.get(stream_id)
+            if stream is None or stream['state'] == 'closed' or \
+                    stream['session_id'] != session_id:
+                return None
+            if self.stream_idle_timeout is not None and \
+                    time.time() - stream['last_active'] > self.stream_idle_timeout:
+                stream['state'] = 'closed'
+                return None
+            stream['last_active'] = time.time()
+            return stream
+
+    def _stream_request(self, method, parts, body):
+        """Handle a streams API request; returns (status, body)"""
+        if method == 'POST' and not parts:
+            stream_id = f"strm_{uuid.uuid4().hex[:12]}"
+            session_id = f"sess_{uuid.uuid4().hex[:12]}"
+            with self._lock:
+                self.streams[stream_id] = {
+                    "session_id": session_id,
+                    "source_url": body.get('source_url'),
+                    "state": 'created',
+                    "last_active": time.time(),
+                    "candidates": [],
+                    "talks": [],
+                }
+            return 201, {
+                "id": stream_id,
+                "session_id": session_id,
+                "offer": {"type": "offer", "sdp": "v=0\r\ns=stub-did-stream\r\n"},
+                "ice_servers": [{"urls": ["stun:stun.example.invalid:3478"]}],
+            }
+        stream = self._stream(parts[0], body.get('session_id'))
+        if stream is None:
+            return 404, {"kind": "NotFoundError", "description": "Stream not found"}
+        if method == 'DELETE' and len(parts) == 1:
+            stream['state'] = 'closed'
+            return 200, {"status": "success"}
+        if method != 'POST':
+            return 404, {"kind": "NotFound"}
+        if parts[1:] == ['sdp']:
+            stream['state'] = 'connected'
+            stream['answer'] = body.get('answer')
+            return 200, {"status": "success"}
+        if parts[1:] == ['ice']:
+            stream['candidates'].append(body.get('candidate'))
+            return 200, {"status": "success"}
+        if len(parts) == 1:
+            if stream['state'] != 'connected':
+                return 400, {"kind": "ValidationError", "description": "Stream not connected"}
+            stream['talks'].append(body)
+            return 200, {"status": "started", "session_id": body.get('session_id')}
+        return 404, {"kind": "NotFound"}
+
+    def _should_fail(self):
+        with self._lock:
+            if self.fail_first > 0:
+                self.fail_first -= 1
+                return True
+            return False
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body, content_type='application/json'):
+                if isinstance(body, (dict, list)):
+                    body = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _prologue(self):
+                stub.requests.append((self.command, self.path))
+                _sleep(stub.latency)
+                if stub._should_fail():
+                    self._send(stub.fail_status, {"kind": "StubFailure"})
+                    return False
+                return True
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length) or b'{}')
+                if not self._prologue():
+                    return
+                if self.path.startswith('/talks/streams'):
+                    parts = [part for part in self.path[len('/talks/streams'):].split('/') if part]
+                    return self._send(*stub._stream_request('POST', parts, body))
+                if self.path.rstrip('/') != '/talks':
+                    return self._send(404, {"kind": "NotFound"})
+                talk_id = f"tlk_{uuid.uuid4().hex[:12]}"
+                with stub._lock:
+                    stub.talks[talk_id] = {
+                        "created_at": time.time(),
+                        "render_seconds": sample(stub.render_seconds),
+                        "payload": body,
+                    }
+                self._send(201, {"id": talk_id, "status": "created"})
+
+            def do_GET(self):
+                if not self._prologue():
+                    return
+                if self.path.startswith('/results/'):
+                    return self._send(200, b'\x00\x00\x00\x18ftypmp42stub-video',
+                                      content_type='video/mp4')
+                if not self.path.startswith('/talks/'):
+                    return self._send(404, {"kind": "NotFound"})
+
+                talk_id = self.path[len('/talks/'):]
+                talk = stub.talks.get(talk_id)
+                if talk is None:
+                    return self._send(404, {"kind": "NotFoundError"})
+                if time.time() - talk['created_at'] < talk['render_seconds']:
+                    return self._send(200, {"id": talk_id, "status": "started"})
+                self._send(200, {
+                    "id": talk_id,
+                    "status": "done",
+                    "result_url": f"{stub.url}/results/{talk_id}.mp4",
+                })
+
+            def do_DELETE(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length) or b'{}')
+                if not self._prologue():
+                    return
+                parts = [part for part in self.path[len('/talks/streams'):].split('/') if part]
+                if not self.path.startswith('/talks/streams/') or not parts:
+                    return self._send(404, {"kind": "NotFound"})
+                self._send(*stub._stream_request('DELETE', parts, body))
+
+        return Handler
@@ -0,0 +1,306 @@
+"""
+FAQ Response Bank
+=================
+Answers for the handful of questions most visitors ask (greeting, office
+hours, directions, events), matched before Gemini is called.
+
+Questions are matched on normalized text: an exact lookup first, then a
+character-trigram index scored by Dice similarity, which tolerates small
+transcription differences ("what're your office hours") without any
+embedding model. A warm-up job pre-renders each answer's TTS audio and
+D-ID video per language into ``media_dir``, so a matched question is
+answered from local files with no upstream calls.
+
+The bank is loaded from a JSON file (see faq.json):
+
+    {"entries": [{"id": "office_hours",
+                  "questions": {"en-US": ["What are your office hours?"]},
+                  "answers": {"en-US": "We're open ..."}}]}
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import unicodedata
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+def normalize(text):
+    """Casefold, drop punctuation and diacritics, collapse whitespace"""
+    text = unicodedata.normalize('NFKD', text.casefold())
+    chars = []
+    for char in text:
+        category = unicodedata.category(char)
+        if category.startswith(('L', 'N')):
+            chars.append(char)
+        elif category != 'Mn':  # combining marks (accents, Arabic harakat) vanish
+            chars.append(' ')
+    return ' '.join(''.join(chars).split())
+
+
+def trigrams(normalized):
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FAQBank:
+    """
+    Matcher and pre-rendered media for frequent questions.
+
+    Args:
+        entries: list of {"id", "questions": {lang: [...]}, "answers": {lang: text}}
+        media_dir: where pre-rendered audio/video and the manifest live
+        url_prefix: URL path ``media_dir`` is served under
+        threshold: minimum similarity (0-1) for a fuzzy match
+    """
+
+    def __init__(self, entries, media_dir, url_prefix='/faq', threshold=0.8):
+        self.media_dir = media_dir
+        self.url_prefix = url_prefix.rstrip('/')
+        self.threshold = threshold
+
+        self.answers = {}     # (entry_id, language) -> answer text
+        self._exact = {}      # normalized question -> (entry_id, language)
+        self._questions = []  # (entry_id, language, trigram set)
+        self._index = {}      # trigram -> question indexes
+        for entry in entries:
+            for language, answer in entry.get('answers', {}).items():
+                self.answers[(entry['id'], language)] = answer
+            for language, questions in entry.get('questions', {}).items():
+                if (entry['id'], language) not in self.answers:
+                    continue
+                for question in questions:
+                    self._add_question(entry['id'], language, question)
+
+        self._lock = threading.Lock()
+        self._manifest_path = os.path.join(media_dir, 'manifest.json')
+        self._manifest = self._load_manifest()
+        self._warmup = {"running": False}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """Load entries from a JSON file (an empty bank if it is missing)"""
+        entries = []
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                entries = json.load(f).get('entries', [])
+        return cls(entries, **kwargs)
+
+    def _add_question(self, entry_id, language, question):
+        normalized = normalize(question)
+        if not normalized:
+            return
+        self._exact.setdefault(normalized, (entry_id, language))
+        grams = trigrams(normalized)
+        position = len(self._questions)
+        self._questions.append((entry_id, language, grams))
+        for gram in grams:
+            self._index.setdefault(gram, []).append(position)
+
+    # ------------------------------------------------------------------
+    # Matching
+    # ------------------------------------------------------------------
+
+    def match(self, text):
+        """
+        Find the FAQ entry a question asks for
+
+        Returns: dict with 'id', 'language', 'answer', 'score', or None
+        """
+        normalized = normalize(text or '')
+        if not normalized:
+            return None
+
+        found = self._exact.get(normalized)
+        score = 1.0
+        if found is None:
+            found, score = self._fuzzy(normalized)
+
+        with self._lock:
+            if found is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        entry_id, language = found
+        return {
+            "id": entry_id,
+            "language": language,
+            "answer": self.answers[found],
+            "score": round(score, 3),
+        }
+
+    def _fuzzy(self, normalized):
+        grams = trigrams(normalized)
+        shared = Counter()
+        for gram in grams:
+            for position in self._index.get(gram, ()):
+                shared[position] += 1
+
+        best, best_score = None, 0.0
+        for position, count in shared.items():
+            entry_id, language, question_grams = self._questions[position]
+            score = 2.0 * count / (len(grams) + len(question_grams))
+            if score > best_score:
+                best, best_score = (entry_id, language), score
+
+        if best_score < self.threshold:
+            return None, best_score
+        return best, best_score
+
+    # ------------------------------------------------------------------
+    # Pre-rendered media
+    # ------------------------------------------------------------------
+
+    def audio(self, entry_id, language):
+        """Pre-rendered MP3 bytes for an answer, or None"""
+        item = self._media(entry_id, language)
+        if not item or not item.get('audio'):
+            return None
+        try:
+            with open(os.path.join(self.media_dir, item['audio']), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def video_url(self, entry_id, language):
+        """URL of the pre-rendered avatar video for an answer, or None"""
+        item = self._media(entry_id, language)
+        if not item or not item.get('video'):
+            return None
+        if not os.path.exists(os.path.join(self.media_dir, item['video'])):
+            return None
+        return f"{self.url_prefix}/{item['video']}"
+
+    def _media(self, entry_id, language):
+        """Manifest item for an answer, if it was rendered from the current text"""
+        answer = self.answers.get((entry_id, language))
+        with self._lock:
+            item = self._manifest.get(f"{entry_id}:{language}")
+        if not item or item.get('answer_digest') != self._digest(answer):
+            return None
+        return item
+
+    @staticmethod
+    def _digest(text):
+        return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+
+    # ------------------------------------------------------------------
+    # Warm-up
+    # ------------------------------------------------------------------
+
+    def warm(self, synthesize, render_video=None, force=False, max_workers=4):
+        """
+        Pre-render audio (and video) for every answer
+
+        Answers already rendered from the same text are skipped unless
+        ``force`` is set.
+
+        Args:
+            synthesize: callable(text, language) -> MP3 bytes
+            render_video: optional callable(audio_bytes, path) -> True once
+                the video was written to ``path``
+        Returns: summary dict
+        """
+        os.makedirs(self.media_dir, exist_ok=True)
+        started = time.time()
+        with self._lock:
+            self._warmup = {"running": True, "started_at": started,
+                            "total": len(self.answers), "done": 0, "failed": 0}
+
+        def render(key):
+            entry_id, language = key
+            try:
+                self._render(entry_id, language, synthesize, render_video, force)
+                outcome = 'done'
+            except Exception as e:
+                print(f"Error rendering FAQ answer {entry_id} ({language}): {str(e)}")
+                outcome = 'failed'
+            with self._lock:
+                self._warmup[outcome] += 1
+
+        with ThreadPoolExecutor(max_workers=max_workers,
+                                thread_name_prefix='faq-warmup') as pool:
+            list(pool.map(render, sorted(self.answers)))
+
+        with self._lock:
+            self._warmup.update(running=False, finished_at=time.time(),
+                                seconds=round(time.time() - started, 2))
+            return dict(self._warmup)
+
+    def warm_in_background(self, synthesize, render_video=None, force=False,
+                           max_workers=4):
+        """Start ``warm`` on a thread. Returns False if one is already running"""
+        with self._lock:
+            if self._warmup.get('running'):
+                return False
+            self._warmup = {"running": True}
+        thread = threading.Thread(
+            target=self.warm, args=(synthesize, render_video, force, max_workers),
+            name='faq-warmup', daemon=True
+        )
+        thread.start()
+        return True
+
+    def _render(self, entry_id, language, synthesize, render_video, force):
+        answer = self.answers[(entry_id, language)]
+        item = None if force else self._media(entry_id, language)
+        base = f"{entry_id}.{language}"
+
+        if not item or not os.path.exists(os.path.join(self.media_dir, item['audio'])):
+            audio_content = synthesize(answer, language)
+            self._write(f"{base}.mp3", audio_content)
+            item = {"answer_digest": self._digest(answer), "audio": f"{base}.mp3",
+                    "video": None, "rendered_at": time.time()}
+            self._update_manifest(entry_id, language, item)
+        else:
+            with open(os.path.join(self.media_dir, item['audio']), 'rb') as f:
+                audio_content = f.read()
+
+        if render_video and not self.video_url(entry_id, language):
+            video_path = os.path.join(self.media_dir, f"{base}.mp4")
+            if render_video(audio_content, video_path):
+                item = dict(item, video=f"{base}.mp4")
+                self._update_manifest(entry_id, language, item)
+
+    def _write(self, name, content):
+        path = os.path.join(self.media_dir, name)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def _load_manifest(self):
+        try:
+            with open(self._manifest_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _update_manifest(self, entry_id, language, item):
+        with self._lock:
+            self._manifest[f"{entry_id}:{language}"] = item
+            data = json.dumps(self._manifest, indent=2).encode('utf-8')
+            self._write('manifest.json', data)
+
+    def stats(self):
+        """Match counters and how many answers have pre-rendered media"""
+        audio_ready = sum(1 for key in self.answers if self._media(*key))
+        video_ready = sum(1 for key in self.answers if self.video_url(*key))
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "answers": len(self.answers),
+                "questions": len(self._questions),
+                "audio_ready": audio_ready,
+                "video_ready": video_ready,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "warmup": dict(self._warmup),
+            }
@@ -0,0 +1,50 @@
+# Gunicorn configuration for the Virtual Receptionist Avatar
+# ==========================================================
+#
+# Production serving mode:
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#
+# The default gevent worker serves each request on a greenlet, so a
+# single process can keep hundreds of in-flight upstream calls (D-ID,
+# Gemini, Google Cloud) open at once. Per-upstream limits are set with
+# UPSTREAM_CONCURRENCY_<NAME> (see .env.example).
+#
+# One worker process is the default, and usually enough: gevent already
+# gives concurrency inside the process. Several features keep state in
+# the process that served the first request:
+#   - streaming recognition streams (/api/stt-stream/<id>/...)
+#   - live avatar streams (/api/avatar-stream/<kiosk_id>/...)
+#   - conversation history, unless SESSION_STORE_URL points at Redis
+# With WEB_WORKERS > 1 a follow-up request can land on another worker and
+# find none of it. More workers therefore require SESSION_STORE_URL (the
+# server refuses to start without it), and the stream routes need a
+# load balancer that keeps each kiosk on one worker (sticky routing).
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Worker processes and type ('gevent' for cooperative I/O, 'gthread' for
+# a plain thread pool per worker)
+workers = int(os.getenv('WEB_WORKERS', 1))
+worker_class = os.getenv('WEB_WORKER_CLASS', 'gevent')
+
+if workers > 1 and not os.getenv('SESSION_STORE_URL'):
+    raise SystemExit(
+        "WEB_WORKERS > 1 needs SESSION_STORE_URL (a shared Redis session store); "
+        "conversation history would otherwise be split across workers. "
+        "Stream routes also need sticky routing - see gunicorn.conf.py."
+    )
+
+# Concurrent connections per gevent worker / threads per gthread worker
+worker_connections = int(os.getenv('WEB_WORKER_CONNECTIONS', 1000))
+threads = int(os.getenv('WEB_THREADS', 16))
+
+# Streaming endpoints (SSE) stay open for a while; gevent workers are not
+# killed for long requests, gthread workers are after this many seconds
+timeout = int(os.getenv('WEB_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
@@ -0,0 +1,162 @@
+"""
+Conversation History Compaction
+===============================
+Bounds the prompt Gemini receives for each turn of a long conversation.
+
+- Rolling window: the most recent ``window_turns`` exchanges are sent
+  verbatim.
+- Summary: exchanges that fall out of the window are folded into a short
+  running summary (one line per exchange, oldest lines dropped first once
+  ``summary_max_chars`` is reached), sent ahead of the window.
+- Token budget: if persona + summary + window + the new message would
+  exceed ``token_budget`` (estimated), the oldest window turns are left
+  out of that request.
+
+The default summarizer is extractive and local, so compaction adds no
+upstream call; pass ``summarize`` to plug in another one.
+
+Histories use the session store format: ``{"role": ..., "parts": [...]}``.
+"""
+
+import math
+import re
+import threading
+
+
+# Exchange that carries the summary into the chat history
+SUMMARY_PREFIX = "Summary of the conversation so far:\n"
+SUMMARY_ACKNOWLEDGEMENT = "Thanks, I'll keep that in mind."
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token)"""
+    return math.ceil(len(text) / 4)
+
+
+def message_text(message):
+    return ' '.join(str(part) for part in message.get('parts', []))
+
+
+def first_sentence(text, limit=160):
+    match = re.match(r'(.+?[.!?])(\s|$)', text.strip(), re.S)
+    sentence = match.group(1) if match else text.strip()
+    if len(sentence) > limit:
+        sentence = sentence[:limit - 3].rstrip() + '...'
+    return ' '.join(sentence.split())
+
+
+def summarize_exchanges(history, previous_summary, max_chars):
+    """
+    Extractive summary: one line per exchange with the visitor's question
+    and the first sentence of the reply, oldest lines dropped past max_chars
+    """
+    lines = previous_summary.splitlines() if previous_summary else []
+    for i in range(0, len(history) - 1, 2):
+        question = first_sentence(message_text(history[i]), limit=120)
+        reply = first_sentence(message_text(history[i + 1]))
+        lines.append(f"- Visitor: {question} / Receptionist: {reply}")
+
+    while lines and len('\n'.join(lines)) > max_chars:
+        lines.pop(0)
+    return '\n'.join(lines)
+
+
+class HistoryManager:
+    """
+    Rolling window + summary + token budget for chat histories.
+
+    Args:
+        window_turns: recent exchanges kept verbatim
+        summary_max_chars: size bound of the running summary
+        token_budget: estimated tokens allowed per request (0 = unlimited)
+        base_tokens: tokens always sent (e.g. the persona prompt)
+        summarize: callable(old_messages, previous_summary, max_chars) -> summary
+    """
+
+    def __init__(self, window_turns=6, summary_max_chars=1200, token_budget=2000,
+                 base_tokens=0, summarize=summarize_exchanges):
+        self.window_turns = window_turns
+        self.summary_max_chars = summary_max_chars
+        self.token_budget = token_budget
+        self.base_tokens = base_tokens
+        self.summarize = summarize
+
+        self._lock = threading.Lock()
+        self.compactions = 0
+        self.budget_trims = 0
+        self.prompts = 0
+        self.prompt_tokens_total = 0
+        self.prompt_tokens_max = 0
+
+    def compact(self, history, summary=None):
+        """
+        Fold exchanges older than the window into the summary
+
+        Returns: (history, summary) to store
+        """
+        limit = self.window_turns * 2
+        if not self.window_turns or len(history) <= limit:
+            return history, summary
+
+        # Fold whole exchanges so the window always starts with a user turn
+        cut = len(history) - limit
+        cut += cut % 2
+        old, recent = history[:cut], history[cut:]
+        summary = self.summarize(old, summary, self.summary_max_chars)
+        with self._lock:
+            self.compactions += 1
+        return recent, summary
+
+    def build(self, history, summary=None, message=''):
+        """
+        Messages to start a chat with for the next request
+
+        Returns: (messages, estimated prompt tokens including ``message``)
+        """
+        prefix = []
+        if summary:
+            prefix = [
+                {"role": "user", "parts": [SUMMARY_PREFIX + summary]},
+                {"role": "model", "parts": [SUMMARY_ACKNOWLEDGEMENT]},
+            ]
+
+        fixed = self.base_tokens + estimate_tokens(message) + sum(
+            estimate_tokens(message_text(m)) for m in prefix
+        )
+        window = list(history)
+        sizes = [estimate_tokens(message_text(m)) for m in window]
+        total = fixed + sum(sizes)
+
+        trimmed = False
+        # Leave out the oldest exchanges until the request fits (always
+        # keep the latest one)
+        while self.token_budget and total > self.token_budget and len(window) > 2:
+            total -= sizes[0] + sizes[1]
+            window, sizes = window[2:], sizes[2:]
+            trimmed = True
+
+        if trimmed:
+            with self._lock:
+                self.budget_trims += 1
+        return prefix + window, total
+
+    def record_prompt(self, tokens):
+        """Track the prompt size of a request that was sent"""
+        with self._lock:
+            self.prompts += 1
+            self.prompt_tokens_total += tokens
+            self.prompt_tokens_max = max(self.prompt_tokens_max, tokens)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "window_turns": self.window_turns,
+                "token_budget": self.token_budget,
+                "prompts": self.prompts,
+                "avg_prompt_tokens": (
+                    round(self.prompt_tokens_total / self.prompts, 1) if self.prompts else 0.0
+                ),
+                "max_prompt_tokens": self.prompt_tokens_max,
+                "compactions": self.compactions,
+                "budget_trims": self.budget_trims,
+            }
@@ -0,0 +1,284 @@
+"""
+Latency Metrics
+===============
+Per-stage timing for the receptionist pipeline (STT, Gemini, TTS, D-ID
+create, D-ID ready), exported in the Prometheus text format on
+``/metrics`` and summarised per request in a ``Server-Timing`` header.
+
+Usage:
+    with metrics.stage('tts'):
+        tts_client.synthesize_speech(...)
+
+Each stage records a latency histogram, an in-flight gauge and, when the
+block raises, an upstream error counter. Other values (cache hit ratios,
+tracker counts) are exported through gauge callbacks that are read at
+scrape time; totals kept by other components (calls avoided, requests
+shed) through counter callbacks.
+
+No client library is required; the exposition format is plain text.
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Upper bounds (seconds) for latency histograms; D-ID renders take tens
+# of seconds, STT/TTS calls well under one
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+# Stage timings of the current request, for the Server-Timing header
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            for labelvalues, value in sorted(self._values.items()):
+                yield self.name, _format_labels(self.labelnames, labelvalues), value
+
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+
+    kind = 'gauge'
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = {
+                    "counts": [0] * len(self.buckets), "sum": 0.0, "count": 0
+                }
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    def totals(self):
+        """Observation count and sum per label values"""
+        with self._lock:
+            return {
+                labelvalues: (s["count"], s["sum"])
+                for labelvalues, s in self._series.items()
+            }
+
+    def samples(self):
+        with self._lock:
+            snapshot = sorted(
+                (labelvalues, list(s["counts"]), s["sum"], s["count"])
+                for labelvalues, s in self._series.items()
+            )
+        for labelvalues, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(
+                    self.labelnames + ('le',), labelvalues + (_format_value(bound),)
+                )
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class Metrics:
+    """
+    Registry of pipeline metrics.
+
+    Args:
+        namespace: prefix for every metric name
+        buckets: latency histogram buckets (seconds)
+    """
+
+    def __init__(self, namespace='receptionist', buckets=DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self._metrics = []
+        self._callbacks = []
+
+        self.stage_seconds = self.histogram(
+            'stage_duration_seconds', 'Time spent in each pipeline stage',
+            ['stage'], buckets
+        )
+        self.stage_in_flight = self.gauge(
+            'stage_in_flight', 'Calls currently running per pipeline stage', ['stage']
+        )
+        self.upstream_errors = self.counter(
+            'upstream_errors_total', 'Failed calls per pipeline stage', ['stage']
+        )
+        self.request_seconds = self.histogram(
+            'request_duration_seconds', 'API request latency (until response headers)',
+            ['endpoint', 'status'], buckets
+        )
+
+    # ------------------------------------------------------------------
+    # Registration
+    # ------------------------------------------------------------------
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(f"{self.namespace}_{name}", documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(f"{self.namespace}_{name}", documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(
+            Histogram(f"{self.namespace}_{name}", documentation, labelnames, buckets)
+        )
+
+    def gauge_callback(self, name, documentation, read, labelname=None):
+        """
+        Gauge read at scrape time. ``read()`` returns a number, or a dict of
+        label value -> number when ``labelname`` is given.
+        """
+        self._callbacks.append(
+            (f"{self.namespace}_{name}", 'gauge', documentation, read, labelname)
+        )
+
+    def counter_callback(self, name, documentation, read, labelname=None):
+        """
+        Counter read at scrape time, for totals another component keeps
+        (``read`` as for ``gauge_callback``; name it ``..._total``)
+        """
+        self._callbacks.append(
+            (f"{self.namespace}_{name}", 'counter', documentation, read, labelname)
+        )
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def stage(self, name):
+        """Time one call of a pipeline stage"""
+        self.stage_in_flight.inc(name)
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.upstream_errors.inc(name)
+            raise
+        finally:
+            self.stage_in_flight.dec(name)
+            self.observe_stage(name, time.perf_counter() - start)
+
+    def observe_stage(self, name, seconds):
+        """Record a stage duration measured elsewhere (e.g. D-ID render time)"""
+        self.stage_seconds.observe(seconds, name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((name, seconds))
+
+    def start_request(self):
+        """Begin collecting stage timings for the current request"""
+        _request_timings.set([])
+        return time.perf_counter()
+
+    def finish_request(self, started, endpoint, status):
+        """Record request latency and return the Server-Timing header value"""
+        elapsed = time.perf_counter() - started
+        self.request_seconds.observe(elapsed, endpoint or 'unknown', str(status))
+        header = self.server_timing(started)
+        _request_timings.set(None)
+        return header
+
+    def server_timing(self, started):
+        """
+        Server-Timing value for the stages recorded since ``started`` (a
+        ``start_request`` result) in this context and copies of it
+        """
+        elapsed = time.perf_counter() - started
+        totals = {}
+        for name, seconds in list(_request_timings.get() or ()):
+            totals[name] = totals.get(name, 0.0) + seconds
+
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items()]
+        entries.append(f"total;dur={elapsed * 1000:.1f}")
+        return ', '.join(entries)
+
+    # ------------------------------------------------------------------
+    # Exposition
+    # ------------------------------------------------------------------
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+
+        for name, kind, documentation, read, labelname in self._callbacks:
+            try:
+                value = read()
+            except Exception as e:
+                print(f"Error reading metric {name}: {str(e)}")
+                continue
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            if labelname is None:
+                lines.append(f"{name} {_format_value(value)}")
+            else:
+                for label, item in sorted(value.items()):
+                    if item is None:
+                        continue
+                    labels = _format_labels((labelname,), (label,))
+                    lines.append(f"{name}{labels} {_format_value(item)}")
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,107 @@
+"""
+Sentence Pipeline
+=================
+Overlaps response generation with speech synthesis.
+
+Streamed model output is cut into sentences as it arrives. Each finished
+sentence is sent to TTS on a thread pool right away, and the audio
+segments are handed back in order, so the first sentence can play while
+later ones are still being generated or synthesized.
+
+The stream reader and the TTS calls run in copies of the caller's
+context, so request-scoped context variables (upstream priority, stage
+timings) follow them onto the worker threads.
+"""
+
+import contextvars
+import queue
+import re
+import threading
+
+
+# Sentence end: terminal punctuation (incl. Arabic question mark), optional
+# closing quotes/brackets, then whitespace
+SENTENCE_END = re.compile(r'[.!?؟]+["\')\]]*\s+')
+
+
+class SentenceSplitter:
+    """
+    Incrementally splits streamed text into sentences.
+
+    Sentences shorter than ``min_chars`` are merged with the next one so
+    fragments like "Hi." do not become separate TTS calls.
+    """
+
+    def __init__(self, min_chars=12):
+        self.min_chars = min_chars
+        self._buffer = ''
+
+    def feed(self, text):
+        """Add streamed text; return the sentences completed by it"""
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(self._buffer):
+            candidate = self._buffer[start:match.end()].strip()
+            if len(candidate) >= self.min_chars:
+                sentences.append(candidate)
+                start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self):
+        """Return whatever text is left at the end of the stream"""
+        remainder = self._buffer.strip()
+        self._buffer = ''
+        return [remainder] if remainder else []
+
+
+def pipelined_speech(text_chunks, synthesize, executor, min_chars=12):
+    """
+    Synthesize streamed text sentence by sentence.
+
+    Args:
+        text_chunks: iterator of text fragments (e.g. streamed LLM output)
+        synthesize: callable(sentence) -> audio bytes
+        executor: thread pool the TTS calls run on
+        min_chars: minimum sentence length (see SentenceSplitter)
+
+    Yields:
+        (index, sentence, audio_bytes) in sentence order, as soon as each
+        segment and all segments before it are ready
+    """
+    segments = queue.Queue()
+    context = contextvars.copy_context()
+
+    def synthesize_in_context(sentence):
+        # One copy per call: a context can only be entered by one thread
+        return executor.submit(contextvars.copy_context().run, synthesize, sentence)
+
+    def produce():
+        # Reads the text stream on its own thread so TTS for finished
+        # sentences starts while the model is still generating
+        try:
+            splitter = SentenceSplitter(min_chars)
+            for chunk in text_chunks:
+                for sentence in splitter.feed(chunk):
+                    segments.put((sentence, synthesize_in_context(sentence)))
+            for sentence in splitter.flush():
+                segments.put((sentence, synthesize_in_context(sentence)))
+        except Exception as e:
+            segments.put(e)
+        finally:
+            segments.put(None)
+
+    threading.Thread(target=context.run, args=(produce,), name='sentence-pipeline',
+                     daemon=True).start()
+
+    index = 0
+    while True:
+        item = segments.get()
+        if item is None:
+            return
+        if isinstance(item, Exception):
+            raise item
+        sentence, future = item
+        yield index, sentence, future.result()
+        index += 1
@@ -0,0 +1,249 @@
+"""
+Semantic Response Cache
+=======================
+Reuses Gemini replies for questions that were already answered in other
+words ("when are you open" / "when are you open today?").
+
+Questions are embedded locally with hashed n-gram features (words, word
+pairs and character trigrams folded into a fixed-size signed vector), so
+no embedding model or API call is needed. Each language has its own
+partition, a NumPy matrix of unit vectors; a lookup is one matrix-vector
+product and a hit needs a cosine similarity of at least ``threshold``.
+
+Only context-free first turns should be cached or served: a reply that
+depended on earlier conversation must not be handed to another visitor.
+
+Hashed n-grams catch rephrasing, typos, filler words and punctuation, not
+true synonyms; keep the threshold high so a hit is always the same
+question.
+"""
+
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from faq_bank import normalize
+
+
+# Frequent words that tell Finnish and English apart when the script can't
+FINNISH_WORDS = frozenset("""
+    ja ei olemme olen olet ovat voin voit voi miten mitä missä milloin mihin
+    kello tervetuloa hei moi terve kiitos auki tai kanssa myös meillä tämä
+    sinut apua mielelläni aukioloajat
+""".split())
+ENGLISH_WORDS = frozenset("""
+    the and is are you we our your what where when how can hello hi welcome
+    thank thanks please open help of to for with this
+""".split())
+
+
+def guess_language(text, default='en'):
+    """
+    Coarse language of a text: 'ar', 'fi' or 'en' from the script, Finnish
+    letters and frequent words; ``default`` when there is nothing to go on
+    """
+    for char in text:
+        if '؀' <= char <= 'ۿ':
+            return 'ar'
+    if any(char in text for char in 'äöåÄÖÅ'):
+        return 'fi'
+    words = normalize(text).split()
+    finnish = sum(1 for word in words if word in FINNISH_WORDS)
+    english = sum(1 for word in words if word in ENGLISH_WORDS)
+    if finnish > english:
+        return 'fi'
+    if english:
+        return 'en'
+    return default
+
+
+class HashedNgramEmbedder:
+    """
+    Bag of hashed n-gram features, L2-normalized.
+
+    Args:
+        dim: vector size (hash buckets)
+        char_weight: weight of character trigrams relative to words
+    """
+
+    def __init__(self, dim=1024, char_weight=0.5):
+        self.dim = dim
+        self.char_weight = char_weight
+
+    def features(self, text):
+        words = normalize(text).split()
+        for word in words:
+            yield word, 1.0
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3], self.char_weight
+        for first, second in zip(words, words[1:]):
+            yield f"{first} {second}", 1.0
+
+    def embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self.features(text):
+            h = zlib.crc32(feature.encode('utf-8'))
+            # Low bits pick the bucket, the top bit the sign (keeps
+            # colliding features from always adding up)
+            vector[h % self.dim] += weight if h & 0x80000000 else -weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class _Partition:
+    """Vectors and entries of one language (caller holds the cache lock)"""
+
+    def __init__(self, dim, capacity):
+        self.capacity = capacity
+        self.vectors = np.zeros((min(64, capacity), dim), dtype=np.float32)
+        self.entries = []
+
+    def similarities(self, vector):
+        return self.vectors[:len(self.entries)] @ vector
+
+    def append(self, vector, entry):
+        if len(self.entries) == len(self.vectors):
+            grown = np.zeros((min(2 * len(self.vectors), self.capacity),
+                              self.vectors.shape[1]), dtype=np.float32)
+            grown[:len(self.vectors)] = self.vectors
+            self.vectors = grown
+        self.vectors[len(self.entries)] = vector
+        self.entries.append(entry)
+
+    def remove(self, index):
+        """Swap-remove: move the last row into ``index``"""
+        last = len(self.entries) - 1
+        if index != last:
+            self.vectors[index] = self.vectors[last]
+            self.entries[index] = self.entries[last]
+        self.entries.pop()
+
+
+class SemanticCache:
+    """
+    Similarity-matched reply cache, partitioned by language.
+
+    Args:
+        threshold: minimum cosine similarity for a hit (0-1)
+        ttl: seconds a cached reply stays valid
+        max_entries: capacity per language; least recently used replies
+            are evicted first
+        embedder: object with ``embed(text) -> unit vector``
+    """
+
+    def __init__(self, threshold=0.9, ttl=3600, max_entries=1000, embedder=None):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.embedder = embedder or HashedNgramEmbedder()
+
+        self._partitions = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.evicted = 0
+
+    def lookup(self, text, language=None, cacheable=True):
+        """
+        Return a cached reply for a similar question, or None
+
+        ``cacheable=False`` (follow-up turns) only counts the skip.
+        """
+        if not cacheable:
+            with self._lock:
+                self.skipped += 1
+            return None
+
+        language = language or guess_language(text)
+        vector = self.embedder.embed(text)
+        now = time.time()
+
+        with self._lock:
+            partition = self._partitions.get(language)
+            if partition is None or not partition.entries:
+                self.misses += 1
+                return None
+
+            self._expire(partition, now)
+            if not partition.entries:
+                self.misses += 1
+                return None
+
+            scores = partition.similarities(vector)
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            entry = partition.entries[best]
+            entry['last_used'] = now
+            entry['hits'] += 1
+            self.hits += 1
+            return entry['reply']
+
+    def put(self, text, reply, language=None):
+        """Cache the reply to a (context-free) question"""
+        if not reply:
+            return
+        language = language or guess_language(text)
+        vector = self.embedder.embed(text)
+        now = time.time()
+
+        with self._lock:
+            partition = self._partitions.get(language)
+            if partition is None:
+                partition = self._partitions[language] = _Partition(
+                    len(vector), self.max_entries
+                )
+            self._expire(partition, now)
+
+            # Same question again (e.g. two concurrent misses): refresh it
+            if partition.entries:
+                scores = partition.similarities(vector)
+                best = int(np.argmax(scores))
+                if scores[best] >= 0.999:
+                    partition.entries[best].update(reply=reply, created_at=now,
+                                                   last_used=now)
+                    return
+
+            if len(partition.entries) >= self.max_entries:
+                oldest = min(range(len(partition.entries)),
+                             key=lambda i: partition.entries[i]['last_used'])
+                partition.remove(oldest)
+                self.evicted += 1
+
+            partition.append(vector, {
+                "question": text,
+                "reply": reply,
+                "created_at": now,
+                "last_used": now,
+                "hits": 0,
+            })
+
+    def _expire(self, partition, now):
+        """Drop replies older than the TTL (caller holds the lock)"""
+        for index in range(len(partition.entries) - 1, -1, -1):
+            if now - partition.entries[index]['created_at'] > self.ttl:
+                partition.remove(index)
+
+    def stats(self):
+        """Hit counters; every hit is one Gemini call avoided"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": {
+                    language: len(partition.entries)
+                    for language, partition in self._partitions.items()
+                },
+                "hits": self.hits,
+                "misses": self.misses,
+                "skipped_follow_ups": self.skipped,
+                "evicted": self.evicted,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "llm_calls_avoided": self.hits,
+            }
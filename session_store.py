@@ -0,0 +1,298 @@
+"""
+Conversation Session Store
+==========================
+Pluggable storage for conversation history.
+
+Sessions are stored as serialized history (a list of
+``{"role": ..., "parts": [...]}`` messages) instead of live chat objects,
+so any worker or replica can rebuild the chat for a session. A session may
+also carry a ``summary`` of older turns (see history_manager.py). Backends:
+- InMemorySessionStore: per-process LRU with idle TTL and size bounds
+- RedisSessionStore: shared key-value store with server-side expiry
+
+Expired sessions are dropped automatically; no periodic scan is needed.
+
+Appending a turn is a read-modify-write of the stored history, so it goes
+through ``update``: the in-memory store runs it under its lock and the
+Redis store as a WATCH/MULTI transaction retried on conflict. Two requests
+answering turns of the same session at once both keep their turn.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def trim_history(history, max_turns, keep_first=0):
+    """
+    Bound a history to its most recent ``max_turns`` exchanges.
+
+    One turn is a user message plus the model reply (two messages). The
+    first ``keep_first`` messages (e.g. a persona exchange) are always kept.
+    """
+    if not max_turns:
+        return history
+    head, tail = history[:keep_first], history[keep_first:]
+    limit = max_turns * 2
+    if len(tail) > limit:
+        tail = tail[-limit:]
+    return head + tail
+
+
+class SessionStore:
+    """
+    Interface for session backends.
+
+    ``load`` returns ``{"history": [...], "summary": str or None,
+    "created_at": ts}`` or None.
+    """
+
+    def load(self, session_id):
+        raise NotImplementedError
+
+    def save(self, session_id, history, created_at=None, summary=None):
+        raise NotImplementedError
+
+    def update(self, session_id, apply):
+        """
+        Atomically read-modify-write a session
+
+        ``apply(record or None)`` returns the ``(history, summary)`` to
+        store; it may be called again if another writer got in first, so
+        it must be safe to repeat. This base version is not atomic.
+        """
+        record = self.load(session_id)
+        history, summary = apply(record)
+        self.save(session_id, history,
+                  created_at=record['created_at'] if record else None, summary=summary)
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+    def exists(self, session_id):
+        """Whether a live session exists (without refreshing it)"""
+        return self.load(session_id) is not None
+
+    def purge_expired(self):
+        """Drop expired sessions now; returns how many were removed"""
+        return 0
+
+    def stats(self):
+        return {}
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Process-local store: LRU bounded by ``max_sessions``, sessions expire
+    ``ttl`` seconds after their last use, history bounded to ``max_turns``.
+
+    Entries are kept in last-use order, so expired sessions always sit at
+    the front and expiry costs O(expired) rather than a scan of all
+    sessions.
+    """
+
+    def __init__(self, max_sessions=1000, ttl=3600, max_turns=20, keep_first=0):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self.keep_first = keep_first
+
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.expired = 0
+        self.evicted = 0
+
+    def load(self, session_id):
+        with self._lock:
+            return self._load(session_id)
+
+    def save(self, session_id, history, created_at=None, summary=None):
+        with self._lock:
+            self._save(session_id, history, created_at, summary)
+
+    def update(self, session_id, apply):
+        """
+        Read-modify-write under the store lock (``apply`` should be quick;
+        it blocks every other session operation while it runs)
+        """
+        with self._lock:
+            record = self._load(session_id)
+            history, summary = apply(record)
+            self._save(session_id, history, record['created_at'] if record else None, summary)
+
+    def _load(self, session_id):
+        """Copy of a live session, refreshed (caller holds the lock)"""
+        self._expire(time.time())
+        record = self._sessions.get(session_id)
+        if record is None:
+            return None
+        record['last_used'] = time.time()
+        self._sessions.move_to_end(session_id)
+        return {
+            "history": list(record['history']),
+            "summary": record.get('summary'),
+            "created_at": record['created_at'],
+        }
+
+    def _save(self, session_id, history, created_at, summary):
+        """Store a session and enforce the bounds (caller holds the lock)"""
+        now = time.time()
+        history = trim_history(history, self.max_turns, self.keep_first)
+        previous = self._sessions.pop(session_id, None)
+        if created_at is None:
+            created_at = previous['created_at'] if previous else now
+        self._sessions[session_id] = {
+            "history": history,
+            "summary": summary,
+            "created_at": created_at,
+            "last_used": now,
+        }
+        self._expire(now)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def exists(self, session_id):
+        with self._lock:
+            record = self._sessions.get(session_id)
+            return record is not None and time.time() - record['last_used'] <= self.ttl
+
+    def purge_expired(self):
+        with self._lock:
+            before = len(self._sessions)
+            self._expire(time.time())
+            return before - len(self._sessions)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "expired": self.expired,
+                "evicted": self.evicted,
+            }
+
+    def _expire(self, now):
+        """Pop idle sessions from the LRU front (caller holds the lock)"""
+        while self._sessions:
+            session_id, record = next(iter(self._sessions.items()))
+            if now - record['last_used'] <= self.ttl:
+                break
+            del self._sessions[session_id]
+            self.expired += 1
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Shared store backed by Redis (or any server speaking its protocol).
+
+    Sessions are JSON values with a sliding expiry of ``ttl`` seconds, so
+    they survive worker switches and can be shared by all replicas. The
+    total number of sessions is bounded by the server's memory policy.
+
+    Args:
+        client: a redis-py compatible client (``get``/``set``/``expire``,
+            and ``pipeline`` for ``update``)
+        ttl: idle expiry in seconds
+        max_turns: history bound applied on save
+        keep_first: leading messages that are never trimmed
+        prefix: key prefix for session entries
+        max_update_attempts: transaction retries before ``update`` gives up
+    """
+
+    def __init__(self, client, ttl=3600, max_turns=20, keep_first=0,
+                 prefix='receptionist:session:', max_update_attempts=10):
+        self.client = client
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self.keep_first = keep_first
+        self.prefix = prefix
+        self.max_update_attempts = max_update_attempts
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        """Connect using a redis:// URL (requires the ``redis`` package)"""
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError(
+                "SESSION_STORE_URL is set but the 'redis' package is not installed. "
+                "Run: pip install redis"
+            )
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def _key(self, session_id):
+        return f"{self.prefix}{session_id}"
+
+    def load(self, session_id):
+        key = self._key(session_id)
+        raw = self.client.get(key)
+        if raw is None:
+            return None
+        self.client.expire(key, int(self.ttl))
+        return self._decode(raw)
+
+    def save(self, session_id, history, created_at=None, summary=None):
+        if created_at is None:
+            existing = self.load(session_id)
+            created_at = existing['created_at'] if existing else time.time()
+        self.client.set(self._key(session_id),
+                        self._encode(history, summary, created_at), ex=int(self.ttl))
+
+    def update(self, session_id, apply):
+        """
+        Read-modify-write in a WATCH/MULTI transaction
+
+        If another worker writes the session between the read and the
+        write, the transaction is dropped and ``apply`` runs again on the
+        new value.
+
+        Raises: RuntimeError if the session kept changing for
+        ``max_update_attempts`` attempts
+        """
+        from redis.exceptions import WatchError
+
+        key = self._key(session_id)
+        with self.client.pipeline() as pipe:
+            for _ in range(self.max_update_attempts):
+                try:
+                    pipe.watch(key)
+                    raw = pipe.get(key)
+                    record = self._decode(raw) if raw is not None else None
+                    history, summary = apply(record)
+                    created_at = record['created_at'] if record else time.time()
+                    pipe.multi()
+                    pipe.set(key, self._encode(history, summary, created_at), ex=int(self.ttl))
+                    pipe.execute()
+                    return
+                except WatchError:
+                    continue
+        raise RuntimeError(f"Session {session_id} kept changing; update abandoned")
+
+    def _encode(self, history, summary, created_at):
+        return json.dumps({
+            "history": trim_history(history, self.max_turns, self.keep_first),
+            "summary": summary,
+            "created_at": created_at,
+        })
+
+    @staticmethod
+    def _decode(raw):
+        record = json.loads(raw)
+        record.setdefault('summary', None)
+        return record
+
+    def delete(self, session_id):
+        self.client.delete(self._key(session_id))
+
+    def exists(self, session_id):
+        return bool(self.client.exists(self._key(session_id)))
+
+    def stats(self):
+        return {"backend": "redis", "ttl": self.ttl}
@@ -0,0 +1,104 @@
+"""
+Single-Flight Request Coalescing
+================================
+Collapses identical concurrent upstream calls into one.
+
+When a busy lobby asks the same question, or the browser retries, several
+requests can need the same TTS clip, the same D-ID talk or the same talk
+status at the same moment. The first caller for a key (the leader) makes
+the upstream call; callers that arrive while it is in flight wait for it
+and share its result, or its exception. Nothing is kept once the call
+returns - caching finished results is the job of the caches. A follower
+with a tighter time budget than the leader's call passes ``timeout`` and
+gives up waiting (FlightTimeout) when it runs out; the leader's call
+carries on for the others.
+
+Usage:
+    audio = single_flight.do('tts', cache_key, synthesize)
+"""
+
+import threading
+
+
+class FlightTimeout(TimeoutError):
+    """A follower's timeout passed before the shared call finished"""
+
+
+class _Call:
+    """One in-flight call and the outcome its followers wait for"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    Per-key coalescing of concurrent calls, grouped by upstream.
+
+    Results are handed to every caller as-is, so they should be treated
+    as read-only.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._counts = {}  # group -> {"calls": leaders, "coalesced": followers}
+
+    def do(self, group, key, fn, timeout=None):
+        """
+        Return ``fn()``, sharing one execution between concurrent callers
+        with the same ``(group, key)``
+
+        Args:
+            timeout: longest a follower waits for the shared call (seconds;
+                None waits for it to finish). The leader's own ``fn`` is
+                not interrupted - bound it with its own timeout.
+        Raises: FlightTimeout when a follower's ``timeout`` passes
+        """
+        flight_key = (group, key)
+        with self._lock:
+            counts = self._counts.setdefault(group, {"calls": 0, "coalesced": 0})
+            call = self._calls.get(flight_key)
+            leader = call is None
+            if leader:
+                call = self._calls[flight_key] = _Call()
+                counts['calls'] += 1
+            else:
+                call.followers += 1
+                counts['coalesced'] += 1
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise FlightTimeout(f"Shared {group} call still running after {timeout:g}s")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[flight_key]
+            call.done.set()
+
+    def stats(self):
+        """Upstream calls made and calls that joined one, per group"""
+        with self._lock:
+            in_flight = {}
+            for group, _ in self._calls:
+                in_flight[group] = in_flight.get(group, 0) + 1
+            return {
+                group: {
+                    "calls": counts['calls'],
+                    "coalesced": counts['coalesced'],
+                    "in_flight": in_flight.get(group, 0),
+                }
+                for group, counts in self._counts.items()
+            }
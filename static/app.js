@@ -13,6 +13,25 @@ let isRecording = false;
 // API base URL (change this for production)
 const API_BASE_URL = window.location.origin;
 
+// Stream audio to the server while recording (falls back to a single
+// upload to /api/complete-flow when streaming is unavailable)
+const USE_STREAMING_STT = true;
+const STREAM_CHUNK_MS = 250;
+
+// Play the reply sentence by sentence while it is still being generated
+// (uses /api/complete-flow with mode=pipelined; audio only, no avatar video)
+const PIPELINED_AUDIO = false;
+
+// Keep a live avatar stream open (D-ID streams API, when the server has
+// DID_STREAMS=true) and let replies be spoken into it instead of rendered
+// as video clips. Falls back to clips when unavailable.
+const USE_AVATAR_STREAM = true;
+const AVATAR_STREAM_KEEPALIVE_MS = 30000;
+
+// Identifies this kiosk across page loads and conversations
+const kioskId = getKioskId();
+let avatarStream = null;
+
 /**
  * Generate a unique session ID for conversation tracking
  */
@@ -20,6 +39,23 @@ function generateSessionId() {
     return 'session_' + Date.now() + '_' + Math.random().toString(36).substr(2, 9);
 }
 
+/**
+ * Stable id of this kiosk (kept in localStorage across page loads)
+ */
+function getKioskId() {
+    let id = null;
+    try {
+        id = localStorage.getItem('kioskId');
+        if (!id) {
+            id = 'kiosk_' + Math.random().toString(36).substr(2, 12);
+            localStorage.setItem('kioskId', id);
+        }
+    } catch (error) {
+        id = id || 'kiosk_' + Math.random().toString(36).substr(2, 12);
+    }
+    return id;
+}
+
 /**
  * Show status message to user
  */
@@ -92,9 +128,17 @@ async function startRecording() {
         // Reset audio chunks
         audioChunks = [];
         
-        // Collect audio data
+        // Open a streaming recognition request if enabled
+        const activeStream = (USE_STREAMING_STT && !PIPELINED_AUDIO)
+            ? await openSpeechStream()
+            : null;
+        
+        // Collect audio data (and forward it while streaming)
         mediaRecorder.addEventListener('dataavailable', (event) => {
             audioChunks.push(event.data);
+            if (activeStream) {
+                sendStreamChunk(activeStream, event.data);
+            }
         });
         
         // Handle recording stop
@@ -102,12 +146,21 @@ async function startRecording() {
             // Stop all tracks to release microphone
             stream.getTracks().forEach(track => track.stop());
             
-            // Process the recorded audio
-            await processRecording();
+            if (activeStream) {
+                // The server answers over the stream's event channel
+                endSpeechStream(activeStream);
+            } else {
+                // Process the recorded audio
+                await processRecording();
+            }
         });
         
-        // Start recording
-        mediaRecorder.start();
+        // Start recording (emit chunks periodically when streaming)
+        if (activeStream) {
+            mediaRecorder.start(STREAM_CHUNK_MS);
+        } else {
+            mediaRecorder.start();
+        }
         isRecording = true;
         
         // Update UI
@@ -155,6 +208,12 @@ async function processRecording() {
         const formData = new FormData();
         formData.append('audio', audioBlob, 'recording.webm');
         formData.append('session_id', sessionId);
+        formData.append('kiosk_id', kioskId);
+        
+        if (PIPELINED_AUDIO) {
+            await processPipelined(formData);
+            return;
+        }
         
         // Send to backend for complete processing
         const response = await fetch(`${API_BASE_URL}/api/complete-flow`, {
@@ -169,17 +228,7 @@ async function processRecording() {
         
         const data = await response.json();
         
-        // Update session ID
-        sessionId = data.session_id;
-        
-        // Add messages to conversation log
-        addToConversationLog(data.user_text, true);
-        addToConversationLog(data.assistant_text, false);
-        
-        showStatus('Generating avatar video...', 'info');
-        
-        // Poll for video completion
-        await pollVideoStatus(data.talk_id, data.audio_base64);
+        await handleFlowResult(data);
         
     } catch (error) {
         console.error('Error processing recording:', error);
@@ -190,9 +239,304 @@ async function processRecording() {
 }
 
 /**
- * Poll D-ID API for video completion
+ * Send audio in pipelined mode and play the reply as it streams in
+ */
+async function processPipelined(formData) {
+    formData.append('mode', 'pipelined');
+    formData.append('avatar', 'false');
+    
+    const response = await fetch(`${API_BASE_URL}/api/complete-flow`, {
+        method: 'POST',
+        body: formData
+    });
+    
+    if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.error || 'Failed to process audio');
+    }
+    
+    const player = createAudioQueue();
+    let replyText = '';
+    
+    await readEventStream(response, (event) => {
+        if (event.type === 'audio') {
+            // First sentence starts playing right away
+            player.enqueue(audioSource(event));
+            replyText += (replyText ? ' ' : '') + event.text;
+            showStatus(replyText, 'info');
+        } else if (event.type === 'done') {
+            sessionId = event.session_id;
+            addToConversationLog(event.user_text, true);
+            addToConversationLog(event.assistant_text, false);
+        } else if (event.type === 'error') {
+            throw new Error(event.error);
+        }
+    });
+    
+    await player.finished();
+    showStatus('Response ready!', 'success');
+    setLoading(false);
+    resetUI();
+}
+
+/**
+ * Parse a Server-Sent Events response body (fetch-based, works with POST)
+ */
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const message = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            const data = message.split('\n')
+                .filter(line => line.startsWith('data: '))
+                .map(line => line.slice(6))
+                .join('\n');
+            
+            if (data) {
+                onEvent(JSON.parse(data));
+            }
+        }
+    }
+}
+
+/**
+ * Sequential audio player for streamed reply segments
+ */
+function createAudioQueue() {
+    let chain = Promise.resolve();
+    
+    return {
+        enqueue(src) {
+            chain = chain.then(() => new Promise((resolve) => {
+                const audio = new Audio(src);
+                audio.addEventListener('ended', resolve);
+                audio.addEventListener('error', resolve);
+                audio.play().catch(resolve);
+            }));
+        },
+        finished() {
+            return chain;
+        }
+    };
+}
+
+/**
+ * Show a complete-flow result and wait for its avatar video
+ */
+async function handleFlowResult(data) {
+    // Update session ID
+    sessionId = data.session_id;
+    
+    // Add messages to conversation log
+    addToConversationLog(data.user_text, true);
+    addToConversationLog(data.assistant_text, false);
+    
+    if (data.status === 'completed') {
+        // Cached avatar video - no rendering needed
+        displayVideo(data.video_url);
+        showStatus('Response ready!', 'success');
+        setLoading(false);
+        resetUI();
+        return;
+    }
+    
+    if (data.status === 'streaming') {
+        // Spoken by the live avatar stream - nothing to download or play
+        showLiveAvatar();
+        showStatus('Response ready!', 'success');
+        setLoading(false);
+        resetUI();
+        return;
+    }
+    
+    if (data.status === 'audio_only') {
+        // The avatar could not be rendered in time: speak over the idle clip
+        playAudioOnly(audioSource(data), data.idle_video_url);
+        showStatus('Response ready!', 'success');
+        setLoading(false);
+        resetUI();
+        return;
+    }
+    
+    showStatus('Generating avatar video...', 'info');
+    
+    // Poll for video completion
+    waitForVideo(data.talk_id, audioSource(data));
+}
+
+/**
+ * Open a streaming speech recognition request
+ * Returns null if streaming is unavailable (caller falls back to upload)
  */
-async function pollVideoStatus(talkId, audioBase64) {
+async function openSpeechStream() {
+    try {
+        const response = await fetch(`${API_BASE_URL}/api/stt-stream`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ session_id: sessionId, kiosk_id: kioskId })
+        });
+        
+        if (!response.ok) {
+            return null;
+        }
+        
+        const data = await response.json();
+        const speechStream = {
+            id: data.stream_id,
+            pending: Promise.resolve(),
+            events: new EventSource(`${API_BASE_URL}/api/stt-stream/${data.stream_id}/events`)
+        };
+        
+        speechStream.events.onmessage = (message) => {
+            handleSpeechStreamEvent(speechStream, JSON.parse(message.data));
+        };
+        
+        return speechStream;
+        
+    } catch (error) {
+        console.warn('Streaming speech recognition unavailable:', error);
+        return null;
+    }
+}
+
+/**
+ * Send one recorded chunk (chained so chunks arrive in order)
+ */
+function sendStreamChunk(speechStream, chunk) {
+    speechStream.pending = speechStream.pending
+        .then(() => fetch(`${API_BASE_URL}/api/stt-stream/${speechStream.id}/chunk`, {
+            method: 'POST',
+            body: chunk
+        }))
+        .catch(error => console.error('Error sending audio chunk:', error));
+}
+
+/**
+ * Tell the server the recording has ended
+ */
+function endSpeechStream(speechStream) {
+    setLoading(true);
+    speechStream.pending = speechStream.pending
+        .then(() => fetch(`${API_BASE_URL}/api/stt-stream/${speechStream.id}/end`, {
+            method: 'POST'
+        }))
+        .catch(error => console.error('Error ending audio stream:', error));
+}
+
+/**
+ * Handle events pushed by the streaming recognizer
+ */
+async function handleSpeechStreamEvent(speechStream, event) {
+    switch (event.type) {
+        case 'interim':
+            showStatus('Heard: "' + event.transcript + '"', 'info');
+            break;
+        
+        case 'end_of_utterance':
+            // The server detected the end of the question - stop recording
+            stopRecording();
+            break;
+        
+        case 'final':
+            setLoading(true);
+            showStatus('Thinking...', 'info');
+            break;
+        
+        case 'response':
+            speechStream.events.close();
+            try {
+                await handleFlowResult(event);
+            } catch (error) {
+                console.error('Error handling response:', error);
+                showStatus('Error: ' + error.message, 'error');
+                setLoading(false);
+                resetUI();
+            }
+            break;
+        
+        case 'error':
+            speechStream.events.close();
+            stopRecording();
+            showStatus('Error: ' + event.error, 'error');
+            setLoading(false);
+            resetUI();
+            break;
+        
+        case 'done':
+            speechStream.events.close();
+            break;
+    }
+}
+
+/**
+ * Wait for the avatar video to finish rendering
+ * The server pushes the final status over Server-Sent Events; browsers
+ * without EventSource (or a dropped stream) fall back to polling.
+ */
+function waitForVideo(talkId, audioSrc) {
+    if (!window.EventSource) {
+        pollVideoStatus(talkId, audioSrc);
+        return;
+    }
+    
+    const events = new EventSource(`${API_BASE_URL}/api/video-events/${talkId}`);
+    let finished = false;
+    
+    events.onmessage = (message) => {
+        const data = JSON.parse(message.data);
+        if (data.status === 'processing') {
+            return;
+        }
+        finished = true;
+        events.close();
+        handleVideoStatus(data, audioSrc);
+    };
+    
+    events.onerror = () => {
+        if (finished) {
+            return;
+        }
+        // Don't let EventSource reconnect forever; poll instead
+        events.close();
+        pollVideoStatus(talkId, audioSrc);
+    };
+}
+
+/**
+ * Show a finished video (or its error) and reset the UI
+ */
+function handleVideoStatus(data, audioSrc) {
+    if (data.status === 'completed') {
+        // Display the video
+        displayVideo(data.video_url);
+        
+        // Play audio while video is loading (fallback)
+        playAudioFallback(audioSrc);
+        
+        showStatus('Response ready!', 'success');
+    } else {
+        showStatus('Error: ' + (data.error || 'Video generation failed'), 'error');
+    }
+    setLoading(false);
+    resetUI();
+}
+
+/**
+ * Poll the server for video completion (fallback for waitForVideo)
+ */
+async function pollVideoStatus(talkId, audioSrc) {
     const maxAttempts = 60; // 2 minutes maximum
     let attempts = 0;
     
@@ -208,22 +552,9 @@ async function pollVideoStatus(talkId, audioBase64) {
             const response = await fetch(`${API_BASE_URL}/api/check-video-status/${talkId}`);
             const data = await response.json();
             
-            if (data.status === 'completed') {
-                clearInterval(pollInterval);
-                
-                // Display the video
-                displayVideo(data.video_url);
-                
-                // Play audio while video is loading (fallback)
-                playAudioFallback(audioBase64);
-                
-                showStatus('Response ready!', 'success');
-                setLoading(false);
-                resetUI();
-                
-            } else if (data.status === 'error') {
+            if (data.status === 'completed' || data.status === 'error') {
                 clearInterval(pollInterval);
-                throw new Error('Video generation failed');
+                handleVideoStatus(data, audioSrc);
             }
             // else continue polling
             
@@ -247,8 +578,13 @@ function displayVideo(videoUrl) {
     // Hide placeholder
     placeholderEl.style.display = 'none';
     
-    // Show and play video
+    // Show and play video (replacing a looping idle clip or the live
+    // avatar stream, which comes back once the clip has ended)
+    videoEl.srcObject = null;
+    videoEl.loop = false;
+    videoEl.muted = false;
     videoEl.src = videoUrl;
+    videoEl.onended = avatarStream ? showLiveAvatar : null;
     videoEl.style.display = 'block';
     videoEl.load();
     
@@ -260,12 +596,177 @@ function displayVideo(videoUrl) {
     });
 }
 
+/**
+ * Open this kiosk's live avatar stream: the server creates it at D-ID and
+ * returns an SDP offer; the browser answers and the avatar's video and
+ * voice arrive over WebRTC. Returns false if streams are unavailable.
+ */
+async function connectAvatarStream() {
+    if (!USE_AVATAR_STREAM || !window.RTCPeerConnection) {
+        return false;
+    }
+    try {
+        const response = await fetch(`${API_BASE_URL}/api/avatar-stream`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ kiosk_id: kioskId })
+        });
+        if (!response.ok) {
+            // 404: streams are disabled on the server
+            return false;
+        }
+        const data = await response.json();
+        
+        disconnectAvatarStream();
+        const peer = new RTCPeerConnection({ iceServers: data.ice_servers });
+        const current = { id: data.stream_id, peer: peer, mediaStream: null, keepalive: null };
+        
+        peer.addEventListener('track', (event) => {
+            current.mediaStream = event.streams[0];
+            showLiveAvatar();
+        });
+        peer.addEventListener('icecandidate', (event) => {
+            if (!event.candidate) {
+                return;
+            }
+            avatarStreamPost('ice', {
+                stream_id: current.id,
+                candidate: event.candidate.candidate,
+                sdpMid: event.candidate.sdpMid,
+                sdpMLineIndex: event.candidate.sdpMLineIndex
+            });
+        });
+        peer.addEventListener('iceconnectionstatechange', () => {
+            if (['failed', 'closed'].includes(peer.iceConnectionState) && avatarStream === current) {
+                reconnectAvatarStream();
+            }
+        });
+        
+        await peer.setRemoteDescription(data.offer);
+        const answer = await peer.createAnswer();
+        await peer.setLocalDescription(answer);
+        const sdpResponse = await avatarStreamPost('sdp', { stream_id: current.id, answer: answer });
+        if (!sdpResponse.ok) {
+            peer.close();
+            return false;
+        }
+        
+        // Heartbeat: keeps the stream from being reaped, and reconnects
+        // ahead of the next reply when D-ID has dropped it
+        current.keepalive = setInterval(async () => {
+            try {
+                const beat = await avatarStreamPost('keepalive', { stream_id: current.id });
+                const state = (await beat.json()).state;
+                if (state === 'expired' || state === 'closed') {
+                    reconnectAvatarStream();
+                }
+            } catch (error) {
+                console.warn('Avatar stream keepalive failed:', error);
+            }
+        }, AVATAR_STREAM_KEEPALIVE_MS);
+        
+        avatarStream = current;
+        return true;
+        
+    } catch (error) {
+        console.warn('Live avatar stream unavailable:', error);
+        return false;
+    }
+}
+
+/**
+ * POST to one of this kiosk's avatar stream endpoints
+ */
+function avatarStreamPost(action, body) {
+    return fetch(`${API_BASE_URL}/api/avatar-stream/${kioskId}/${action}`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(body)
+    });
+}
+
+/**
+ * Drop the current avatar stream (the server closes it at D-ID)
+ */
+function disconnectAvatarStream() {
+    if (!avatarStream) {
+        return;
+    }
+    clearInterval(avatarStream.keepalive);
+    avatarStream.peer.close();
+    avatarStream = null;
+}
+
+/**
+ * Replace a failed or expired avatar stream with a new one
+ */
+async function reconnectAvatarStream() {
+    disconnectAvatarStream();
+    if (!await connectAvatarStream()) {
+        console.warn('Avatar stream reconnect failed; replies use video clips');
+    }
+}
+
+/**
+ * Show the live avatar stream in the video element
+ */
+function showLiveAvatar() {
+    if (!avatarStream || !avatarStream.mediaStream) {
+        return;
+    }
+    const videoEl = document.getElementById('avatarVideo');
+    document.getElementById('placeholder').style.display = 'none';
+    videoEl.onended = null;
+    videoEl.removeAttribute('src');
+    videoEl.loop = false;
+    videoEl.muted = false;
+    videoEl.srcObject = avatarStream.mediaStream;
+    videoEl.style.display = 'block';
+    videoEl.play().catch(err => console.error('Error playing avatar stream:', err));
+}
+
+/**
+ * Playable source for a response's audio: the clip URL (streamed and
+ * cached by the browser; the default), otherwise an inline base64 data URI
+ */
+function audioSource(data) {
+    if (data.audio_url) {
+        return data.audio_url;
+    }
+    return 'data:audio/mp3;base64,' + (data.audio_base64 || data.audio);
+}
+
+/**
+ * Play a reply without its avatar video, looping the idle-avatar clip
+ * (muted) while the audio plays
+ */
+function playAudioOnly(audioSrc, idleVideoUrl) {
+    const videoEl = document.getElementById('avatarVideo');
+    
+    if (idleVideoUrl) {
+        document.getElementById('placeholder').style.display = 'none';
+        videoEl.srcObject = null;
+        videoEl.src = idleVideoUrl;
+        videoEl.loop = true;
+        videoEl.muted = true;
+        videoEl.style.display = 'block';
+        videoEl.play().catch(err => console.error('Error playing idle video:', err));
+    }
+    
+    const audio = new Audio(audioSrc);
+    audio.addEventListener('ended', () => {
+        videoEl.loop = false;
+        videoEl.muted = false;
+    });
+    audio.play().catch(err => console.error('Error playing audio:', err));
+}
+
 /**
  * Play audio as fallback (if video takes too long)
  */
-function playAudioFallback(audioBase64) {
+function playAudioFallback(audioSrc) {
     try {
-        const audio = new Audio('data:audio/mp3;base64,' + audioBase64);
+        const audio = new Audio(audioSrc);
         // Audio will play in background while video loads
     } catch (error) {
         console.error('Error playing audio fallback:', error);
@@ -299,10 +800,14 @@ function resetConversation() {
     const videoEl = document.getElementById('avatarVideo');
     const placeholderEl = document.getElementById('placeholder');
     
+    videoEl.srcObject = null;
     videoEl.src = '';
     videoEl.style.display = 'none';
     placeholderEl.style.display = 'block';
     
+    // The kiosk's live avatar stays on across conversations
+    showLiveAvatar();
+    
     // Clear status
     document.getElementById('statusMessage').classList.remove('show');
     
@@ -339,6 +844,19 @@ document.addEventListener('DOMContentLoaded', async () => {
         showStatus('Error: Your browser does not support audio recording', 'error');
         document.getElementById('talkBtn').disabled = true;
     }
+    
+    // Open the live avatar stream (if the server supports it)
+    connectAvatarStream();
+});
+
+// Release the avatar stream when the kiosk page goes away
+window.addEventListener('pagehide', () => {
+    if (avatarStream) {
+        navigator.sendBeacon(
+            `${API_BASE_URL}/api/avatar-stream/${kioskId}/close`,
+            new Blob([JSON.stringify({ stream_id: avatarStream.id })], { type: 'application/json' })
+        );
+    }
 });
 
 /**
@@ -393,14 +911,16 @@ async function processStepByStep() {
         });
         
         const ttsData = await ttsResponse.json();
-        const audioBase64 = ttsData.audio;
+        const audioSrc = audioSource(ttsData);
         
         // Step 4: Create Avatar Video
         showStatus('Creating avatar video...', 'info');
         const avatarResponse = await fetch(`${API_BASE_URL}/api/create-avatar-video`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ audio_base64: audioBase64 })
+            body: JSON.stringify(
+                ttsData.audio_id ? { audio_id: ttsData.audio_id } : { audio_base64: ttsData.audio }
+            )
         });
         
         const avatarData = await avatarResponse.json();
@@ -409,8 +929,8 @@ async function processStepByStep() {
             displayVideo(avatarData.video_url);
             showStatus('Response ready!', 'success');
         } else {
-            // Poll for completion
-            await pollVideoStatus(avatarData.talk_id, audioBase64);
+            // Wait for completion (pushed by the server)
+            waitForVideo(avatarData.talk_id, audioSrc);
         }
         
         setLoading(false);
@@ -0,0 +1,249 @@
+"""
+Streaming Speech Recognition
+============================
+Chunked-HTTP ingestion of browser audio into streaming recognition.
+
+The browser posts ``MediaRecorder`` chunks as they are recorded instead of
+uploading the whole utterance at the end. Each recognition stream feeds its
+chunks into ``streaming_recognize`` on a worker thread, publishes interim
+transcripts as events, and hands the final transcript to the chat stage as
+soon as the recognizer reports the end of the utterance.
+"""
+
+import queue
+import threading
+import time
+import uuid
+
+from clients import LazyModule
+
+speech = LazyModule('google.cloud.speech')
+
+
+class GoogleStreamingBackend:
+    """
+    Adapts ``SpeechClient.streaming_recognize`` to a simple result iterator.
+
+    Works with the real Google client or any object exposing the same
+    ``streaming_recognize(config=..., requests=...)`` method (see fakes.py).
+    ``recognition_config`` may be a callable, so the config (and the
+    Speech SDK) is only built when the first stream starts.
+    """
+
+    def __init__(self, client, recognition_config):
+        self.client = client
+        self._recognition_config = recognition_config
+
+    @property
+    def recognition_config(self):
+        if callable(self._recognition_config):
+            self._recognition_config = self._recognition_config()
+        return self._recognition_config
+
+    def recognize(self, chunks):
+        """
+        Yield recognition results for an iterator of audio chunks.
+
+        Each result is a dict with either ``end_of_utterance: True`` or
+        ``transcript``, ``is_final`` and ``confidence``.
+        """
+        streaming_config = speech.StreamingRecognitionConfig(
+            config=self.recognition_config,
+            interim_results=True,
+            single_utterance=True,
+        )
+        requests = (
+            speech.StreamingRecognizeRequest(audio_content=chunk)
+            for chunk in chunks
+        )
+
+        responses = self.client.streaming_recognize(
+            config=streaming_config, requests=requests
+        )
+        for response in responses:
+            event_type = getattr(response.speech_event_type, 'name',
+                                 response.speech_event_type)
+            if event_type == 'END_OF_SINGLE_UTTERANCE':
+                yield {"end_of_utterance": True}
+
+            for result in response.results:
+                if not result.alternatives:
+                    continue
+                alternative = result.alternatives[0]
+                yield {
+                    "transcript": alternative.transcript,
+                    "is_final": result.is_final,
+                    "confidence": alternative.confidence,
+                }
+
+
+class RecognitionStream:
+    """Audio input queue and event output queue of one streaming request"""
+
+    def __init__(self, stream_id, session_id, idle_timeout, kiosk_id=None):
+        self.stream_id = stream_id
+        self.session_id = session_id
+        self.kiosk_id = kiosk_id
+        self.idle_timeout = idle_timeout
+        self.created_at = time.time()
+        self.last_activity = self.created_at
+        self.audio_closed = False
+        self.finished = False
+        self.bytes_received = 0
+
+        self._audio = queue.Queue()
+        self._events = queue.Queue()
+
+    def push_audio(self, chunk):
+        """Queue an audio chunk. Returns False once input is closed"""
+        if self.audio_closed:
+            return False
+        self.last_activity = time.time()
+        self.bytes_received += len(chunk)
+        self._audio.put(chunk)
+        return True
+
+    def close_audio(self):
+        """Signal that no more audio will be sent"""
+        if not self.audio_closed:
+            self.audio_closed = True
+            self._audio.put(None)
+
+    def audio_chunks(self):
+        """Blocking iterator over queued chunks (ends on close or idle)"""
+        while True:
+            try:
+                chunk = self._audio.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                return
+            if chunk is None:
+                return
+            yield chunk
+
+    def emit(self, event_type, **data):
+        data['type'] = event_type
+        self._events.put(data)
+
+    def events(self, heartbeat=15):
+        """
+        Yield events until the stream is done. Yields None every
+        ``heartbeat`` seconds without events so callers can keep the
+        connection alive.
+        """
+        while True:
+            try:
+                event = self._events.get(timeout=heartbeat)
+            except queue.Empty:
+                yield None
+                continue
+            yield event
+            if event['type'] == 'done':
+                return
+
+
+class StreamingRecognizer:
+    """
+    Manages concurrent recognition streams.
+
+    Args:
+        backend: object with ``recognize(chunks)`` (e.g. GoogleStreamingBackend)
+        on_final: callable(stream, transcript, confidence) -> dict, run as
+            soon as the final transcript is known; its result is published
+            as the ``response`` event
+        max_streams: maximum number of concurrently active streams
+        idle_timeout: end a stream after this many seconds without audio
+        retention: keep finished streams around this long for late readers
+    """
+
+    def __init__(self, backend, on_final, max_streams=100, idle_timeout=10,
+                 retention=60):
+        self.backend = backend
+        self.on_final = on_final
+        self.max_streams = max_streams
+        self.idle_timeout = idle_timeout
+        self.retention = retention
+
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def create(self, session_id, kiosk_id=None):
+        """
+        Start a new recognition stream, or return None when at capacity
+
+        ``kiosk_id`` (the kiosk that is recording) is kept on the stream
+        for ``on_final``.
+        """
+        with self._lock:
+            self._reap()
+            active = sum(1 for s in self._streams.values() if not s.finished)
+            if active >= self.max_streams:
+                return None
+
+            stream = RecognitionStream(
+                uuid.uuid4().hex, session_id, self.idle_timeout, kiosk_id
+            )
+            self._streams[stream.stream_id] = stream
+
+        worker = threading.Thread(
+            target=self._run, args=(stream,),
+            name=f"stt-stream-{stream.stream_id[:8]}", daemon=True
+        )
+        worker.start()
+        return stream
+
+    def get(self, stream_id):
+        with self._lock:
+            return self._streams.get(stream_id)
+
+    def stats(self):
+        with self._lock:
+            active = sum(1 for s in self._streams.values() if not s.finished)
+            return {"streams": len(self._streams), "active": active}
+
+    def _run(self, stream):
+        try:
+            transcript = None
+            confidence = None
+
+            for result in self.backend.recognize(stream.audio_chunks()):
+                if result.get('end_of_utterance'):
+                    # Stop accepting audio; the final result follows
+                    stream.close_audio()
+                    stream.emit('end_of_utterance')
+                elif result['is_final']:
+                    transcript = result['transcript'].strip()
+                    confidence = result['confidence']
+                    break
+                else:
+                    stream.emit('interim', transcript=result['transcript'])
+
+            stream.close_audio()
+
+            if not transcript:
+                stream.emit('error', error="No speech detected")
+                return
+
+            stream.emit('final', transcript=transcript, confidence=confidence)
+
+            # Hand the utterance to the chat stage right away
+            response = self.on_final(stream, transcript, confidence)
+            stream.emit('response', **response)
+
+        except Exception as e:
+            print(f"Error in streaming speech-to-text: {str(e)}")
+            stream.emit('error', error=f"Streaming speech-to-text error: {str(e)}")
+        finally:
+            stream.close_audio()
+            stream.finished = True
+            stream.last_activity = time.time()
+            stream.emit('done')
+
+    def _reap(self):
+        """Forget finished or abandoned streams (caller holds the lock)"""
+        now = time.time()
+        expired = [
+            stream_id for stream_id, stream in self._streams.items()
+            if stream.finished and now - stream.last_activity > self.retention
+        ]
+        for stream_id in expired:
+            del self._streams[stream_id]
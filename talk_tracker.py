@@ -0,0 +1,305 @@
+"""
+D-ID Talk Tracker
+=================
+Background job manager for D-ID talk generation.
+
+Instead of every request busy-polling ``/talks/{id}`` (and pinning a Flask
+worker for up to a minute), endpoints register the talk here and return
+immediately. One shared poller thread checks all in-flight talks in batches,
+backing off per talk while it is still rendering, and keeps the latest state
+in memory so status endpoints can answer without calling D-ID again.
+
+Clients that want to be told when a talk is ready call ``wait()``; any
+number of waiters share the tracker's single watch of each talk and are
+woken together when it finishes.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# D-ID talk statuses that mean the job is finished
+TERMINAL_STATUSES = ('done', 'error', 'rejected')
+
+
+class TalkJob:
+    """State of a single tracked D-ID talk"""
+
+    def __init__(self, talk_id, interval, context=None):
+        self.talk_id = talk_id
+        self.context = context
+        self.status = 'created'
+        self.result_url = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.next_check = self.created_at + interval
+        self.interval = interval
+        self.checks = 0
+
+    @property
+    def finished(self):
+        return self.status in TERMINAL_STATUSES
+
+    def to_dict(self):
+        return {
+            "talk_id": self.talk_id,
+            "status": self.status,
+            "result_url": self.result_url,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "checks": self.checks,
+        }
+
+
+class TalkTracker:
+    """
+    Tracks in-flight D-ID talks with a single shared poller.
+
+    Args:
+        fetch_status: callable(talk_id) -> D-ID talk JSON (dict)
+        min_interval: first delay before a talk is checked (seconds)
+        max_interval: upper bound for the per-talk backoff (seconds)
+        backoff: multiplier applied to a talk's interval after each check
+        batch_size: maximum number of talks checked per poller cycle
+        max_workers: size of the thread pool used to check a batch
+        timeout: give up on a talk after this many seconds
+        retention: keep finished talks queryable for this many seconds
+        on_finished: optional callable(job_dict, context) run once when a
+            talk reaches a terminal status
+    """
+
+    def __init__(self, fetch_status, min_interval=1.0, max_interval=8.0,
+                 backoff=1.5, batch_size=20, max_workers=4, timeout=300,
+                 retention=3600, on_finished=None):
+        self.fetch_status = fetch_status
+        self.on_finished = on_finished
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.retention = retention
+
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._finished = threading.Condition(self._lock)
+        self._waiters = 0
+        self._thread = None
+        self._executor = None
+        self._stopped = False
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def track(self, talk_id, context=None):
+        """
+        Start tracking a talk (no-op if it is already tracked)
+
+        ``context`` is passed back to ``on_finished`` when the talk ends.
+        """
+        with self._lock:
+            job = self._jobs.get(talk_id)
+            if job is None:
+                job = TalkJob(talk_id, self.min_interval, context)
+                self._jobs[talk_id] = job
+                self._wakeup.notify()
+            snapshot = job.to_dict()
+        self._ensure_started()
+        return snapshot
+
+    def get(self, talk_id):
+        """Return the last known state of a talk, or None if not tracked"""
+        with self._lock:
+            job = self._jobs.get(talk_id)
+            return job.to_dict() if job else None
+
+    def wait(self, talk_id, timeout=None):
+        """
+        Block until a talk reaches a terminal status or ``timeout`` expires
+
+        Returns: the latest state (finished or not), or None if not tracked
+        """
+        with self._lock:
+            self._waiters += 1
+            try:
+                self._finished.wait_for(
+                    lambda: talk_id not in self._jobs or self._jobs[talk_id].finished,
+                    timeout=timeout
+                )
+            finally:
+                self._waiters -= 1
+            job = self._jobs.get(talk_id)
+            return job.to_dict() if job else None
+
+    def stats(self):
+        """Summary counters for monitoring"""
+        with self._lock:
+            in_flight = sum(1 for job in self._jobs.values() if not job.finished)
+            return {
+                "tracked": len(self._jobs),
+                "in_flight": in_flight,
+                "finished": len(self._jobs) - in_flight,
+                "waiters": self._waiters,
+            }
+
+    def stop(self):
+        """Stop the poller thread (used on shutdown and in tests)"""
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify()
+            self._finished.notify_all()
+        if self._thread:
+            self._thread.join(timeout=5)
+        if self._executor:
+            self._executor.shutdown(wait=False)
+
+    # ------------------------------------------------------------------
+    # Poller
+    # ------------------------------------------------------------------
+
+    def _ensure_started(self):
+        # Started lazily so importing the app (or the Flask reloader parent
+        # process) does not spawn threads that are never used.
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped = False
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix='did-poll'
+            )
+            self._thread = threading.Thread(
+                target=self._run, name='did-talk-tracker', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._stopped:
+                    return
+                batch, wait, timed_out = self._next_batch()
+                if timed_out:
+                    self._finished.notify_all()
+                elif not batch:
+                    self._wakeup.wait(timeout=wait)
+                    continue
+
+            self._notify_finished(timed_out)
+            if not batch:
+                continue
+
+            # Check the whole batch concurrently, outside the lock
+            results = list(self._executor.map(self._check, batch))
+
+            finished = []
+            with self._lock:
+                for talk_id, data, error in results:
+                    if self._apply(talk_id, data, error):
+                        job = self._jobs[talk_id]
+                        finished.append((job.to_dict(), job.context))
+                if finished:
+                    self._finished.notify_all()
+
+            self._notify_finished(finished)
+
+    def _notify_finished(self, finished):
+        """Run the completion callback off the poller thread"""
+        if not self.on_finished:
+            return
+        for job, context in finished:
+            self._executor.submit(self._safe_callback, job, context)
+
+    def _safe_callback(self, job, context):
+        try:
+            self.on_finished(job, context)
+        except Exception as e:
+            print(f"Error in talk completion callback: {str(e)}")
+
+    def _next_batch(self):
+        """
+        Pick due talks (caller holds the lock)
+
+        Returns: (ids to check, seconds until the next is due, timed-out
+        talks as (job_dict, context) pairs)
+        """
+        now = time.time()
+        self._prune(now)
+
+        due = []
+        timed_out = []
+        next_due = None
+        for job in self._jobs.values():
+            if job.finished:
+                continue
+            if now - job.created_at > self.timeout:
+                job.status = 'error'
+                job.error = 'Video generation timeout'
+                job.updated_at = now
+                timed_out.append((job.to_dict(), job.context))
+                continue
+            if job.next_check <= now:
+                due.append(job)
+            elif next_due is None or job.next_check < next_due:
+                next_due = job.next_check
+
+        due.sort(key=lambda job: job.next_check)
+        batch = [job.talk_id for job in due[:self.batch_size]]
+        if len(due) > self.batch_size:
+            wait = 0
+        elif next_due is not None:
+            wait = max(next_due - now, 0.05)
+        else:
+            wait = None  # Idle until a new talk is tracked
+        return batch, wait, timed_out
+
+    def _check(self, talk_id):
+        try:
+            return talk_id, self.fetch_status(talk_id), None
+        except Exception as e:
+            return talk_id, None, e
+
+    def _apply(self, talk_id, data, error):
+        """
+        Record a poll result (caller holds the lock)
+
+        Returns True if this result moved the talk to a terminal status.
+        """
+        job = self._jobs.get(talk_id)
+        if job is None or job.finished:
+            return False
+
+        now = time.time()
+        job.checks += 1
+        job.updated_at = now
+
+        if error is not None:
+            print(f"Error polling D-ID talk {talk_id}: {str(error)}")
+        else:
+            status = data.get('status', job.status)
+            job.status = status
+            if status == 'done':
+                job.result_url = data.get('result_url')
+            elif status in ('error', 'rejected'):
+                job.error = "Video generation failed"
+
+        # Adaptive backoff: check again sooner for fresh talks, less often
+        # the longer a talk keeps rendering (or the API keeps failing)
+        job.interval = min(job.interval * self.backoff, self.max_interval)
+        job.next_check = now + job.interval
+        return job.finished
+
+    def _prune(self, now):
+        """Drop finished talks past the retention window (caller holds lock)"""
+        expired = [
+            talk_id for talk_id, job in self._jobs.items()
+            if job.finished and now - job.updated_at > self.retention
+        ]
+        for talk_id in expired:
+            del self._jobs[talk_id]
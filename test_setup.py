@@ -10,12 +10,9 @@ import os
 def test_python_version():
     """Test if Python version is 3.8 or higher"""
     version = sys.version_info
-    if version.major >= 3 and version.minor >= 8:
-        print("✓ Python version OK:", sys.version.split()[0])
-        return True
-    else:
-        print("✗ Python version too old. Need 3.8+, got:", sys.version.split()[0])
-        return False
+    assert version.major >= 3 and version.minor >= 8, \
+        f"Python version too old. Need 3.8+, got: {sys.version.split()[0]}"
+    print("✓ Python version OK:", sys.version.split()[0])
 
 def test_imports():
     """Test if all required modules can be imported"""
@@ -26,7 +23,8 @@ def test_imports():
         'google.cloud.speech',
         'google.cloud.texttospeech',
         'google.generativeai',
-        'requests'
+        'requests',
+        'numpy'
     ]
     
     all_ok = True
@@ -38,12 +36,38 @@ def test_imports():
             print(f"✗ {module} not found")
             all_ok = False
     
-    return all_ok
+    assert all_ok, "Some required modules are not installed"
 
 def test_file_structure():
     """Test if all required files exist"""
     required_files = [
         'app.py',
+        'talk_tracker.py',
+        'tts_cache.py',
+        'video_cache.py',
+        'streaming_stt.py',
+        'fakes.py',
+        'pipeline.py',
+        'session_store.py',
+        'upstream_limits.py',
+        'single_flight.py',
+        'wsgi.py',
+        'gunicorn.conf.py',
+        'did_client.py',
+        'did_streams.py',
+        'audio_store.py',
+        'metrics.py',
+        'faq_bank.py',
+        'faq.json',
+        'response_cache.py',
+        'history_manager.py',
+        'audio_preprocess.py',
+        'voices.py',
+        'batch_jobs.py',
+        'batch_generate.py',
+        'clients.py',
+        'circuit_breaker.py',
+        'deadlines.py',
         'requirements.txt',
         '.env.example',
         '.gitignore',
@@ -60,7 +84,7 @@ def test_file_structure():
             print(f"✗ {file} missing")
             all_ok = False
     
-    return all_ok
+    assert all_ok, "Some required files are missing"
 
 def test_directories():
     """Test if required directories exist"""
@@ -78,13 +102,13 @@ def test_directories():
             print(f"✗ {dir}/ missing")
             all_ok = False
     
-    return all_ok
+    assert all_ok, "Some required directories are missing"
 
 def test_env_file():
     """Test if .env file is configured"""
     if not os.path.exists('.env'):
         print("⚠️  .env file not found - you need to create it from .env.example")
-        return False
+        return
     
     print("✓ .env file exists")
     
@@ -103,8 +127,1082 @@ def test_env_file():
             print(f"✓ {var} appears to be configured")
         else:
             print(f"⚠️  {var} needs to be configured in .env")
+
+def make_wav(samples, rate=16000):
+    """16-bit mono WAV bytes from float samples in [-1, 1]"""
+    import io
+    import wave
+    import numpy as np
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes((np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes())
+    return buffer.getvalue()
+
+def test_audio_preprocessing():
+    """Test that silence and steady noise are rejected and speech is trimmed"""
+    import numpy as np
+    from audio_preprocess import AudioPreprocessor
+    
+    rate = 16000
+    rng = np.random.default_rng(7)
+    preprocessor = AudioPreprocessor(ffmpeg_path=None)
+    
+    silence = preprocessor.process(make_wav(np.zeros(2 * rate)))
+    assert not silence.speech, "silence is rejected"
+    
+    # Steady background noise louder than the -45 dBFS floor
+    noise = preprocessor.process(make_wav(rng.normal(0, 10 ** (-40 / 20), 3 * rate)))
+    assert not noise.speech and noise.seconds_out == 0.0, "-40 dBFS white noise is rejected"
+    
+    # One second of a syllable-like modulated tone between quiet stretches
+    t = np.arange(rate) / rate
+    voice = 0.3 * np.sin(2 * np.pi * 220 * t) * (0.55 + 0.45 * np.sin(2 * np.pi * 4 * t))
+    quiet = rng.normal(0, 10 ** (-70 / 20), rate)
+    padded = preprocessor.process(make_wav(np.concatenate([quiet, voice, quiet])))
+    assert padded.speech, "speech padded with silence is detected"
+    assert 1.0 <= padded.seconds_out <= 1.5, \
+        f"silence is trimmed (3.0s -> {padded.seconds_out:.2f}s)"
+    assert padded.encoding == 'linear16' and padded.sample_rate == rate, \
+        "trimmed audio is 16 kHz LINEAR16"
+
+def test_avatar_streams():
+    """Test the avatar stream pool against the stub D-ID server"""
+    import threading
+    from did_client import DIDClient
+    from did_streams import StreamPool, StreamClosed
+    from fakes import StubDIDServer
+    from upstream_limits import Overloaded
+    
+    with StubDIDServer(latency=0.2) as stub:
+        client = DIDClient(api_key='test', base_url=stub.url, max_retries=0)
+        pool = StreamPool(client, f"{stub.url}/avatar.png", max_streams=2)
+        
+        first = pool.open('lobby')
+        assert first['offer'] and stub.streams[first['stream_id']]['state'] == 'created', \
+            "open returns the SDP offer of a new stream"
+        pool.answer('lobby', first['stream_id'], {"type": "answer", "sdp": "v=0"})
+        assert pool.is_connected('lobby'), "the SDP answer connects the stream"
+        pool.speak('lobby', {"type": "text", "input": "Welcome!"})
+        assert len(stub.streams[first['stream_id']]['talks']) == 1, \
+            "speak sends a talk on the stream"
+        
+        second = pool.open('lobby')
+        assert second['stream_id'] != first['stream_id'] and \
+            stub.streams[first['stream_id']]['state'] == 'closed', \
+            "reconnecting closes the old stream"
+        try:
+            pool.speak('lobby', {"type": "text", "input": "Hello again"})
+            spoke = True
+        except StreamClosed:
+            spoke = False
+        assert not spoke, "a reconnected stream does not speak before it is answered"
+        
+        pool.open('desk')
+        try:
+            pool.open('garage')
+            overloaded = None
+        except Overloaded as e:
+            overloaded = e
+        assert overloaded is not None and overloaded.reason == 'pool_full', \
+            "a full pool refuses new kiosks"
+        pool.stop()
+        
+        # Concurrent opens must not overshoot max_streams while D-ID is slow
+        pool = StreamPool(client, f"{stub.url}/avatar.png", max_streams=2)
+        results = []
+        
+        def open_stream(kiosk_id):
+            try:
+                pool.open(kiosk_id)
+                results.append('opened')
+            except Overloaded:
+                results.append('full')
+        
+        threads = [threading.Thread(target=open_stream, args=(f"kiosk-{n}",)) for n in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results.count('opened') == 2 and pool.stats()['streams'] == 2, \
+            f"concurrent opens stay within max_streams ({results.count('opened')} of 6 opened)"
+        pool.stop()
+        client.close()
+
+def test_batch_job_lock():
+    """Test that a job lock is only taken over from a dead owner"""
+    import shutil
+    import tempfile
+    import time
+    from batch_jobs import BatchJobs, LOCK_GRACE_SECONDS
+    
+    directory = tempfile.mkdtemp(prefix='receptionist-test-')
+    try:
+        jobs = BatchJobs(directory, '/static/batch', None, None, None)
+        lock_path = os.path.join(jobs._job_dir('job'), 'lock')
+        os.makedirs(os.path.dirname(lock_path))
+        
+        assert jobs._claim('job') and open(lock_path).read() == str(os.getpid()), \
+            "a free lock is claimed with this process id"
+        jobs._release('job')
+        
+        open(lock_path, 'w').close()
+        assert not jobs._claim('job'), "a lock still being written (empty) is held"
+        stale = time.time() - LOCK_GRACE_SECONDS - 1
+        os.utime(lock_path, (stale, stale))
+        assert jobs._claim('job'), "an empty lock older than the grace period is taken over"
+        
+        with open(lock_path, 'w') as f:
+            f.write(str(os.getppid()))
+        assert not jobs._claim('job'), "a lock of a live process is held"
+        leftovers = [name for name in os.listdir(os.path.dirname(lock_path))
+                     if name.endswith('.tmp')]
+        assert not leftovers, \
+            "no temporary lock files are left behind"
+    finally:
+        shutil.rmtree(directory)
+
+def test_video_cache():
+    """Test remote URL expiry and sharing the index between processes"""
+    import shutil
+    import tempfile
+    import time
+    from video_cache import VideoCache
+    
+    directory = tempfile.mkdtemp(prefix='receptionist-test-')
+    try:
+        index_path = os.path.join(directory, 'index.json')
+        first = VideoCache(index_path, directory, ttl=7 * 24 * 3600, remote_ttl=3600)
+        second = VideoCache(index_path, directory, ttl=7 * 24 * 3600, remote_ttl=3600)
+        
+        entry = first.store('a', 'https://d-id.example/a.mp4', talk_id='tlk_a')
+        assert entry['expires_at'] <= time.time() + 3600, "remote URLs get the short remote TTL"
+        signed = f"https://d-id.example/b.mp4?Expires={int(time.time()) + 600}&Signature=x"
+        entry = second.store('b', signed, talk_id='tlk_b')
+        assert entry['expires_at'] <= time.time() + 600, \
+            "signed URLs expire no later than their Expires parameter"
+        
+        first.store('c', 'https://d-id.example/c.mp4', talk_id='tlk_c')
+        shared = VideoCache(index_path, directory)
+        assert all(shared.lookup(key) for key in 'abc'), \
+            "entries stored by two processes all survive in the index"
+        
+        first._entries['a']['created_at'] -= 2 * 3600
+        first._entries['a']['expires_at'] -= 2 * 3600
+        assert first.lookup('a') is None, "remote entries expire after the remote TTL"
+        assert 'a' not in VideoCache(index_path, directory)._entries, \
+            "an expired entry is not merged back from the index"
+    finally:
+        shutil.rmtree(directory)
+
+# Environment for importing app.py with the offline fakes of fakes.py
+OFFLINE_ENVIRONMENT = {
+    'STT_BACKEND': 'fake',
+    'TTS_BACKEND': 'fake',
+    'GEMINI_BACKEND': 'fake',
+    'DID_API_KEY': 'test',
+    'CLIENT_WARMUP': 'false',
+    'BATCH_RESUME_ON_START': 'false',
+    'FAQ_ENABLED': 'false',
+    'RESPONSE_CACHE_ENABLED': 'false',
+    'TTS_CACHE_DISK': 'false',
+    'VIDEO_CACHE_DOWNLOAD': 'false',
+    'SESSION_STORE_URL': '',
+}
+
+def load_offline_app():
+    """Import app.py with fake upstreams (no API keys or network needed)"""
+    for name, value in OFFLINE_ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+    import app
+    return app
+
+def sse_events(response):
+    """JSON events of a finished Server-Sent Events response"""
+    import json
+    body = response.get_data(as_text=True)
+    response.close()
+    return [json.loads(line[len('data: '):]) for line in body.splitlines()
+            if line.startswith('data: ')]
+
+def test_stt_stream():
+    """Test the streaming speech endpoints end to end with the fake recognizer"""
+    import fakes
+    from did_client import DIDClient
     
-    return True
+    app = load_offline_app()
+    transcript = "Where is the conference room?"
+    with fakes.StubDIDServer(render_seconds=0.1) as stub:
+        app.clients.inject('did', DIDClient(api_key='test', base_url=stub.url, max_retries=0))
+        app.clients.inject('stt', fakes.FakeSpeechClient(transcript))
+        client = app.app.test_client()
+        
+        response = client.post('/api/stt-stream', json={"session_id": "test-stt-stream"})
+        started = response.get_json()
+        response.close()
+        assert response.status_code == 200 and started['session_id'] == 'test-stt-stream', \
+            "a recognition stream is started"
+        stream_id = started['stream_id']
+        
+        for _ in range(3):
+            response = client.post(f"/api/stt-stream/{stream_id}/chunk", data=b'\x1a\x45\xdf\xa3' * 64)
+            accepted = response.get_json()['accepted']
+            response.close()
+            assert accepted, "audio chunks are accepted"
+        response = client.post(f"/api/stt-stream/{stream_id}/end")
+        response.close()
+        assert response.get_json()['status'] == 'closed', "the end of the input is acknowledged"
+        
+        events = sse_events(client.get(f"/api/stt-stream/{stream_id}/events"))
+        types = [event['type'] for event in events]
+        assert 'interim' in types and types[-1] == 'done', \
+            f"events are streamed ({', '.join(types)})"
+        final = next(event for event in events if event['type'] == 'final')
+        assert final['transcript'] == transcript, "the final transcript matches the speech"
+        reply = next((event for event in events if event['type'] == 'response'), {})
+        assert reply.get('user_text') == transcript and reply.get('assistant_text'), \
+            "the transcript is answered"
+        
+        response = client.post(f"/api/stt-stream/{stream_id}/chunk", data=b'\x00')
+        response.close()
+        assert response.status_code in (200, 404) and not (response.get_json() or {}).get('accepted'), \
+            "chunks after the end are refused"
+        response = client.post("/api/stt-stream/unknown/chunk", data=b'\x00')
+        response.close()
+        assert response.status_code == 404, "an unknown stream gets 404"
+
+def test_did_client_retries():
+    """Test that the D-ID client retries rate limits and 5xx with backoff"""
+    import socket
+    import requests
+    from did_client import DIDClient
+    from fakes import StubDIDServer
+    
+    with StubDIDServer(render_seconds=0, fail_first=2, fail_status=429) as stub:
+        client = DIDClient(api_key='test', base_url=stub.url, max_retries=3, backoff=0.01)
+        talk_id = client.create_talk({"script": {"type": "text", "input": "Hi"}})['id']
+        assert len(stub.requests) == 3 and talk_id in stub.talks, \
+            "a talk is created after two 429 responses"
+        
+        stub.fail_first, stub.fail_status = 2, 502
+        assert client.get_talk(talk_id)['id'] == talk_id and len(stub.requests) == 6, \
+            "a status poll succeeds after two 502 responses"
+        
+        stub.fail_first, stub.fail_status = 1, 500
+        try:
+            client.create_talk({"script": {"type": "text", "input": "Hi"}})
+            raised = False
+        except requests.exceptions.HTTPError:
+            raised = True
+        assert raised and len(stub.requests) == 7, \
+            "creating a talk is not retried after a 500 (it may have been processed)"
+        
+        stub.fail_first, stub.fail_status = 10, 503
+        try:
+            client.get_talk(talk_id)
+            raised = False
+        except requests.exceptions.HTTPError:
+            raised = True
+        assert raised and len(stub.requests) == 11, "retries stop after max_retries"
+        client.close()
+    
+    client = DIDClient(api_key='test', backoff=0.5)
+    delays = [client._delay(attempt) for attempt in range(4)]
+    assert all(0.25 * 2 ** n <= delay <= 0.75 * 2 ** n for n, delay in enumerate(delays)), \
+        "backoff doubles per attempt, with jitter"
+    assert client._delay(0, retry_after='7') == 7, "Retry-After is honoured"
+    client = DIDClient(api_key='test', backoff=0.5, max_retry_after=5)
+    assert client._delay(0, retry_after='3600') == 5, "Retry-After is capped at max_retry_after"
+    
+    # Nothing listens on a closed port, so the create never reached D-ID
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    client = DIDClient(api_key='test', base_url=f"http://127.0.0.1:{port}",
+                       max_retries=2, backoff=0.01)
+    attempts = []
+    send = client.session.request
+    client.session.request = lambda *args, **kwargs: attempts.append(args) or send(*args, **kwargs)
+    try:
+        client.create_talk({"script": {"type": "text", "input": "Hi"}})
+        raised = False
+    except requests.exceptions.ConnectionError:
+        raised = True
+    assert raised and len(attempts) == 3, \
+        f"a refused talk create is retried ({len(attempts)} attempts)"
+
+def test_complete_flow():
+    """Test one complete-flow request with every upstream faked"""
+    import io
+    import shutil
+    import tempfile
+    import time
+    import numpy as np
+    import fakes
+    from did_client import DIDClient
+    from video_cache import VideoCache
+    
+    app = load_offline_app()
+    # A clip cached by an earlier run would skip D-ID
+    scratch = tempfile.mkdtemp(prefix='receptionist-test-')
+    app.video_cache = VideoCache(os.path.join(scratch, 'index.json'), scratch)
+    rate = 16000
+    t = np.arange(rate) / rate
+    recording = make_wav(0.3 * np.sin(2 * np.pi * 220 * t) * (0.55 + 0.45 * np.sin(2 * np.pi * 4 * t)))
+    
+    try:
+        with fakes.StubDIDServer(render_seconds=0.1) as stub:
+            app.clients.inject('did', DIDClient(api_key='test', base_url=stub.url, max_retries=0))
+            app.clients.inject('stt', fakes.FakeSpeechClient("What are your office hours?"))
+            app.clients.inject('gemini', fakes.FakeGenerativeModel(
+                reply="We are open from nine to five, Monday to Friday."
+            ))
+            client = app.app.test_client()
+            
+            response = client.post('/api/complete-flow', data={
+                "audio": (io.BytesIO(recording), 'recording.wav'),
+                "session_id": "test-complete-flow",
+            })
+            result = response.get_json()
+            response.close()
+            assert response.status_code == 200, "complete flow returns 200"
+            assert result['session_id'] == 'test-complete-flow', "the session id is kept"
+            assert result['user_text'] == "What are your office hours?", \
+                "user_text is the transcript"
+            assert result['assistant_text'] == "We are open from nine to five, Monday to Friday.", \
+                "assistant_text is the Gemini reply"
+            assert bool(result.get('audio_url') or result.get('audio_base64')), \
+                "the reply audio is returned"
+            assert result.get('talk_id') in stub.talks, "an avatar talk was created at D-ID"
+            
+            deadline = time.time() + 10
+            status = {}
+            while time.time() < deadline and status.get('status') not in ('completed', 'error'):
+                response = client.get(f"/api/check-video-status/{result['talk_id']}")
+                status = response.get_json()
+                response.close()
+                time.sleep(0.1)
+            assert status.get('status') == 'completed' and status.get('video_url'), \
+                "the avatar video finishes rendering"
+    finally:
+        shutil.rmtree(scratch)
+
+def test_pipelined_priority():
+    """Test that a pipelined reply keeps its request's priority at the upstream gates"""
+    import fakes
+    from upstream_limits import UpstreamLimits, PRIORITY_ACTIVE_SESSION, PRIORITY_NORMAL
+    
+    app = load_offline_app()
+    limits = UpstreamLimits({name: 4 for name in ('stt', 'gemini', 'tts', 'did')})
+    seen = {'gemini': [], 'tts': []}
+    
+    def record(gate, priorities):
+        acquire = gate.acquire
+        
+        def acquire_and_record(priority=PRIORITY_NORMAL, max_wait=None):
+            priorities.append(priority)
+            return acquire(priority, max_wait)
+        gate.acquire = acquire_and_record
+    
+    for name, priorities in seen.items():
+        record(limits._gates[name], priorities)
+    
+    original, app.upstream_limits = app.upstream_limits, limits
+    try:
+        client = app.app.test_client()
+        # The first turn opens the session; the second continues it
+        for turn, expected in enumerate((PRIORITY_NORMAL, PRIORITY_ACTIVE_SESSION)):
+            app.clients.inject('gemini', fakes.FakeGenerativeModel(
+                reply=f"This is reply number {turn}. It has two sentences."
+            ))
+            for priorities in seen.values():
+                priorities.clear()
+            events = sse_events(client.post('/api/chat-stream', json={
+                "message": "Where can I park?", "session_id": "test-pipelined-priority"
+            }))
+            assert events[-1]['type'] == 'done', f"the reply is streamed ({events[-1]})"
+            assert seen['gemini'] and set(seen['gemini']) == {expected}, \
+                f"Gemini calls keep the request priority ({seen['gemini']} != {expected})"
+            assert seen['tts'] and set(seen['tts']) == {expected}, \
+                f"sentence TTS calls keep the request priority ({seen['tts']} != {expected})"
+    finally:
+        app.upstream_limits = original
+
+def test_pipelined_server_timing():
+    """Test that a pipelined reply reports the stages its worker threads ran"""
+    import fakes
+    
+    app = load_offline_app()
+    app.clients.inject('gemini', fakes.FakeGenerativeModel(
+        reply="Visitor parking is behind the building. Please take a ticket at the gate."
+    ))
+    client = app.app.test_client()
+    response = client.post('/api/chat-stream', json={"message": "Where can I park?"})
+    assert 'total;dur=' in response.headers.get('Server-Timing', ''), \
+        "the stream's response headers carry Server-Timing"
+    done = sse_events(response)[-1]
+    assert done['type'] == 'done', f"the reply is streamed ({done})"
+    stages = [entry.split(';')[0] for entry in done.get('server_timing', '').split(', ')]
+    assert 'gemini' in stages and 'tts' in stages and stages[-1] == 'total', \
+        f"the done event times the Gemini and TTS stages ({done.get('server_timing')})"
+
+def test_batch_job_retry():
+    """Test that retrying a failed script reuses its D-ID talk when one was created"""
+    import shutil
+    import tempfile
+    from batch_jobs import BatchJobs
+    
+    directory = tempfile.mkdtemp(prefix='receptionist-test-')
+    talks = []
+    renders = {}
+    
+    def create_talk(audio_content):
+        talks.append(f"tlk_{len(talks)}")
+        return talks[-1]
+    
+    def save_video(talk_id, path):
+        status = renders.get(talk_id, 'done')
+        if status == 'done':
+            with open(path, 'wb') as f:
+                f.write(b'mp4')
+        return {"status": status, "error": None}
+    
+    try:
+        jobs = BatchJobs(directory, '/video/batch', lambda text, language, voice: (b'mp3', {}),
+                         create_talk, save_video, max_attempts=1)
+        # The first talk is still rendering when polling gives up
+        renders['tlk_0'] = 'started'
+        job_id = jobs.submit(["Welcome to the lobby"])['job_id']
+        jobs._threads[job_id].join(10)
+        item = jobs.get(job_id)['items'][0]
+        assert item['status'] == 'failed' and item['talk_id'] == 'tlk_0', \
+            f"a poll timeout fails the script but keeps its talk ({item})"
+        
+        renders['tlk_0'] = 'done'
+        jobs.start(job_id, retry_failed=True).join(10)
+        item = jobs.get(job_id)['items'][0]
+        assert item['status'] == 'done' and talks == ['tlk_0'], \
+            f"the retry picks up the existing talk ({talks})"
+        
+        # A render D-ID reports as failed needs a new talk
+        renders['tlk_1'] = 'error'
+        job_id = jobs.submit(["Please take a seat"])['job_id']
+        jobs._threads[job_id].join(10)
+        item = jobs.get(job_id)['items'][0]
+        assert item['status'] == 'failed' and item['talk_id'] is None, \
+            f"a failed render drops its talk ({item})"
+        jobs.start(job_id, retry_failed=True).join(10)
+        item = jobs.get(job_id)['items'][0]
+        assert item['status'] == 'done' and talks == ['tlk_0', 'tlk_1', 'tlk_2'], \
+            f"the retry creates a new talk ({talks})"
+    finally:
+        shutil.rmtree(directory)
+
+def test_audio_store():
+    """Test that storing a clip again protects it from eviction"""
+    import shutil
+    import tempfile
+    import time
+    from audio_store import AudioStore
+    
+    directory = tempfile.mkdtemp(prefix='receptionist-test-')
+    try:
+        store = AudioStore(directory, max_bytes=2500)
+        first = store.put(b'a' * 1000)
+        second = store.put(b'b' * 1000)
+        assert first != second and store.exists(first) and store.exists(second), \
+            "clips are stored under their digest"
+        
+        # Age both clips (the first is older), then reuse the first one
+        for age, audio_id in ((120, first), (60, second)):
+            stale = time.time() - age
+            os.utime(store.path_for(audio_id), (stale, stale))
+        assert store.put(b'a' * 1000) == first, "storing a clip again returns the same id"
+        
+        third = store.put(b'c' * 1000)
+        assert store.exists(first) and store.exists(third), \
+            "a reused clip and the newest clip are kept"
+        assert not store.exists(second), "the least recently used clip is evicted"
+    finally:
+        shutil.rmtree(directory)
+
+def test_single_flight():
+    """Test that concurrent identical calls share one run, its result and its error"""
+    import threading
+    import time
+    from single_flight import FlightTimeout, SingleFlight
+    
+    flight = SingleFlight()
+    release = threading.Event()
+    runs = []
+    outcomes = []
+    
+    def fail():
+        runs.append(1)
+        release.wait(5)
+        raise ValueError("upstream failed")
+    
+    def call():
+        try:
+            flight.do('did_create', 'clip', fail)
+            outcomes.append(None)
+        except ValueError as e:
+            outcomes.append(e)
+    
+    threads = [threading.Thread(target=call) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    while flight.stats().get('did_create', {}).get('coalesced', 0) < 1:
+        time.sleep(0.01)
+    
+    started = time.monotonic()
+    try:
+        flight.do('did_create', 'clip', fail, timeout=0.1)
+        timed_out = False
+    except FlightTimeout:
+        timed_out = True
+    assert timed_out and time.monotonic() - started < 1, \
+        "a follower gives up when its timeout passes"
+    
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(runs) == 1, f"concurrent callers share one run ({len(runs)} runs)"
+    assert len(outcomes) == 2 and outcomes[0] is outcomes[1] and \
+        isinstance(outcomes[0], ValueError), "every caller sees the same error"
+    assert flight.do('did_create', 'clip', lambda: 'talk') == 'talk', \
+        "nothing is kept once the call finishes"
+
+def test_circuit_breaker():
+    """Test that the D-ID breaker opens on a failure rate, probes and closes again"""
+    import time
+    import requests
+    from circuit_breaker import CircuitBreaker, CircuitOpen
+    from did_client import DIDClient
+    from fakes import StubDIDServer
+    from upstream_limits import UpstreamLimits
+    
+    with StubDIDServer(render_seconds=0) as stub:
+        client = DIDClient(api_key='test', base_url=stub.url, max_retries=0)
+        talk_id = client.create_talk({"script": {"type": "text", "input": "Hi"}})['id']
+        breaker = CircuitBreaker('did', failure_threshold=3, reset_timeout=0.3, window=60)
+        limits = UpstreamLimits({'did': 0}, breakers={'did': breaker})
+        
+        def poll(talk=talk_id):
+            try:
+                with limits.slot('did'):
+                    client.get_talk(talk)
+                return 'ok'
+            except CircuitOpen:
+                return 'refused'
+            except requests.exceptions.HTTPError as e:
+                return e.response.status_code
+        
+        # Failures among many successes stay under the failure ratio
+        outcomes = [poll() for _ in range(6)]
+        stub.fail_first = 3
+        outcomes += [poll() for _ in range(3)]
+        assert outcomes.count(503) == 3 and breaker.state == 'closed', \
+            f"3 failures in 9 calls keep the breaker closed ({outcomes})"
+        
+        # Client errors say nothing about D-ID's health
+        assert [poll('tlk_unknown') for _ in range(5)] == [404] * 5 and breaker.state == 'closed', \
+            "404 responses do not count as failures"
+        
+        breaker = CircuitBreaker('did', failure_threshold=3, reset_timeout=0.3, window=60)
+        limits.breakers['did'] = breaker
+        stub.fail_first = 3
+        outcomes = [poll() for _ in range(4)]
+        assert outcomes == [503, 503, 503, 'refused'], \
+            f"the breaker opens after 3 failed calls and refuses the next ({outcomes})"
+        requests_sent = len(stub.requests)
+        assert poll() == 'refused' and len(stub.requests) == requests_sent, \
+            "refused calls never reach D-ID"
+        
+        time.sleep(0.35)
+        breaker.check()
+        assert breaker.state == 'half_open', "after the cool-down one probe is let through"
+        try:
+            breaker.check()
+            second_probe = True
+        except CircuitOpen:
+            second_probe = False
+        assert not second_probe, "only one probe runs at a time"
+        breaker.record()
+        assert breaker.state == 'closed' and poll() == 'ok', "a successful probe closes the breaker"
+        client.close()
+
+def test_deadlines():
+    """Test that a request's budget rolls forward and the avatar degrades past it"""
+    import time
+    import fakes
+    from circuit_breaker import CircuitBreaker
+    from deadlines import Deadline
+    from did_client import DIDClient
+    
+    deadline = Deadline(2.0, split={'stt': 1, 'gemini': 1, 'did': 2})
+    assert abs(deadline.budget('stt') - 0.5) < 0.05, "a stage gets its share of the budget"
+    assert abs(deadline.budget('gemini') - 2.0 / 3) < 0.05, \
+        "time a stage did not use rolls forward to the later stages"
+    assert deadline.budget('did') <= 2.0 and deadline.timeout('unknown') <= 2.0, \
+        "the last stage gets what is left"
+    assert Deadline(0.0).timeout('tts') == 0.5, "upstream calls still get min_timeout after an overrun"
+    
+    app = load_offline_app()
+    
+    def audio():
+        # Unique audio, so the video cache never answers
+        return os.urandom(256)
+    
+    with fakes.StubDIDServer(render_seconds=0.1) as stub:
+        app.clients.inject('did', DIDClient(api_key='test', base_url=stub.url, max_retries=0))
+        
+        avatar = app.start_avatar_video(audio(), Deadline(5.0, split={'did': 1}))
+        assert avatar['status'] == 'processing' and avatar['talk_id'] in stub.talks, \
+            f"a talk is created within the budget ({avatar})"
+        app.talk_tracker.wait(avatar['talk_id'], timeout=5)
+        
+        avatar = app.start_avatar_video(audio(), Deadline(0.2, split={'did': 1}))
+        assert avatar['status'] == 'audio_only' and avatar['degraded'] == 'deadline', \
+            f"too little time left skips the avatar ({avatar})"
+        
+        stub.latency = 2.0
+        started = time.monotonic()
+        avatar = app.start_avatar_video(audio(), Deadline(1.5, split={'did': 1}))
+        assert avatar['status'] == 'audio_only' and avatar['degraded'] == 'avatar_error', \
+            f"a talk that cannot be created in time degrades to audio ({avatar})"
+        assert time.monotonic() - started < 1.9, "the create is cut off at the budget"
+        stub.latency = 0.0
+        
+        original = app.upstream_breakers['did']
+        breaker = app.upstream_breakers['did'] = CircuitBreaker('did', failure_threshold=1)
+        breaker.record(TimeoutError())
+        try:
+            talks = len(stub.talks)
+            avatar = app.start_avatar_video(audio(), Deadline(5.0, split={'did': 1}))
+            assert avatar['status'] == 'audio_only' and avatar['degraded'] == 'avatar_unavailable', \
+                f"an open breaker answers with audio only ({avatar})"
+            assert len(stub.talks) == talks, "no talk is created while the breaker is open"
+        finally:
+            app.upstream_breakers['did'] = original
+
+def test_admission_control():
+    """Test priority queueing, rate limits and 503 responses with Retry-After"""
+    import threading
+    import time
+    from upstream_limits import (Overloaded, PriorityGate, TokenBucket,
+                                 PRIORITY_ACTIVE_SESSION, PRIORITY_NORMAL)
+    
+    gate = PriorityGate('gemini', 1, max_queue=10, max_wait=5)
+    gate.acquire()
+    served = []
+    
+    def wait_for_slot(name, priority):
+        with gate.hold(priority):
+            served.append(name)
+    
+    waiters = []
+    for name, priority in (('new visitor', PRIORITY_NORMAL),
+                           ('active session', PRIORITY_ACTIVE_SESSION)):
+        waiters.append(threading.Thread(target=wait_for_slot, args=(name, priority)))
+        waiters[-1].start()
+        while gate.stats()['waiting'] < len(waiters):
+            time.sleep(0.01)
+    gate.release(0.1)
+    for thread in waiters:
+        thread.join(5)
+    assert served == ['active session', 'new visitor'], \
+        f"an active session jumps the queue ({served})"
+    
+    bucket = TokenBucket('tts', rate=1, burst=2)
+    assert bucket.reserve(0) == 0 and bucket.reserve(0) == 0, "a full bucket allows a burst"
+    try:
+        bucket.reserve(0.1)
+        shed = None
+    except Overloaded as e:
+        shed = e
+    assert shed is not None and shed.reason == 'wait_too_long' and shed.retry_after > 0, \
+        "a drained bucket sheds calls that cannot wait for the next token"
+    
+    app = load_offline_app()
+    original, app.admission_gate = app.admission_gate, PriorityGate(
+        'requests', 1, max_queue=0, max_wait=0.1
+    )
+    app.admission_gate.acquire()
+    try:
+        response = app.app.test_client().post('/api/chat', json={"message": "Hello"})
+        body = response.get_json()
+        response.close()
+        assert response.status_code == 503 and body['reason'] == 'queue_full', \
+            f"a request beyond the admission queue is shed ({response.status_code}, {body})"
+        assert int(response.headers.get('Retry-After', 0)) >= 1, "the 503 carries Retry-After"
+    finally:
+        app.admission_gate = original
+
+def test_talk_tracker():
+    """Test that the tracker backs off per talk and wakes waiters when a talk finishes"""
+    import threading
+    import time
+    from talk_tracker import TalkTracker
+    
+    checked = []
+    finished = []
+    callback_ran = threading.Event()
+    
+    def fetch_status(talk_id):
+        checked.append(time.monotonic())
+        if len(checked) < 4:
+            return {"status": "started"}
+        return {"status": "done", "result_url": f"https://example.com/{talk_id}.mp4"}
+    
+    def on_finished(job, context):
+        finished.append((job['status'], context))
+        callback_ran.set()
+    
+    tracker = TalkTracker(fetch_status, min_interval=0.05, max_interval=0.4,
+                          backoff=2, timeout=10, on_finished=on_finished)
+    try:
+        tracker.track('tlk_test', context='greeting')
+        job = tracker.wait('tlk_test', timeout=5)
+        callback_ran.wait(5)
+    finally:
+        tracker.stop()
+    
+    assert job and job['status'] == 'done' and \
+        job['result_url'] == "https://example.com/tlk_test.mp4", \
+        f"wait() returns the finished talk ({job})"
+    assert job['checks'] == 4, f"the talk is polled until it is done ({job['checks']} checks)"
+    gaps = [later - earlier for earlier, later in zip(checked, checked[1:])]
+    assert gaps[0] < gaps[-1] and gaps[-1] >= 0.3, \
+        f"the polling interval grows while the talk renders ({[round(gap, 2) for gap in gaps]})"
+    assert finished == [('done', 'greeting')], \
+        f"the completion callback runs once with the talk's context ({finished})"
+    assert tracker.wait('tlk_unknown', timeout=0.1) is None, "untracked talks return None"
+
+def test_tts_cache():
+    """Test that the TTS cache evicts least recently used audio and reloads from disk"""
+    import shutil
+    import tempfile
+    from tts_cache import TTSCache
+    
+    disk_dir = tempfile.mkdtemp(prefix='receptionist-test-')
+    try:
+        keys = [TTSCache.make_key(text, 'en-US', 'en-US-Neural2-F', {"encoding": "MP3"})
+                for text in ("Hello", "Welcome", "Goodbye")]
+        assert len(set(keys)) == 3, "different texts get different keys"
+        
+        cache = TTSCache(max_bytes=250, disk_dir=disk_dir)
+        cache.put(keys[0], b'a' * 100)
+        cache.put(keys[1], b'b' * 100)
+        assert cache.get(keys[0]) == b'a' * 100, "a stored clip is returned"
+        cache.put(keys[2], b'c' * 100)
+        assert keys[1] not in cache._entries and keys[0] in cache._entries, \
+            "the least recently used clip leaves the memory tier first"
+        
+        assert cache.get(keys[1]) == b'b' * 100, "an evicted clip is reloaded from disk"
+        stats = cache.stats()
+        assert stats['memory_hits'] == 1 and stats['disk_hits'] == 1 and stats['bytes'] <= 250, \
+            f"hits are counted per tier and memory stays in budget ({stats})"
+        
+        restarted = TTSCache(max_bytes=250, disk_dir=disk_dir)
+        calls = []
+        audio = restarted.get_or_synthesize(keys[2], lambda: calls.append(1) or b'new', characters=7)
+        assert audio == b'c' * 100 and not calls, "the disk tier survives a restart"
+        audio = restarted.get_or_synthesize('missing', lambda: calls.append(1) or b'new')
+        assert audio == b'new' and calls == [1] and restarted.get('missing') == b'new', \
+            "a miss synthesizes once and caches the result"
+        assert restarted.stats()['characters_saved'] == 7, "saved characters are counted"
+    finally:
+        shutil.rmtree(disk_dir, ignore_errors=True)
+
+def test_session_store():
+    """Test that idle sessions expire, active ones slide and history stays bounded"""
+    import time
+    from session_store import InMemorySessionStore
+    
+    store = InMemorySessionStore(max_sessions=2, ttl=0.2, max_turns=2, keep_first=2)
+    history = [{"role": "user", "parts": [f"message {n}"]} for n in range(10)]
+    store.save('visitor-1', history)
+    saved = store.load('visitor-1')['history']
+    assert saved[:2] == history[:2] and saved[2:] == history[-4:], \
+        f"history keeps the persona exchange and the last turns ({len(saved)} messages)"
+    
+    store.save('visitor-2', history[:2])
+    time.sleep(0.12)
+    assert store.load('visitor-1') is not None, "loading a session refreshes it"
+    time.sleep(0.12)
+    assert store.exists('visitor-1'), "a recently used session stays alive"
+    assert not store.exists('visitor-2'), "an idle session expires after the TTL"
+    assert store.purge_expired() == 1 and store.load('visitor-2') is None, \
+        "expired sessions are purged"
+    
+    store.save('visitor-3', [])
+    store.save('visitor-4', [])
+    stats = store.stats()
+    assert stats['sessions'] == 2 and stats['evicted'] == 1 and not store.exists('visitor-1'), \
+        f"the least recently used session is evicted past max_sessions ({stats})"
+
+def test_video_events():
+    """Test that /api/video-events streams a talk's status until it completes"""
+    import fakes
+    from did_client import DIDClient
+    
+    app = load_offline_app()
+    client = app.app.test_client()
+    
+    with fakes.StubDIDServer(render_seconds=0.2) as stub:
+        did = DIDClient(api_key='test', base_url=stub.url, max_retries=0)
+        app.clients.inject('did', did)
+        talk_id = did.create_talk({"script": {"type": "text", "input": "Hello"}})['id']
+        
+        response = client.get(f'/api/video-events/{talk_id}')
+        assert response.mimetype == 'text/event-stream', "the endpoint answers with an event stream"
+        events = sse_events(response)
+        assert [event['status'] for event in events] == ['processing', 'completed'], \
+            f"processing is pushed first, then the final status ({events})"
+        assert events[-1]['talk_id'] == talk_id and \
+            events[-1]['video_url'] == f"{stub.url}/results/{talk_id}.mp4", \
+            f"the completed event carries the video URL ({events[-1]})"
+        
+        polls = [path for method, path in stub.requests if path == f'/talks/{talk_id}']
+        events = sse_events(client.get(f'/api/video-events/{talk_id}'))
+        assert [event['status'] for event in events] == ['processing', 'completed'], \
+            f"a late subscriber gets the finished status ({events})"
+        assert len([path for method, path in stub.requests if path == f'/talks/{talk_id}']) == \
+            len(polls), "subscribers are answered from the tracker without polling D-ID"
+
+def test_faq_bank():
+    """Test that FAQ matching accepts close phrasings and rejects them below the threshold"""
+    import shutil
+    import tempfile
+    from faq_bank import FAQBank
+    
+    entries = [{
+        "id": "office_hours",
+        "questions": {"en-US": ["What are your office hours?"], "fi-FI": ["Milloin olette auki?"]},
+        "answers": {"en-US": "We're open 9 to 6.", "fi-FI": "Olemme auki 9–18."},
+    }]
+    media_dir = tempfile.mkdtemp(prefix='receptionist-test-')
+    try:
+        bank = FAQBank(entries, media_dir=media_dir, threshold=0.8)
+        match = bank.match("what are your OFFICE hours")
+        assert match and match['id'] == 'office_hours' and match['score'] == 1.0, \
+            f"case and punctuation do not matter ({match})"
+        match = bank.match("Milloin olette auki")
+        assert match and match['language'] == 'fi-FI' and match['answer'] == "Olemme auki 9–18.", \
+            f"the answer comes in the language of the question ({match})"
+        
+        match = bank.match("What are you're office hours")
+        assert match and match['id'] == 'office_hours' and 0.8 <= match['score'] < 1.0, \
+            f"a close phrasing matches above the threshold ({match})"
+        assert bank.match("Where can I park my car?") is None, "an unrelated question misses"
+        
+        strict = FAQBank(entries, media_dir=media_dir, threshold=0.95)
+        assert strict.match("What are you're office hours") is None, \
+            "the same phrasing misses under a stricter threshold"
+        stats = bank.stats()
+        assert stats['hits'] == 3 and stats['misses'] == 1, f"hits and misses are counted ({stats})"
+        assert bank.audio('office_hours', 'en-US') is None, "nothing is served before warm-up"
+    finally:
+        shutil.rmtree(media_dir, ignore_errors=True)
+
+def test_semantic_cache():
+    """Test that a rephrased question hits the reply cache and other questions miss"""
+    import time
+    from response_cache import SemanticCache
+    
+    cache = SemanticCache(threshold=0.9, ttl=0.3)
+    cache.put("When are you open?", "We're open 9 to 6.")
+    
+    assert cache.lookup("when are you open today") == "We're open 9 to 6.", \
+        "a rephrased question hits"
+    assert cache.lookup("Where is the nearest parking garage?") is None, \
+        "an unrelated question misses"
+    assert cache.lookup("When are you open?", language='fi') is None, \
+        "replies are not served across languages"
+    assert cache.lookup("When are you open?", cacheable=False) is None, \
+        "follow-up turns are never answered from the cache"
+    stats = cache.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 2 and stats['skipped_follow_ups'] == 1, \
+        f"hits, misses and skips are counted ({stats})"
+    
+    time.sleep(0.35)
+    assert cache.lookup("When are you open?") is None, "a reply expires after the TTL"
+
+def test_history_manager():
+    """Test that old turns fold into the summary and the prompt keeps to its token budget"""
+    from history_manager import SUMMARY_PREFIX, HistoryManager, estimate_tokens
+    
+    history = []
+    for n in range(5):
+        history.append({"role": "user", "parts": [f"Question {n}?"]})
+        history.append({"role": "model", "parts": [f"Answer {n}. " + "More detail. " * 20]})
+    
+    manager = HistoryManager(window_turns=2, summary_max_chars=1200, token_budget=0)
+    recent, summary = manager.compact(history)
+    assert recent == history[-4:], f"the last two exchanges stay verbatim ({len(recent)} messages)"
+    assert summary.splitlines() == [
+        f"- Visitor: Question {n}? / Receptionist: Answer {n}." for n in range(3)
+    ], f"older exchanges fold into one summary line each ({summary!r})"
+    assert manager.compact(recent, summary) == (recent, summary), \
+        "a history inside the window is left alone"
+    
+    messages, tokens = manager.build(recent, summary, message="Thanks!")
+    assert messages[0]['parts'][0] == SUMMARY_PREFIX + summary and messages[2:] == recent, \
+        "the summary is sent ahead of the window"
+    
+    latest = sum(estimate_tokens(m['parts'][0]) for m in recent[-2:])
+    budget = tokens - latest // 2
+    manager = HistoryManager(window_turns=2, token_budget=budget)
+    messages, trimmed_tokens = manager.build(recent, summary, message="Thanks!")
+    assert messages[2:] == recent[-2:] and trimmed_tokens <= budget, \
+        f"the oldest window exchange is left out to fit the budget ({trimmed_tokens} > {budget})"
+    assert manager.stats()['budget_trims'] == 1, "budget trims are counted"
+
+def test_voices_and_batch_tts():
+    """Test voice selection and that batch TTS renders every variant in request order"""
+    import uuid
+    
+    app = load_offline_app()
+    client = app.app.test_client()
+    
+    voices = client.get('/api/voices').get_json()
+    assert set(voices['voices']) == {'en-US', 'fi-FI', 'ar-XA'} and voices['default'] == 'en-US', \
+        f"the receptionist voice of each language is listed ({voices})"
+    assert app.voice_registry.get('fi').name == 'fi-FI-Standard-A', "language aliases resolve"
+    assert app.voice_registry.for_text("Hyvää päivää, miten voin auttaa?").language_code == 'fi-FI', \
+        "a reply is spoken in the language it is written in"
+    
+    text = f"Welcome to the office {uuid.uuid4().hex}"
+    response = client.post('/api/text-to-speech/batch', json={
+        "text": text,
+        "language_codes": ["en-US", "fi"],
+        "voice_names": ["en-US-Neural2-D"],
+    })
+    body = response.get_json()
+    assert response.status_code == 200, f"the batch succeeds ({body})"
+    assert [variant['voice_name'] for variant in body['variants']] == \
+        ['en-US-Neural2-F', 'fi-FI-Standard-A', 'en-US-Neural2-D'], \
+        f"variants come back in request order ({body['variants']})"
+    assert all('error' not in variant and variant['text'] == text for variant in body['variants']), \
+        "every variant is rendered"
+    assert 'tts;' in response.headers.get('Server-Timing', ''), \
+        "TTS time spent on the batch threads is reported for the request"
+    
+    response = client.post('/api/text-to-speech/batch', json={"text": text, "voice_names": ["nope"]})
+    assert response.status_code == 400, "an invalid voice name is rejected"
+
+def test_readiness():
+    """Test that /ready answers 503 until the client warm-up finishes, then 200"""
+    import threading
+    from clients import UpstreamClients
+    
+    app = load_offline_app()
+    client = app.app.test_client()
+    
+    built = []
+    connected = threading.Event()
+    manager = UpstreamClients(warmup=True)
+    manager.register('tts', lambda: built.append('tts') or object(),
+                     warm=lambda tts: connected.wait(5))
+    manager.register('analytics', lambda: 1 / 0, required=False)
+    
+    original = app.clients
+    app.clients = manager
+    try:
+        response = client.get('/ready')
+        assert response.status_code == 503 and not built, \
+            "the replica is not ready before the warm-up and builds nothing eagerly"
+        
+        thread = manager.warm_in_background(timeout=5)
+        response = client.get('/ready')
+        assert response.status_code == 503 and response.get_json()['warmup'] == 'running', \
+            f"the replica is not ready while clients connect ({response.get_json()})"
+        
+        connected.set()
+        thread.join(5)
+        response = client.get('/ready')
+        body = response.get_json()
+        assert response.status_code == 200 and body['ready'], f"the replica is ready after warm-up ({body})"
+        assert body['clients']['tts']['state'] == 'warm' and built == ['tts'], \
+            f"each client is built once and warmed ({body['clients']})"
+        assert body['clients']['analytics']['state'] == 'error', \
+            "an optional client that failed does not block readiness"
+        
+        manager.register('did', lambda: 1 / 0)
+        manager.warm(names=['did'], timeout=5)
+        assert client.get('/ready').status_code == 503, "a failed required client blocks readiness"
+        assert client.get('/health').status_code == 200, "liveness does not depend on the warm-up"
+    finally:
+        app.clients = original
+
+def test_audio_http_caching():
+    """Test that stored clips are served with a strong ETag, 304 revalidation and Range"""
+    app = load_offline_app()
+    client = app.app.test_client()
+    
+    audio = b'ID3' + os.urandom(1024)
+    audio_id = app.audio_store.put(audio)
+    url = app.audio_store.url_for(audio_id)
+    try:
+        response = client.get(url)
+        assert response.status_code == 200 and response.data == audio and \
+            response.mimetype == 'audio/mpeg', "the clip is served as binary MP3"
+        assert response.headers.get('ETag') == f'"{audio_id}"', \
+            f"the clip id is its strong ETag ({response.headers.get('ETag')})"
+        assert response.cache_control.immutable and response.cache_control.max_age >= 86400, \
+            f"clips are cacheable and immutable ({response.headers.get('Cache-Control')})"
+        assert response.headers.get('Accept-Ranges') == 'bytes', "seeking is advertised"
+        response.close()
+        
+        response = client.get(url, headers={'If-None-Match': f'"{audio_id}"'})
+        assert response.status_code == 304 and not response.data, "a cached copy is revalidated with a 304"
+        response.close()
+        
+        response = client.get(url, headers={'Range': 'bytes=0-9'})
+        assert response.status_code == 206 and response.data == audio[:10], \
+            f"a Range request gets only those bytes ({response.status_code})"
+        assert response.headers.get('Content-Range') == f"bytes 0-9/{len(audio)}", \
+            f"the partial response says where it belongs ({response.headers.get('Content-Range')})"
+        response.close()
+        
+        assert client.get('/api/audio/not-a-clip.mp3').status_code == 404, "unknown clips are 404"
+    finally:
+        os.remove(app.audio_store.path_for(audio_id))
+
+def test_concurrent_session_turns():
+    """Test that two requests answering turns of one session both keep their turn"""
+    import threading
+    import uuid
+    import fakes
+    
+    app = load_offline_app()
+    app.clients.inject('gemini', fakes.FakeGenerativeModel(
+        reply=lambda message: f"Answer to {message}", latency=0.2
+    ))
+    
+    session_id = str(uuid.uuid4())
+    threads = [
+        threading.Thread(target=app.ask_gemini, args=(session_id, question))
+        for question in ("Where do I park?", "Is there Wi-Fi?")
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    
+    history = app.session_store.load(session_id)['history']
+    questions = sorted(message['parts'][0] for message in history if message['role'] == 'user')
+    assert questions == ["Is there Wi-Fi?", "Where do I park?"], \
+        f"neither concurrent turn overwrites the other ({history})"
+    assert all(history[i + 1]['parts'][0] == f"Answer to {history[i]['parts'][0]}"
+               for i in range(0, len(history), 2)), "each question stays next to its answer"
+    
+    app.record_turn(session_id, "Thanks!", "You're welcome!")
+    assert len(app.session_store.load(session_id)['history']) == 6, \
+        "turns answered without Gemini are appended too"
 
 def main():
     """Run all tests"""
@@ -119,26 +1217,70 @@ def main():
         ("Directories", test_directories),
     ]
     
+    # Offline checks of the pipeline modules (fakes and stub servers, no API keys)
+    offline = [
+
+        ("Audio Preprocessing", test_audio_preprocessing),
+        ("Audio Store", test_audio_store),
+        ("Avatar Streams", test_avatar_streams),
+        ("Batch Job Lock", test_batch_job_lock),
+        ("Batch Job Retry", test_batch_job_retry),
+        ("Video Cache", test_video_cache),
+        ("Single Flight", test_single_flight),
+        ("Circuit Breaker", test_circuit_breaker),
+        ("Deadlines", test_deadlines),
+        ("Streaming Speech-to-Text", test_stt_stream),
+        ("Admission Control", test_admission_control),
+        ("Pipelined Priority", test_pipelined_priority),
+        ("Pipelined Server-Timing", test_pipelined_server_timing),
+        ("D-ID Client Retries", test_did_client_retries),
+        ("Talk Tracker", test_talk_tracker),
+        ("TTS Cache", test_tts_cache),
+        ("Session Store", test_session_store),
+        ("Video Events", test_video_events),
+        ("FAQ Bank", test_faq_bank),
+        ("Semantic Cache", test_semantic_cache),
+        ("History Manager", test_history_manager),
+        ("Voices and Batch TTS", test_voices_and_batch_tts),
+        ("Readiness", test_readiness),
+        ("Audio HTTP Caching", test_audio_http_caching),
+        ("Concurrent Session Turns", test_concurrent_session_turns),
+        ("Complete Flow", test_complete_flow),
+    ]
+    tests += offline
+    
     # Run basic tests first
     results = []
     for name, test_func in tests:
         print(f"\n{name}:")
         print("-" * 40)
-        result = test_func()
+        try:
+            test_func()
+            result = True
+            if (name, test_func) in offline:
+                print("✓ Passed")
+        except AssertionError as e:
+            print(f"✗ {e}")
+            result = False
+        except ImportError as e:
+            print(f"⚠️  Skipped, missing dependency: {e}")
+            result = False
         results.append(result)
     
     # Test imports (requires dependencies installed)
-    print(f"\nPython Imports:")
+    print("\nPython Imports:")
     print("-" * 40)
     try:
-        import_result = test_imports()
-        results.append(import_result)
+        test_imports()
+        results.append(True)
+    except AssertionError:
+        results.append(False)
     except Exception as e:
         print(f"⚠️  Could not test imports: {e}")
         print("   Run: pip install -r requirements.txt")
     
     # Test env file
-    print(f"\nEnvironment Configuration:")
+    print("\nEnvironment Configuration:")
     print("-" * 40)
     test_env_file()
     
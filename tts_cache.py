@@ -0,0 +1,227 @@
+"""
+Text-to-Speech Audio Cache
+==========================
+Content-addressed cache for synthesized speech.
+
+Receptionists repeat the same sentences all day, so identical synthesis
+requests (same text, voice and audio settings) are served from:
+1. An in-memory LRU tier bounded by total bytes
+2. An optional on-disk tier (survives restarts)
+
+Hit/miss counters and an estimate of the upstream time and characters
+saved are exposed through ``stats()``.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTSCache:
+    """
+    Two-tier (memory + disk) cache of synthesized audio.
+
+    Args:
+        max_bytes: maximum total size of the in-memory tier
+        disk_dir: directory for the on-disk tier (None disables it)
+        disk_max_bytes: maximum total size of the on-disk tier
+        extension: file extension used for on-disk entries
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, disk_dir=None,
+                 disk_max_bytes=512 * 1024 * 1024, extension='mp3'):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.extension = extension
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.characters_saved = 0
+        self._upstream_seconds = 0.0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = sum(
+                entry.stat().st_size for entry in os.scandir(self.disk_dir)
+                if entry.is_file() and entry.name.endswith('.' + self.extension)
+            )
+
+    @staticmethod
+    def make_key(text, language_code, voice_name, audio_config):
+        """
+        Build the cache key for a synthesis request.
+
+        ``audio_config`` may be any JSON-serializable description of the
+        output settings (encoding, speaking rate, pitch, ...).
+        """
+        raw = json.dumps(
+            [text, language_code, voice_name, audio_config],
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    # ------------------------------------------------------------------
+    # Lookup / store
+    # ------------------------------------------------------------------
+
+    def get(self, key):
+        """Return cached audio bytes for ``key``, or None"""
+        with self._lock:
+            audio = self._entries.get(key)
+            if audio is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return audio
+
+        audio = self._read_disk(key)
+        with self._lock:
+            if audio is not None:
+                self.disk_hits += 1
+                self._store_memory(key, audio)
+            else:
+                self.misses += 1
+        return audio
+
+    def put(self, key, audio):
+        """Store audio bytes under ``key`` in both tiers"""
+        with self._lock:
+            self._store_memory(key, audio)
+        self._write_disk(key, audio)
+
+    def get_or_synthesize(self, key, synthesize, characters=0):
+        """
+        Return cached audio, or call ``synthesize()`` and cache its result.
+
+        Args:
+            key: cache key from ``make_key``
+            synthesize: callable returning the audio bytes on a miss
+            characters: billed characters of the request (for stats)
+        """
+        audio = self.get(key)
+        if audio is not None:
+            with self._lock:
+                self.characters_saved += characters
+            return audio
+
+        started = time.perf_counter()
+        audio = synthesize()
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self._upstream_seconds += elapsed
+        self.put(key, audio)
+        return audio
+
+    def path_for(self, key):
+        """On-disk path of an entry (None when the disk tier is disabled)"""
+        if not self.disk_dir:
+            return None
+        return os.path.join(self.disk_dir, f"{key}.{self.extension}")
+
+    def stats(self):
+        """Hit/miss counters and estimated savings"""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            avg_upstream = (
+                self._upstream_seconds / self.misses if self.misses else 0.0
+            )
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk_bytes": self._disk_bytes if self.disk_dir else None,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+                "characters_saved": self.characters_saved,
+                "avg_upstream_seconds": round(avg_upstream, 4),
+                "estimated_seconds_saved": round(hits * avg_upstream, 2),
+            }
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _store_memory(self, key, audio):
+        """Insert into the LRU tier and evict by size (caller holds lock)"""
+        if len(audio) > self.max_bytes:
+            return
+
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous)
+
+        self._entries[key] = audio
+        self._bytes += len(audio)
+
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def _read_disk(self, key):
+        path = self.path_for(key)
+        if not path:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                audio = f.read()
+            os.utime(path)  # Keep recently used files away from eviction
+            return audio
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            print(f"Error reading TTS cache entry {key}: {str(e)}")
+            return None
+
+    def _write_disk(self, key, audio):
+        path = self.path_for(key)
+        if not path or os.path.exists(path):
+            return
+        try:
+            # Write to a temp file first so readers never see partial audio
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self._disk_bytes += len(audio)
+                over_budget = self._disk_bytes > self.disk_max_bytes
+            if over_budget:
+                self._evict_disk()
+        except OSError as e:
+            print(f"Error writing TTS cache entry {key}: {str(e)}")
+
+    def _evict_disk(self):
+        """Remove least recently used files until under the disk budget"""
+        suffix = '.' + self.extension
+        files = [
+            entry for entry in os.scandir(self.disk_dir)
+            if entry.is_file() and entry.name.endswith(suffix)
+        ]
+        files.sort(key=lambda entry: entry.stat().st_mtime)
+
+        total = sum(entry.stat().st_size for entry in files)
+        for entry in files:
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                total -= size
+            except OSError:
+                continue
+
+        with self._lock:
+            self._disk_bytes = total
@@ -0,0 +1,351 @@
+"""
+Upstream Limits and Admission Control
+=====================================
+Caps the number of simultaneous calls to each external API, paces them to
+a rate, and sheds load that cannot be served in time.
+
+With a cooperative server (gevent workers) one process can hold hundreds
+of requests open at once; these limits keep that fan-out from overrunning
+the quota of any single upstream (Speech-to-Text, Gemini, TTS, D-ID):
+
+- ``TokenBucket``: calls per second with a burst allowance, so a lobby rush
+  is spread out instead of answered with upstream 429s.
+- ``PriorityGate``: a concurrency limit with a bounded wait queue. Waiters
+  are served by priority (visitors already in a conversation first), then
+  in arrival order; when the queue is full, a higher-priority arrival
+  takes the place of the newest lower-priority waiter.
+- ``Overloaded``: raised instead of waiting when the queue is full, or when
+  the wait would exceed ``max_wait``. The web layer turns it into a 503
+  with Retry-After, so excess requests fail fast rather than pile up as
+  blocked workers.
+- Circuit breakers (circuit_breaker.py), when configured, refuse calls to
+  an upstream that keeps failing until it has had time to recover.
+
+The same gate guards whole requests at the front door (see app.py).
+
+Usage:
+    with upstream_limits.slot('tts'):
+        tts_client.synthesize_speech(...)
+"""
+
+import contextvars
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Wait-queue priorities (lower is served first)
+PRIORITY_ACTIVE_SESSION = 0
+PRIORITY_NORMAL = 1
+
+_priority = contextvars.ContextVar('upstream_priority', default=PRIORITY_NORMAL)
+
+
+def set_priority(level):
+    """Priority of upstream calls made by the current request (or greenlet)"""
+    _priority.set(level)
+
+
+def current_priority():
+    return _priority.get()
+
+
+class Overloaded(Exception):
+    """
+    A call or request was shed by a limit
+
+    Attributes:
+        name: the upstream or gate that was full
+        retry_after: suggested seconds before retrying
+        reason: 'queue_full', 'displaced', 'wait_too_long', 'timeout' (or
+            'circuit_open', 'pool_full' from circuit_breaker.py, did_streams.py)
+    """
+
+    def __init__(self, name, retry_after, reason):
+        super().__init__(f"{name} is over capacity ({reason}), retry in {retry_after:g}s")
+        self.name = name
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBucket:
+    """
+    Rate limit: ``rate`` calls per second on average, up to ``burst`` at once.
+
+    A call that finds the bucket empty reserves the next token (the level
+    goes negative) and sleeps until it is due, so waiters are paced rather
+    than released together.
+    """
+
+    def __init__(self, name, rate, burst=None):
+        self.name = name
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, self.rate))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.throttled = 0
+        self.rejected = 0
+
+    def reserve(self, max_wait):
+        """
+        Take a token, reserving a future one if none is left
+
+        Returns: seconds to sleep before the call may proceed
+        Raises: Overloaded if that would take longer than ``max_wait``
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait > max_wait:
+                self.rejected += 1
+                raise Overloaded(self.name, round(wait, 1), 'wait_too_long')
+            self._tokens -= 1
+            if wait > 0:
+                self.throttled += 1
+            return wait
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "throttled": self.throttled,
+                "rejected": self.rejected,
+            }
+
+
+class PriorityGate:
+    """
+    Concurrency limit with a bounded, prioritized wait queue.
+
+    Args:
+        name: reported in errors and stats
+        limit: max holders at once
+        max_queue: max waiters; further callers are rejected at once
+        max_wait: longest a caller may wait for its turn (seconds)
+    """
+
+    def __init__(self, name, limit, max_queue=100, max_wait=10.0):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._in_use = 0
+        self._waiters = []   # heap of (priority, seq)
+        self._displaced = set()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._avg_hold = None
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def retry_after(self, position=None):
+        """Estimated seconds until a slot frees up for a new waiter"""
+        position = len(self._waiters) if position is None else position
+        hold = self._avg_hold or 1.0
+        return max(1, math.ceil(hold * (position + 1) / self.limit))
+
+    def acquire(self, priority=PRIORITY_NORMAL, max_wait=None):
+        """Wait for a slot; raises Overloaded instead of waiting too long"""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        with self._cond:
+            if self._in_use < self.limit and not self._waiters:
+                self._in_use += 1
+                self.admitted += 1
+                return
+
+            ahead = sum(1 for waiter in self._waiters if waiter[0] <= priority)
+            if self._avg_hold is not None and \
+                    self._avg_hold * (ahead + 1) / self.limit > max_wait:
+                # The queue ahead cannot drain in time; fail now, not later
+                self.rejected += 1
+                raise Overloaded(self.name, self.retry_after(ahead), 'wait_too_long')
+            if len(self._waiters) >= self.max_queue:
+                newest = max(self._waiters) if self._waiters else None
+                if newest is None or newest[0] <= priority:
+                    self.rejected += 1
+                    raise Overloaded(self.name, self.retry_after(), 'queue_full')
+                # Make room: the newest lower-priority waiter is turned away
+                self._waiters.remove(newest)
+                heapq.heapify(self._waiters)
+                self._displaced.add(newest)
+                self._cond.notify_all()
+
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiters, entry)
+            self.queued += 1
+            deadline = time.monotonic() + max_wait
+            while not (self._waiters and self._waiters[0] == entry and
+                       self._in_use < self.limit):
+                if entry in self._displaced:
+                    self._displaced.discard(entry)
+                    self.rejected += 1
+                    raise Overloaded(self.name, self.retry_after(), 'displaced')
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    self.timed_out += 1
+                    self._cond.notify_all()
+                    raise Overloaded(self.name, self.retry_after(), 'timeout')
+                self._cond.wait(remaining)
+            heapq.heappop(self._waiters)
+            self._in_use += 1
+            self.admitted += 1
+            self._cond.notify_all()
+
+    def release(self, held_seconds=None):
+        with self._cond:
+            self._in_use -= 1
+            if held_seconds is not None:
+                self._avg_hold = held_seconds if self._avg_hold is None else \
+                    0.8 * self._avg_hold + 0.2 * held_seconds
+            self._cond.notify_all()
+
+    @contextmanager
+    def hold(self, priority=PRIORITY_NORMAL):
+        self.acquire(priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "in_use": self._in_use,
+                "waiting": len(self._waiters),
+                "max_queue": self.max_queue,
+                "max_wait": self.max_wait,
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "avg_hold_seconds": round(self._avg_hold, 3) if self._avg_hold else None,
+            }
+
+
+class UpstreamLimits:
+    """
+    Per-upstream concurrency gates and rate limits.
+
+    Args:
+        limits: dict of upstream name -> max concurrent calls
+            (0 or missing means unlimited)
+        rates: dict of upstream name -> calls per second (0 = unlimited)
+        bursts: dict of upstream name -> burst size (default: the rate)
+        max_queue: calls allowed to wait per upstream before shedding
+        max_wait: longest a call may wait for a slot or token (seconds)
+        breakers: optional dict of upstream name -> CircuitBreaker
+            (see circuit_breaker.py), checked before and fed after each call
+    """
+
+    def __init__(self, limits, rates=None, bursts=None, max_queue=100, max_wait=10.0,
+                 breakers=None):
+        self.limits = {name: int(limit) for name, limit in limits.items()}
+        rates = {name: float(rate) for name, rate in (rates or {}).items()}
+        bursts = bursts or {}
+        self.max_wait = max_wait
+        self._gates = {
+            name: PriorityGate(name, limit, max_queue, max_wait)
+            for name, limit in self.limits.items() if limit > 0
+        }
+        self._buckets = {
+            name: TokenBucket(name, rate, float(bursts.get(name) or 0) or None)
+            for name, rate in rates.items() if rate > 0
+        }
+        self.breakers = breakers or {}
+        self._in_flight = {name: 0 for name in self.limits}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, names, environ, default=0, breakers=None):
+        """
+        Read ``UPSTREAM_CONCURRENCY_<NAME>``, ``UPSTREAM_RATE_<NAME>`` and
+        ``UPSTREAM_BURST_<NAME>`` for each upstream name, plus
+        ``UPSTREAM_MAX_QUEUE`` and ``UPSTREAM_MAX_WAIT``
+        """
+        return cls(
+            {name: environ.get(f"UPSTREAM_CONCURRENCY_{name.upper()}", default)
+             for name in names},
+            rates={name: environ.get(f"UPSTREAM_RATE_{name.upper()}", 0) for name in names},
+            bursts={name: environ.get(f"UPSTREAM_BURST_{name.upper()}", 0) for name in names},
+            max_queue=int(environ.get('UPSTREAM_MAX_QUEUE', 100)),
+            max_wait=float(environ.get('UPSTREAM_MAX_WAIT', 10)),
+            breakers=breakers,
+        )
+
+    @contextmanager
+    def slot(self, name):
+        """
+        Hold one concurrency slot of ``name`` for the duration of a call,
+        after waiting for its rate limit
+
+        Raises: Overloaded when the call cannot start within ``max_wait``
+            (CircuitOpen while the upstream's breaker is open)
+        """
+        breaker = self.breakers.get(name)
+        if breaker is not None:
+            breaker.check()
+
+        bucket = self._buckets.get(name)
+        gate = self._gates.get(name)
+        try:
+            waited = bucket.reserve(self.max_wait) if bucket is not None else 0.0
+            if waited:
+                time.sleep(waited)
+            if gate is not None:
+                gate.acquire(current_priority(), max_wait=max(0.0, self.max_wait - waited))
+        except Overloaded as e:
+            if breaker is not None:
+                breaker.record(e)
+            raise
+        started = time.monotonic()
+        with self._lock:
+            self._in_flight[name] = self._in_flight.get(name, 0) + 1
+        try:
+            yield
+        except Exception as e:
+            if breaker is not None:
+                breaker.record(e)
+            raise
+        else:
+            if breaker is not None:
+                breaker.record()
+        finally:
+            with self._lock:
+                self._in_flight[name] -= 1
+            if gate is not None:
+                gate.release(time.monotonic() - started)
+
+    def circuit_open(self, name):
+        """Whether calls to ``name`` are currently refused by its breaker"""
+        breaker = self.breakers.get(name)
+        return breaker is not None and breaker.is_open()
+
+    def stats(self):
+        """In-flight calls, configured limits and shed calls per upstream"""
+        with self._lock:
+            in_flight = dict(self._in_flight)
+        stats = {}
+        for name in self.limits:
+            gate = self._gates.get(name)
+            bucket = self._buckets.get(name)
+            stats[name] = {
+                "in_flight": in_flight.get(name, 0),
+                "limit": self.limits.get(name) or None,
+                "gate": gate.stats() if gate else None,
+                "rate": bucket.stats() if bucket else None,
+                "breaker": self.breakers[name].stats() if name in self.breakers else None,
+            }
+        return stats
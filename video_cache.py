@@ -0,0 +1,236 @@
+"""
+Avatar Video Cache
+==================
+Persistent mapping from (audio digest, presenter image, D-ID config) to a
+finished avatar video.
+
+Identical TTS audio produces an identical ``/talks`` payload, so a rendered
+clip can be reused instead of paying D-ID credits and 10-40 seconds to
+render it again. Entries point either at D-ID's ``result_url`` or, when a
+downloader is configured, at a local MP4 copy under ``static/video``.
+Entries expire after a TTL (remote URLs sooner: D-ID's signed links
+expire) and the cache is bounded by entry count and local file size.
+Several server processes can share the index; each merges the entries
+the others wrote before saving.
+"""
+
+import calendar
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+
+class VideoCache:
+    """
+    Disk-persisted cache of completed avatar videos.
+
+    Args:
+        index_path: JSON file the mapping is persisted to
+        video_dir: directory for local MP4 copies
+        url_prefix: public URL prefix under which ``video_dir`` is served
+        ttl: seconds an entry stays valid
+        remote_ttl: seconds an entry without a local copy stays valid
+            (shortened further when the URL carries its own expiry)
+        max_entries: maximum number of cached videos
+        max_bytes: maximum total size of local MP4 copies
+        download: optional callable(url, path) that stores a local copy of
+            a finished video; when None only the remote URL is cached
+    """
+
+    def __init__(self, index_path, video_dir, url_prefix='/video',
+                 ttl=24 * 3600, remote_ttl=3600, max_entries=500,
+                 max_bytes=1024 * 1024 * 1024, download=None):
+        self.index_path = index_path
+        self.video_dir = video_dir
+        self.url_prefix = url_prefix.rstrip('/')
+        self.ttl = ttl
+        self.remote_ttl = remote_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.download = download
+
+        self._entries = {}
+        self._removed = set()   # keys dropped since the last save
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+        os.makedirs(self.video_dir, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def audio_digest(audio_bytes):
+        """Content digest of the audio sent to D-ID"""
+        return hashlib.sha256(audio_bytes).hexdigest()
+
+    @staticmethod
+    def make_key(audio_digest, source_url, config):
+        """Cache key for a talk: audio digest + presenter + D-ID config"""
+        raw = json.dumps([audio_digest, source_url, config], sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    # ------------------------------------------------------------------
+    # Lookup / store
+    # ------------------------------------------------------------------
+
+    def lookup(self, key):
+        """Return the cached entry for ``key`` (with ``video_url``) or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._is_valid(entry, time.time()):
+                self._remove(key)
+                self._save()
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            entry['last_used'] = time.time()
+            return dict(entry)
+
+    def store(self, key, result_url, talk_id=None):
+        """
+        Record a finished talk. Downloads a local copy first when a
+        downloader is configured (falls back to the remote URL on failure).
+        """
+        local_path = None
+        size = 0
+        if self.download:
+            local_path = os.path.join(self.video_dir, f"{key}.mp4")
+            try:
+                self.download(result_url, local_path)
+                size = os.path.getsize(local_path)
+            except Exception as e:
+                print(f"Error downloading avatar video {talk_id}: {str(e)}")
+                local_path = None
+
+        now = time.time()
+        entry = {
+            "talk_id": talk_id,
+            "result_url": result_url,
+            "local_file": os.path.basename(local_path) if local_path else None,
+            "size": size,
+            "video_url": (
+                f"{self.url_prefix}/{os.path.basename(local_path)}"
+                if local_path else result_url
+            ),
+            "created_at": now,
+            "last_used": now,
+            "expires_at": None if local_path else self._remote_expiry(result_url, now),
+        }
+
+        with self._lock:
+            self._entries[key] = entry
+            self._removed.discard(key)
+            self.stores += 1
+            self._evict(now)
+            self._save()
+        return dict(entry)
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "local_bytes": self._local_bytes(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    # ------------------------------------------------------------------
+    # Internals (caller holds the lock)
+    # ------------------------------------------------------------------
+
+    def _is_valid(self, entry, now):
+        if now - entry['created_at'] > self.ttl:
+            return False
+        if entry.get('local_file'):
+            return os.path.exists(os.path.join(self.video_dir, entry['local_file']))
+        expires_at = entry.get('expires_at') or entry['created_at'] + self.remote_ttl
+        return now < expires_at
+
+    def _remote_expiry(self, url, now):
+        """
+        When a remote URL stops working: ``remote_ttl`` from now, or earlier
+        if it is a signed URL (``Expires=<epoch>`` or ``X-Amz-Date`` +
+        ``X-Amz-Expires``) that expires first. A minute is kept in hand so
+        the kiosk does not start loading a link about to expire.
+        """
+        expires_at = now + self.remote_ttl
+        query = {name.lower(): values[0] for name, values in parse_qs(urlparse(url).query).items()}
+        try:
+            if 'expires' in query:
+                expires_at = min(expires_at, float(query['expires']) - 60)
+            elif 'x-amz-date' in query and 'x-amz-expires' in query:
+                signed = calendar.timegm(time.strptime(query['x-amz-date'], '%Y%m%dT%H%M%SZ'))
+                expires_at = min(expires_at, signed + float(query['x-amz-expires']) - 60)
+        except ValueError:
+            pass
+        return expires_at
+
+    def _local_bytes(self):
+        return sum(entry.get('size', 0) for entry in self._entries.values())
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        self._removed.add(key)
+        if entry and entry.get('local_file'):
+            try:
+                os.remove(os.path.join(self.video_dir, entry['local_file']))
+            except OSError:
+                pass
+
+    def _evict(self, now):
+        """Drop expired entries, then least recently used over the limits"""
+        for key in [k for k, e in self._entries.items() if not self._is_valid(e, now)]:
+            self._remove(key)
+
+        by_age = sorted(self._entries, key=lambda k: self._entries[k]['last_used'])
+        local_bytes = self._local_bytes()
+        while by_age and (len(self._entries) > self.max_entries
+                          or local_bytes > self.max_bytes):
+            key = by_age.pop(0)
+            local_bytes -= self._entries[key].get('size', 0)
+            self._remove(key)
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Error loading video cache index: {str(e)}")
+            return {}
+
+    def _load(self):
+        with self._lock:
+            self._entries = self._read_index()
+            self._evict(time.time())
+
+    def _save(self):
+        # Keep what other processes stored since we last read the index,
+        # except entries this process dropped
+        for key, entry in self._read_index().items():
+            if key not in self._entries and key not in self._removed:
+                self._entries[key] = entry
+        self._evict(time.time())
+        self._removed.clear()
+
+        tmp_path = f"{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"Error saving video cache index: {str(e)}")
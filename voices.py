@@ -0,0 +1,161 @@
+"""
+Receptionist Voice Registry
+===========================
+Text-to-Speech voice and audio settings, built once.
+
+Each supported language (en-US, fi-FI, ar-XA) has one receptionist voice.
+Its ``VoiceSelectionParams``, ``AudioConfig`` and the serialized config
+used in TTS cache keys are created once, on first use, and reused for
+every request. The registry also picks the voice for a reply from
+the reply's own text, so a Finnish or Arabic answer is spoken by the
+Finnish or Arabic voice.
+
+Other Google voices can be requested by name (e.g. ``en-US-Neural2-D``);
+they are built on first use and kept.
+"""
+
+import re
+import threading
+
+from clients import LazyModule
+from response_cache import guess_language
+
+texttospeech = LazyModule('google.cloud.texttospeech')
+
+
+# Receptionist voice per language: code -> (TTS language code, voice name)
+DEFAULT_VOICES = {
+    'en-US': ('en-US', 'en-US-Neural2-F'),
+    'fi-FI': ('fi-FI', 'fi-FI-Standard-A'),
+    'ar-XA': ('ar-XA', 'ar-XA-Standard-A'),
+}
+
+# Other ways clients and the recognizer name the same languages
+LANGUAGE_ALIASES = {
+    'en': 'en-US',
+    'fi': 'fi-FI',
+    'ar': 'ar-XA',
+    'ar-SA': 'ar-XA',
+}
+
+# Google voice names: <language>-<REGION>-<type>-<letter>
+VOICE_NAME_PATTERN = re.compile(r'^([a-z]{2,3}-[A-Z]{2})-[A-Za-z0-9]+-[A-Z]$')
+
+
+class Voice:
+    """Prebuilt synthesis settings for one voice"""
+
+    def __init__(self, language_code, name, audio_config, gender=None):
+        self.language_code = language_code
+        self.name = name
+        self.params = texttospeech.VoiceSelectionParams(
+            language_code=language_code,
+            name=name,
+            ssml_gender=gender or texttospeech.SsmlVoiceGender.SSML_VOICE_GENDER_UNSPECIFIED
+        )
+        self.audio_config = audio_config
+        # Part of the TTS cache key; serialized once instead of per request
+        self.config_key = texttospeech.AudioConfig.to_json(
+            audio_config, sort_keys=True, indent=None
+        )
+
+    def to_dict(self):
+        return {"language_code": self.language_code, "voice_name": self.name}
+
+
+class VoiceRegistry:
+    """
+    Voices by language, plus on-demand voices by name.
+
+    Args:
+        voices: dict of language code -> (TTS language code, voice name)
+        default: language used when nothing else matches
+        speaking_rate, pitch: audio settings shared by all voices
+        max_named: named (non-default) voices kept after first use
+    """
+
+    def __init__(self, voices=None, default='en-US', speaking_rate=1.0, pitch=0.0,
+                 max_named=32):
+        self.specs = voices or DEFAULT_VOICES
+        self.default = default
+        self.speaking_rate = speaking_rate
+        self.pitch = pitch
+        self.max_named = max_named
+        self.audio_config = None
+        self._voices = None
+        self._named = {}
+        self._lock = threading.Lock()
+
+    def _build(self):
+        """Create the voice objects (first use; imports the TTS SDK)"""
+        with self._lock:
+            if self._voices is None:
+                self.audio_config = texttospeech.AudioConfig(
+                    audio_encoding=texttospeech.AudioEncoding.MP3,
+                    speaking_rate=self.speaking_rate,
+                    pitch=self.pitch
+                )
+                voices = {
+                    language: Voice(tts_language, name, self.audio_config,
+                                    texttospeech.SsmlVoiceGender.FEMALE)
+                    for language, (tts_language, name) in self.specs.items()
+                }
+                self._named = {voice.name: voice for voice in voices.values()}
+                self._voices = voices
+        return self._voices
+
+    def resolve(self, language_code):
+        """
+        Registry language for a client or recognizer code ('fi', 'fi-fi',
+        'ar-SA', ...), or None if the language is not supported
+        """
+        if not language_code:
+            return None
+        for code in self.specs:
+            if code.lower() == language_code.lower():
+                return code
+        for alias, code in LANGUAGE_ALIASES.items():
+            if alias.lower() == language_code.lower():
+                return code
+        return LANGUAGE_ALIASES.get(language_code[:2].lower())
+
+    def get(self, language_code=None):
+        """Receptionist voice for a language (the default voice if unsupported)"""
+        voices = self._voices or self._build()
+        return voices.get(self.resolve(language_code), voices[self.default])
+
+    def named(self, voice_name):
+        """
+        Voice by Google voice name, built on first use
+
+        Raises: ValueError if ``voice_name`` is not a voice name
+        """
+        match = VOICE_NAME_PATTERN.match(voice_name or '')
+        if not match:
+            raise ValueError(f"Invalid voice name: {voice_name}")
+        voices = self._voices or self._build()
+        with self._lock:
+            voice = self._named.get(voice_name)
+            if voice is None:
+                voice = Voice(match.group(1), voice_name, self.audio_config)
+                if len(self._named) < len(voices) + self.max_named:
+                    self._named[voice_name] = voice
+            return voice
+
+    def detect(self, text):
+        """Registry language a text is written in, or None if it can't tell"""
+        language = guess_language(text or '', default=None)
+        return self.resolve(language)
+
+    def for_text(self, text, hint=None):
+        """
+        Voice to speak ``text`` with: the language the text is written in,
+        else ``hint`` (e.g. the language the visitor spoke), else the default
+        """
+        return self.get(self.detect(text) or hint)
+
+    def languages(self):
+        return {
+            language: {"language_code": tts_language, "voice_name": name}
+            for language, (tts_language, name) in self.specs.items()
+        }
@@ -0,0 +1,28 @@
+"""
+Production WSGI Entry Point
+===========================
+Used by gunicorn (see gunicorn.conf.py):
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+With gevent workers the standard library is monkey-patched before this
+module is imported, so blocking ``requests`` calls to D-ID yield to other
+requests. gRPC (Speech-to-Text, Text-to-Speech, Gemini) has to be told
+about gevent separately, before any client channel is created.
+"""
+
+import sys
+
+
+def _init_grpc_for_gevent():
+    if 'gevent' not in sys.modules:
+        return
+    from gevent import monkey
+    if monkey.is_module_patched('socket'):
+        from grpc.experimental import gevent as grpc_gevent
+        grpc_gevent.init_gevent()
+
+
+_init_grpc_for_gevent()
+
+from app import app  # noqa: E402  (must follow the gRPC/gevent setup)